@@ -0,0 +1,94 @@
+"""
+Benchmark of the EPTS/FIFA (FCB) tracking reader, Tracking_IO.read_FCB_data, on a synthetic tracking file that
+follows the parts of notebooks/MetadataFifaFormat.xml.
+
+    python fcb_reader.py --frames 3000 --baseline 707db1f
+    python fcb_reader.py --frames 144442
+
+With --baseline, read_FCB_data of that git revision is timed on the same file and its values compared to the
+current reader (the baseline reader is slow: a few seconds for 3,000 frames).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(REPO, 'source'))
+
+import Tracking_IO as io
+
+METADATA_PATH = os.path.join(REPO, 'notebooks', 'MetadataFifaFormat.xml')
+
+
+def generate_tracking_file(path, n_frames, seed=1):
+    """
+    Writes n_frames of random tracking lines (frame:player;player;...:ball:extra) following the
+    DataFormatSpecification parts of the metadata, with the ball missing every 50 frames.
+    """
+    parts = ET.parse(METADATA_PATH).getroot().findall('.//DataFormatSpecification')
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', newline='') as file:
+        for part in parts:
+            start, end = int(part.attrib['startFrame']), min(int(part.attrib['endFrame']), n_frames)
+            if start > n_frames:
+                break
+            n_players = len(list(list(part)[1]))
+            n = end - start + 1
+            xy = rng.uniform(0, 1, size=(n, n_players, 2))
+            box = rng.integers(0, 1000, size=(n, n_players, 4))
+            lines = []
+            for k in range(n):
+                players = ';'.join('%.5f,%.5f,%d,%d,%d,%d' % (xy[k, p, 0], xy[k, p, 1], *box[k, p])
+                                   for p in range(n_players))
+                ball = 'NaN,NaN' if k % 50 == 0 else '%.5f,%.5f' % tuple(rng.uniform(0, 1, 2))
+                lines.append(f'{start + k}:{players}:{ball}:-36,90,1299,90,1904,570,-732,619\r\n')
+            file.write(''.join(lines))
+        file.write('\r\n')
+
+
+def baseline_reader(revision):
+    """
+    read_FCB_data of a git revision, with Element.getchildren (removed in Python 3.9) replaced by slicing.
+    """
+    source = subprocess.run(['git', '-C', REPO, 'show', f'{revision}:source/Tracking_IO.py'],
+                            capture_output=True, text=True, check=True).stdout
+    code = source[source.index('def read_FCB_data'):source.index('def read_FCB_csv')]
+    code = code.replace('.getchildren()', '[:]').replace("is not '\\n'", "not in ('\\n', '')")
+    namespace = {'pd': pd, 'np': np, 'ET': ET}
+    exec(code, namespace)
+    return namespace['read_FCB_data']
+
+
+def timed(reader, tracking_path):
+    start = time.perf_counter()
+    home, away, _ = reader(METADATA_PATH, tracking_path, None)
+    return time.perf_counter() - start, home, away
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=3000, help='frames of the synthetic file')
+    parser.add_argument('--baseline', help='git revision whose read_FCB_data is timed and compared')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        tracking_path = os.path.join(directory, 'tracking.txt')
+        generate_tracking_file(tracking_path, args.frames)
+        elapsed, home, away = timed(io.read_FCB_data, tracking_path)
+        print(f'read_FCB_data: {args.frames} frames in {elapsed:.2f} s, home {home.shape}, away {away.shape}')
+        if args.baseline:
+            elapsed, base_home, base_away = timed(baseline_reader(args.baseline), tracking_path)
+            print(f'baseline {args.baseline}: {elapsed:.2f} s')
+            for team, new, old in [('home', home, base_home), ('away', away, base_away)]:
+                old = old.astype(float)
+                new = new.loc[old.index, old.columns]
+                difference = np.nanmax(np.abs(new.to_numpy() - old.to_numpy()))
+                mismatches = int((np.isnan(new.to_numpy()) != np.isnan(old.to_numpy())).sum())
+                print(f'{team}: max difference {difference:.2e}, NaN mismatches {mismatches}')
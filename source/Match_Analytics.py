@@ -9,6 +9,8 @@ we would like to process many Match instances to obtain the necessary data to tr
 a ML model or do statistics with more than one game.
 
 """
+import os
+import json
 import numpy as np
 
 # Project modules
@@ -16,7 +18,27 @@ import Tracking_IO as io
 import Tracking_Dynamics as dyn
 import Tracking_Visualization as vis
 from Tracking_Constants import *
-from Tracking_Filters import filter_dead_time
+from Tracking_Filters import filter_dead_time, frame_positions, FrameQuery
+from Tracking_Statistics import PassGraphs
+from Tracking_Tensor import TrackingTensor
+
+# Version of the layout written by Match.save()
+MATCH_FORMAT_VERSION = 4
+# Version of the preprocessing code, bump it whenever the preprocessing changes so cached matches are rebuilt
+PREPROCESSING_VERSION = 5
+# Default maximum size in bytes of the preprocessed matches cache
+CACHE_SIZE = 10 * 2**30
+# Attributes of a Match stored in the match.json file by Match.save()
+MATCH_ATTRIBUTES = ['match_id', 'name', 'data_source', 'field_dimen', 'global_normalization', 'normalize_goalkeeper',
+                    'home_color', 'away_color', 'filter_dead_time', 'home_goalkeeper', 'away_goalkeeper',
+                    'home_players', 'away_players', 'framerate', 'source_paths', 'target_stage', 'stage']
+# Preprocessing stages of the tracking data, in the order they are applied
+PREPROCESSING_STAGES = ['raw', 'metric', 'direction', 'normals', 'velocities', 'dead_time']
+# First preprocessing stage depending on each option of the match
+STAGE_OPTIONS = {'field_dimen': 'metric',
+                 'global_normalization': 'normals',
+                 'normalize_goalkeeper': 'normals',
+                 'filter_dead_time': 'dead_time'}
 
 class Match:
   def __init__(self, 
@@ -35,7 +57,11 @@ class Match:
               events_path=None,
               filter_dead_time=True,
               global_normalization = False,
-              normalize_goalkeeper = False ):
+              normalize_goalkeeper = False,
+              cache_dir = None,
+              cache_size = CACHE_SIZE):
+    self._init_tracking()
+    self._init_stages()
     if match_id:
       self.match_id = match_id
     else:
@@ -50,50 +76,321 @@ class Match:
     self.normalize_goalkeeper = normalize_goalkeeper
     if verbose:
       print(f"Initializing match: {self.name}\n")
-    self.read_match_data(data_source=self.data_source, 
-                         match_id=self.match_id,
-                         metadata_path = metadata_path,
-                         tracking_path = tracking_path,
-                         events_path = events_path,
-                         home_path = home_path,
-                         away_path = away_path)
-    self.preprocessed = False
-    if self.data_source == "tactics":
-        self.preprocessed = True
-        self.home_goalkeeper = io.find_goalkeeper(self.tracking_home)
-        self.away_goalkeeper = io.find_goalkeeper(self.tracking_away)
-        print(self.home_goalkeeper)
-        print(self.away_goalkeeper)
-    self.home_players = io.find_players(self.tracking_home)
-    self.away_players = io.find_players(self.tracking_away)
+    if cache_dir:
+      # Cached matches are addressed by the content of the input files and the preprocessing parameters
+      paths = io.match_data_paths(data_source, self.match_id, metadata_path, tracking_path, events_path, home_path, away_path)
+      parameters = {'data_source': data_source,
+                    'match_id': self.match_id,
+                    'field_dimen': list(field_dimen),
+                    'global_normalization': global_normalization,
+                    'normalize_goalkeeper': normalize_goalkeeper,
+                    'filter_dead_time': filter_dead_time,
+                    'preprocess': PREPROCESSING_STAGES[-1] if preprocess is True else preprocess or 'raw',
+                    'format_version': MATCH_FORMAT_VERSION,
+                    'preprocessing_version': PREPROCESSING_VERSION}
+      cache_path = os.path.join(cache_dir, io.cache_key(paths, parameters))
+      if os.path.isfile(os.path.join(cache_path, 'match.json')):
+        self.__dict__.update(Match.load(cache_path).__dict__)
+        self.name = name if name else str(self.match_id)
+        self.home_color = home_color
+        self.away_color = away_color
+        # Mark the entry as recently used for the LRU eviction
+        os.utime(cache_path)
+        if verbose:
+          print(f"Match loaded from cache: {cache_path}\n")
+        return
+    self.source_paths = {'metadata_path': metadata_path,
+                         'tracking_path': tracking_path,
+                         'events_path': events_path,
+                         'home_path': home_path,
+                         'away_path': away_path}
+    self.target_stage = PREPROCESSING_STAGES[-1] if preprocess is True else preprocess or 'raw'
+    self.require('raw')
+    self.home_players = io.find_players(self._get_tracking_view('Home'))
+    self.away_players = io.find_players(self._get_tracking_view('Away'))
     self.all_players = np.concatenate([self.home_players, self.away_players])
     self.home_color = home_color
     self.away_color = away_color
     self.filter_dead_time = filter_dead_time
-    if preprocess:
-      self.preprocess()
+    if cache_dir:
+      self.require(self.target_stage)
+      io.cache_store(self.save, cache_path)
+      io.evict_cache(cache_dir, cache_size, keep=cache_path)
 
   def preprocess(self):
     """
     Wraps up all the methods and performs all the predefined preprocessing for the tracking data.
     """
-    # Basic data preprocessing
-    if not self.preprocessed:
-      self.tracking_home = io.to_metric_coordinates(self.tracking_home,data_source = self.data_source, field_dimen = self.field_dimen)
-      self.tracking_away = io.to_metric_coordinates(self.tracking_away, data_source = self.data_source, field_dimen = self.field_dimen)
-      self.events = io.to_metric_coordinates(self.events, data_source = self.data_source, field_dimen = self.field_dimen)
-      self.tracking_home, self.tracking_away, self.events = io.to_single_playing_direction(self.tracking_home, self.tracking_away, self.events)
+    self.target_stage = PREPROCESSING_STAGES[-1]
+    return self.require(self.target_stage)
+
+  @property
+  def preprocessed(self):
+    return self.stage == PREPROCESSING_STAGES[-1]
+
+  def _init_stages(self):
+    # Last preprocessing stage applied to the data, None if the data has not been read yet
+    self.stage = None
+    # Stage the data is brought to when it is accessed
+    self.target_stage = PREPROCESSING_STAGES[-1]
+    self._preprocessing = False
+    self._events = None
+    self._ranges = None
+    # Original frame of each frame of the dead time filtered data, and its inverse (see Tracking_Filters.frame_positions)
+    self.original_frames = None
+    self.frame_positions = None
+    self._query = None
+    self._pass_graphs = None
+
+  def require(self, stage):
+    """
+    Runs the preprocessing stages still pending up to the given one (see PREPROCESSING_STAGES). Each stage runs
+    only once, until an option it depends on changes and invalidates it.
+    """
+    if self._preprocessing:
+      return self
+    position = PREPROCESSING_STAGES.index(stage)
+    first = self.stage
+    self._preprocessing = True
+    try:
+      while self.stage is None or PREPROCESSING_STAGES.index(self.stage) < position:
+        next_stage = PREPROCESSING_STAGES[0 if self.stage is None else PREPROCESSING_STAGES.index(self.stage) + 1]
+        self.stage = getattr(self, f'_stage_{next_stage}')() or next_stage
+    finally:
+      self._preprocessing = False
+    # The partial stages are kept as float64 dataframes, so the following ones do not resume from float32 values
+    if self.stage != first and self.preprocessed:
+      self.pack_tracking()
+      print('Match preprocessed successfully.\n')
+    return self
+
+  def invalidate(self, stage):
+    """
+    Discards the products of the given preprocessing stage and the following ones. As the stages transform the data
+    in place, the raw data is read again and the stages run again the next time the data is accessed.
+    """
+    if self.stage is None or PREPROCESSING_STAGES.index(self.stage) < PREPROCESSING_STAGES.index(stage):
+      return
+    self._init_tracking()
+    self.stage = None
+    self._events = None
+    self._ranges = None
+    self.original_frames = None
+    self.frame_positions = None
+    self._reset_accessors()
+
+  def _reset_accessors(self):
+    # Accessors built on the tracking data, cleared as well for the callers still holding them
+    if self._query is not None:
+      self._query.clear()
+    self._query = None
+    self._pass_graphs = None
+
+  def _require_target(self):
+    self.require(self.target_stage)
+
+  def _stage_raw(self):
+    self.read_match_data(self.data_source, self.match_id, **self.source_paths)
+    self.framerate = io.find_framerate(self._get_tracking_view('Home'))
+    if self.data_source == "tactics":
+      # Tactics data is already preprocessed
       self.home_goalkeeper = io.find_goalkeeper(self.tracking_home)
       self.away_goalkeeper = io.find_goalkeeper(self.tracking_away)
       print(self.home_goalkeeper)
       print(self.away_goalkeeper)
-      self.calculate_player_normals()
-      self.calculate_player_velocities()
-      self.preprocessed = True
-      if self.filter_dead_time:
-        self.ranges = filter_dead_time(self)
-      print('Match preprocessed successfully.\n')
-    return self
+      return PREPROCESSING_STAGES[-1]
+
+  def _stage_metric(self):
+    self.tracking_home = io.to_metric_coordinates(self.tracking_home,data_source = self.data_source, field_dimen = self.field_dimen)
+    self.tracking_away = io.to_metric_coordinates(self.tracking_away, data_source = self.data_source, field_dimen = self.field_dimen)
+    self.events = io.to_metric_coordinates(self.events, data_source = self.data_source, field_dimen = self.field_dimen)
+
+  def _stage_direction(self):
+    self.tracking_home, self.tracking_away, self.events = io.to_single_playing_direction(self.tracking_home, self.tracking_away, self.events)
+    self.home_goalkeeper = io.find_goalkeeper(self.tracking_home)
+    self.away_goalkeeper = io.find_goalkeeper(self.tracking_away)
+    print(self.home_goalkeeper)
+    print(self.away_goalkeeper)
+
+  def _stage_normals(self):
+    self.calculate_player_normals()
+
+  def _stage_velocities(self):
+    self.calculate_player_velocities()
+
+  def _stage_dead_time(self):
+    if self.filter_dead_time:
+      self.ranges = filter_dead_time(self)
+      # The cumulative distances must not jump over the removed frames
+      self.tracking_home = dyn.splice_distances(self.tracking_home, self.ranges['Join Frame'])
+      self.tracking_away = dyn.splice_distances(self.tracking_away, self.ranges['Join Frame'])
+
+  def _set_option(self, option, value):
+    if option in self.__dict__ and self.__dict__[option] != value:
+      self.invalidate(STAGE_OPTIONS[option])
+    self.__dict__[option] = value
+
+  @property
+  def field_dimen(self):
+    return self.__dict__['field_dimen']
+
+  @field_dimen.setter
+  def field_dimen(self, value):
+    self._set_option('field_dimen', tuple(value))
+
+  @property
+  def global_normalization(self):
+    return self.__dict__['global_normalization']
+
+  @global_normalization.setter
+  def global_normalization(self, value):
+    self._set_option('global_normalization', value)
+
+  @property
+  def normalize_goalkeeper(self):
+    return self.__dict__['normalize_goalkeeper']
+
+  @normalize_goalkeeper.setter
+  def normalize_goalkeeper(self, value):
+    self._set_option('normalize_goalkeeper', value)
+
+  @property
+  def filter_dead_time(self):
+    return self.__dict__['filter_dead_time']
+
+  @filter_dead_time.setter
+  def filter_dead_time(self, value):
+    self._set_option('filter_dead_time', value)
+
+  @property
+  def events(self):
+    self._require_target()
+    return self._events
+
+  @events.setter
+  def events(self, df):
+    self._events = df
+
+  @property
+  def ranges(self):
+    """
+    Time ranges removed by the dead time filter.
+    """
+    self._require_target()
+    if self._ranges is None:
+      raise AttributeError("The dead time of the match has not been filtered.")
+    return self._ranges
+
+  @ranges.setter
+  def ranges(self, df):
+    self._ranges = df
+
+  def _init_tracking(self):
+    # Tracking dataframes assigned to the match and not yet packed in the tensor, by team
+    self._staged_tracking = {}
+    # Dataframes materialized from the tensor, kept until the tensor is packed again
+    self._tracking_views = {}
+    # Teams whose dataframe was handed out by tracking_home / tracking_away since it was last compared to the tensor
+    self._unchecked_views = set()
+    self._tracking = None
+
+  def _get_tracking_view(self, team):
+    if team in self._staged_tracking:
+      return self._staged_tracking[team]
+    if self._tracking is None:
+      raise AttributeError(f"The match has no {team.lower()} tracking data.")
+    if team not in self._tracking_views:
+      self._tracking_views[team] = self._tracking.to_dataframe(team)
+    return self._tracking_views[team]
+
+  def _hand_out_tracking_view(self, team):
+    self._require_target()
+    if team not in self._staged_tracking:
+      self._unchecked_views.add(team)
+    return self._get_tracking_view(team)
+
+  def _stage_edited_views(self):
+    """
+    Stages again the dataframes handed out since the last check that no longer hold the values of the tensor, so the
+    edits made on them in place are packed in match.tracking.
+    """
+    teams = [team for team in self._unchecked_views if team in self._tracking_views]
+    self._unchecked_views = set()
+    for team in teams:
+      if not self._tracking.holds(team, self._tracking_views[team]):
+        self._staged_tracking[team] = self._tracking_views.pop(team)
+
+  def _set_tracking_view(self, team, df):
+    self._staged_tracking[team] = df
+    self._tracking_views.pop(team, None)
+    self._reset_accessors()
+
+  @property
+  def tracking_home(self):
+    """
+    Tracking dataframe of the home team, brought to the target preprocessing stage on the first access. Once the match is packed it is built from the tracking tensor
+    on the first access and kept until the match is invalidated or the dataframe assigned. The edits made in place after accessing it are packed in the tensor on the
+    next access to match.tracking.
+    """
+    return self._hand_out_tracking_view('Home')
+
+  @tracking_home.setter
+  def tracking_home(self, df):
+    self._set_tracking_view('Home', df)
+
+  @property
+  def tracking_away(self):
+    """
+    Tracking dataframe of the away team, see tracking_home.
+    """
+    return self._hand_out_tracking_view('Away')
+
+  @tracking_away.setter
+  def tracking_away(self, df):
+    self._set_tracking_view('Away', df)
+
+  @property
+  def tracking(self):
+    """
+    TrackingTensor with the tracking data of both teams shaped [frame, entity, channel].
+    """
+    self._require_target()
+    self._stage_edited_views()
+    if self._staged_tracking:
+      self.pack_tracking()
+    return self._tracking
+
+  def query(self):
+    """
+    FrameQuery over the frames of the match, its predicates (period, possession, ball zone, time, events) are cached
+    until the preprocessing is invalidated and combine into a FrameSelection without copying the tracking data.
+    """
+    if self._query is None:
+      self._query = FrameQuery(self)
+    return self._query
+
+  def pass_graphs(self):
+    """
+    PassGraphs of the match, the pass networks of any time window for graph models (see Tracking_Statistics.pass_graph),
+    cached until the preprocessing is invalidated.
+    """
+    if self._pass_graphs is None:
+      self._pass_graphs = PassGraphs(self)
+    return self._pass_graphs
+
+  def pack_tracking(self):
+    """
+    Packs the tracking dataframes of both teams in a single float32 TrackingTensor. Once the match is preprocessed the
+    dataframes are dropped and rebuilt on demand when tracking_home or tracking_away are accessed, before that they
+    are kept so the pending stages run on the float64 values.
+    """
+    views = {team: self._get_tracking_view(team) for team in ['Home', 'Away']}
+    self._tracking = TrackingTensor.from_dataframes(views)
+    self._staged_tracking = {}
+    self._tracking_views = {} if self.preprocessed else views
+    self._unchecked_views = set()
+    self._reset_accessors()
+    return self._tracking
   
   def read_match_data(self, data_source, match_id, metadata_path, tracking_path, events_path, home_path, away_path):
     """
@@ -120,8 +417,10 @@ class Match:
   
   
   def calculate_player_velocities(self):
-    self.tracking_home = dyn.calc_player_velocities(self.tracking_home, players=self.home_players)
-    self.tracking_away = dyn.calc_player_velocities(self.tracking_away, players=self.away_players)
+    # Once the dead time is filtered the velocities are not smoothed across the frames where the data was spliced
+    joins = self._ranges['Join Frame'] if self._ranges is not None else None
+    self.tracking_home = dyn.calc_player_velocities(self.tracking_home, players=self.home_players, joins=joins)
+    self.tracking_away = dyn.calc_player_velocities(self.tracking_away, players=self.away_players, joins=joins)
   
   def calculate_player_normals(self):
     self.tracking_away = dyn.calc_player_norm_positions(team1 = self.tracking_away,
@@ -135,4 +434,61 @@ class Match:
                                                         goalkeeper1 = self.home_goalkeeper,
                                                         goalkeeper2 = self.away_goalkeeper,
                                                         global_normalization = self.global_normalization,
-                                                        normalize_goalkeeper = self.normalize_goalkeeper)
\ No newline at end of file
+                                                        normalize_goalkeeper = self.normalize_goalkeeper)
+
+  def save(self, path):
+    """
+    Saves the match in the directory path: tracking tensor, events and dead time ranges in the columnar binary
+    layout of TrackingTensor.save() and Tracking_IO.save_dataframe() and the rest of attributes (players, goalkeepers, options) in match.json.
+    The match can then be restored with Match.load(path) without reading and preprocessing the raw data again.
+    """
+    os.makedirs(path, exist_ok=True)
+    self.tracking.save(os.path.join(path, 'tracking'))
+    io.save_dataframe(self.events, os.path.join(path, 'events'))
+    if hasattr(self, 'ranges'):
+      io.save_dataframe(self.ranges, os.path.join(path, 'ranges'))
+    if self.original_frames is not None:
+      np.save(os.path.join(path, 'original_frames.npy'), self.original_frames)
+
+    metadata = {attribute: getattr(self, attribute) for attribute in MATCH_ATTRIBUTES if hasattr(self, attribute)}
+    metadata['version'] = MATCH_FORMAT_VERSION
+    with open(os.path.join(path, 'match.json'), 'w') as file:
+      json.dump(metadata, file, indent=2, default=lambda value: value.tolist())
+    return path
+
+  @classmethod
+  def load(cls, path, mmap=True):
+    """
+    Restores a match saved with Match.save(path).
+
+    Parameters:
+
+    path (string): Directory where the match was saved.
+
+    mmap (bool): If True the tracking arrays are memory-mapped (copy-on-write), so loading takes milliseconds
+                 and only the columns that are used are read from disk.
+    """
+    with open(os.path.join(path, 'match.json'), 'r') as file:
+      metadata = json.load(file)
+    version = metadata.pop('version')
+    if version != MATCH_FORMAT_VERSION:
+      raise ValueError(f"Match saved with format version {version}, expected {MATCH_FORMAT_VERSION}.")
+
+    match = cls.__new__(cls)
+    match._init_tracking()
+    match._init_stages()
+    for attribute, value in metadata.items():
+      setattr(match, attribute, value)
+    match.field_dimen = tuple(match.field_dimen)
+    match.home_players = np.array(match.home_players)
+    match.away_players = np.array(match.away_players)
+    match.all_players = np.concatenate([match.home_players, match.away_players])
+
+    match._tracking = TrackingTensor.load(os.path.join(path, 'tracking'), mmap=mmap)
+    match.events = io.load_dataframe(os.path.join(path, 'events'), mmap=mmap)
+    if os.path.isdir(os.path.join(path, 'ranges')):
+      match.ranges = io.load_dataframe(os.path.join(path, 'ranges'), mmap=False)
+    if os.path.isfile(os.path.join(path, 'original_frames.npy')):
+      match.original_frames = np.load(os.path.join(path, 'original_frames.npy'))
+      match.frame_positions = frame_positions(match.original_frames)
+    return match
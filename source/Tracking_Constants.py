@@ -13,4 +13,7 @@ HALF_AREA_WIDTH = 44*METERS_PER_YARD/2
 AREA_LENGTH = 18*METERS_PER_YARD
 PENALTY_SPOT = 12*METERS_PER_YARD
 CORNER_RADIUS = 1*METERS_PER_YARD
-CIRCLE_RADIUS = 10*METERS_PER_YARD
\ No newline at end of file
+CIRCLE_RADIUS = 10*METERS_PER_YARD
+
+# Default number of frames per block when reading tracking data in chunks (5 minutes at 25 Hz)
+CHUNK_FRAMES = 7500
@@ -11,13 +11,17 @@ Data can be found at: https://github.com/metrica-sports/sample-data
 
 """
 import numpy as np
+import pandas as pd
 import scipy.signal as signal
+import scipy.ndimage as ndimage
 from Tracking_Constants import *
 
-def calc_player_velocities(team, players = None, smoothing=True, filter_='Savitzky-Golay', window=7, polyorder=1, maxspeed = 12):
+def calc_player_velocities(team, players = None, smoothing=True, filter_='Savitzky-Golay', window=7, polyorder=1, maxspeed = 12, joins = None):
     """ calc_player_velocities( tracking_data )
     
-    Calculate player velocities in x & y direciton, and total player speed at each timestamp of the tracking data
+    Calculate player velocities in x & y direciton, and total player speed at each timestamp of the tracking data.
+    In the same pass calculates the accelerations in x & y direction, the total acceleration and jerk, and the
+    cumulative distance covered by each player.
     
     Parameters
     -----------
@@ -27,10 +31,12 @@ def calc_player_velocities(team, players = None, smoothing=True, filter_='Savitz
         window: smoothing window size in # of frames
         polyorder: order of the polynomial for the Savitzky-Golay filter. Default is 1 - a linear fit to the velcoity, so gradient is the acceleration
         maxspeed: the maximum speed that a player can realisitically achieve (in meters/second). Speed measures that exceed maxspeed are tagged as outliers and set to NaN. 
+        joins: positions of the frames where the tracking data was spliced, e.g. the 'Join Frame' column of the ranges returned by filter_dead_time. Velocities are not smoothed across them, nor across periods.
         
     Returns
     -----------
-       team : the tracking DataFrame with columns for speed in the x & y direction and total speed added
+       team : the tracking DataFrame with columns for speed in the x & y direction and total speed added, as well as
+              the acceleration ('_ax', '_ay', '_acceleration'), jerk ('_jerk') and cumulative distance ('_distance')
 
     """
     # remove any cinematic data already in the dataframe
@@ -41,98 +47,234 @@ def calc_player_velocities(team, players = None, smoothing=True, filter_='Savitz
         players = np.unique( [ c.split('_')[0]+'_'+c.split('_')[1] for c in team.columns if c[:4] in ['Home','Away'] ] )
 
     # Calculate the timestep from one frame to the next. Should always be 0.04 within the same half
-    dt = team['Time [s]'].diff()
+    dt = team['Time [s]'].diff().to_numpy()[:, None]
     players = np.append(players, "ball")
-    
-    # index of first frame in second half
-    second_half_idx = team.Period.values.searchsorted(1.5, side='right')+1
+
+    # first frame of each contiguous segment (periods, gaps in time and joins), nothing is differenced or smoothed across segments
+    starts = segment_starts(team, joins)
 
     # Center of mass velocities
-    vx = team["team_meanx"].diff() / dt
-    vy = team["team_meany"].diff() / dt
-    stdvx = team["team_sdx"].diff() / dt
-    stdvy = team["team_sdy"].diff() / dt
+    vx, vy, stdvx, stdvy = segment_differences(team[["team_meanx", "team_meany", "team_sdx", "team_sdy"]].to_numpy(), dt, starts).T
 
     if maxspeed > 0:
         # remove unsmoothed data points that exceed the maximum speed (these are most likely position errors)
-        raw_speed = np.sqrt(vx ** 2 + vy ** 2)
-        vx[raw_speed > maxspeed] = np.nan
-        vy[raw_speed > maxspeed] = np.nan
+        with np.errstate(invalid='ignore'):
+            outliers = np.sqrt(vx ** 2 + vy ** 2) > maxspeed
+        vx[outliers] = np.nan
+        vy[outliers] = np.nan
 
     if smoothing:
-        if filter_ == 'Savitzky-Golay':
-            vx = signal.savgol_filter(vx, window_length=window, polyorder=polyorder)
-            vy = signal.savgol_filter(vy, window_length=window, polyorder=polyorder)
-            stdvx = signal.savgol_filter(vx, window_length=window, polyorder=polyorder)
-            stdvy = signal.savgol_filter(vy, window_length=window, polyorder=polyorder)
-        elif filter_ == 'moving average':
-            ma_window = np.ones(window) / window
-            # calculate first half velocity
-            vx = np.convolve(vx, ma_window, mode='same')
-            vy = np.convolve(vy, ma_window, mode='same')
-            stdvx = np.convolve(vx, ma_window, mode='same')
-            stdvy = np.convolve(vy, ma_window, mode='same')
-
-    team['team_meanvx'] = vx
-    team['team_meanvy'] = vy
-    team['team_stdvx'] = stdvx
-    team['team_stdvy'] = stdvy
+        vx, vy = smooth_segments(np.column_stack([vx, vy]), starts, filter_=filter_, window=window, polyorder=polyorder).T
+        stdvx, stdvy = smooth_segments(np.column_stack([stdvx, stdvy]), starts, filter_=filter_, window=window, polyorder=polyorder).T
 
+    team_magnitudes = ['team_meanvx', 'team_meanvy', 'team_stdvx', 'team_stdvy']
+    # team magnitudes as column vectors, broadcast against the players
+    meanvx, meanvy, stdvx, stdvy = [np.asarray(v)[:, None] for v in (vx, vy, stdvx, stdvy)]
+    meanx, meany, sdx, sdy, varx, vary = [team[column].to_numpy()[:, None] for column in
+        ["team_meanx", "team_meany", "team_sdx", "team_sdy", "team_varx", "team_vary"]]
 
+    # estimate velocities for all the players in team at once, one column per player
+    x = team[[player + "_x" for player in players]].to_numpy()
+    y = team[[player + "_y" for player in players]].to_numpy()
+    # difference player positions in timestep dt to get unsmoothed estimate of velocity
+    vx = segment_differences(x, dt, starts)
+    vy = segment_differences(y, dt, starts)
 
-    
-    # estimate velocities for players in team
-    for player in players: # cycle through players individually
-        # difference player positions in timestep dt to get unsmoothed estimate of velocity
-        vx = team[player+"_x"].diff() / dt
-        vy = team[player+"_y"].diff() / dt
-
-        if maxspeed>0:
-            # remove unsmoothed data points that exceed the maximum speed (these are most likely position errors)
-            raw_speed = np.sqrt( vx**2 + vy**2 )
-            vx[ raw_speed>maxspeed ] = np.nan
-            vy[ raw_speed>maxspeed ] = np.nan
-            
-        if smoothing:
-            if filter_=='Savitzky-Golay':
-                # calculate first half velocity
-                vx = signal.savgol_filter(vx,window_length=window,polyorder=polyorder)
-                vy = signal.savgol_filter(vy,window_length=window,polyorder=polyorder)        
-                # calculate second half velocity
-                #vx.loc[second_half_idx:] = signal.savgol_filter(vx.loc[second_half_idx:],window_length=window,polyorder=polyorder)
-                #vy.loc[second_half_idx:] = signal.savgol_filter(vy.loc[second_half_idx:],window_length=window,polyorder=polyorder)
-            elif filter_=='moving average':
-                ma_window = np.ones( window ) / window 
-                # calculate first half velocity
-                vx = np.convolve( vx , ma_window, mode='same' ) 
-                vy = np.convolve( vy , ma_window, mode='same' )      
-                # calculate second half velocity
-                #vx.loc[second_half_idx:] = np.convolve( vx.loc[second_half_idx:] , ma_window, mode='same' ) 
-                #vy.loc[second_half_idx:] = np.convolve( vy.loc[second_half_idx:] , ma_window, mode='same' ) 
-                
-        
-        # put player speed in x,y direction, and total speed back in the data frame
-        team[player + "_vx"] = vx
-        team[player + "_vy"] = vy
-        team[player + "_cmvx"] = vx - team["team_meanvx"]
-        team[player + "_cmvy"] = vy - team["team_meanvy"]
-        team[player + "_normvx"] = ((vx - team["team_meanvx"])*team["team_sdx"] - (team[player + "_x"]-team["team_meanx"])*team['team_stdvx'])/team["team_varx"]
-        team[player + "_normvy"] = ((vy - team["team_meanvy"])*team["team_sdy"] - (team[player + "_y"]-team["team_meany"])*team['team_stdvy'])/team["team_vary"]
-        team[player + "_speed"] = np.sqrt( vx**2 + vy**2 )
-        team[player + "_speedcm"] = np.sqrt(team[player + "_cmvx"] ** 2 + team[player + "_cmvy"] ** 2)
-        team[player + "_speednorm"] = np.sqrt(team[player + "_normvx"] ** 2 + team[player + "_normvy"] ** 2)
+    outliers = np.zeros(vx.shape, dtype=bool)
+    if maxspeed>0:
+        # remove unsmoothed data points that exceed the maximum speed (these are most likely position errors)
+        with np.errstate(invalid='ignore'):
+            outliers = np.sqrt( vx**2 + vy**2 ) > maxspeed
+        vx[outliers] = np.nan
+        vy[outliers] = np.nan
 
-    return team
+    if smoothing:
+        vx = smooth_segments(vx, starts, filter_=filter_, window=window, polyorder=polyorder)
+        vy = smooth_segments(vy, starts, filter_=filter_, window=window, polyorder=polyorder)
+
+    # accelerations differencing the velocities, and jerk differencing the accelerations, in the same segments
+    ax = segment_differences(vx, dt, starts)
+    ay = segment_differences(vy, dt, starts)
+    if smoothing:
+        ax = smooth_segments(ax, starts, filter_=filter_, window=window, polyorder=polyorder)
+        ay = smooth_segments(ay, starts, filter_=filter_, window=window, polyorder=polyorder)
+    jx = segment_differences(ax, dt, starts)
+    jy = segment_differences(ay, dt, starts)
+
+    # cumulative distance covered, so the distance in any window is the difference of its last and first values.
+    # Steps across segments, from or to missing positions and outliers do not count.
+    steps = np.sqrt( np.diff(x, axis=0, prepend=np.nan)**2 + np.diff(y, axis=0, prepend=np.nan)**2 )
+    steps[starts] = 0
+    steps[np.isnan(steps) | outliers] = 0
+    distance = np.cumsum(steps, axis=0)
+
+    # all the derived magnitudes are written in a single block: the team magnitudes and then the players magnitudes
+    magnitudes = ["vx", "vy", "cmvx", "cmvy", "normvx", "normvy", "speed", "speedcm", "speednorm",
+                  "ax", "ay", "acceleration", "jerk", "distance"]
+    block = np.empty((len(team), len(team_magnitudes) + len(players)*len(magnitudes)), order="F")
+    block[:, :len(team_magnitudes)] = np.hstack([meanvx, meanvy, stdvx, stdvy])
+    # column-major view [frame, magnitude, player] of the players columns, ordered by player and then magnitude
+    values = block[:, len(team_magnitudes):].reshape(len(team), len(magnitudes), len(players), order="F")
+    values[:, 0] = vx
+    values[:, 1] = vy
+    cmvx = np.subtract(vx, meanvx, out=values[:, 2])
+    cmvy = np.subtract(vy, meanvy, out=values[:, 3])
+    normvx = np.divide(cmvx*sdx - (x-meanx)*stdvx, varx, out=values[:, 4])
+    normvy = np.divide(cmvy*sdy - (y-meany)*stdvy, vary, out=values[:, 5])
+    np.sqrt( vx**2 + vy**2, out=values[:, 6] )
+    np.sqrt( cmvx**2 + cmvy**2, out=values[:, 7] )
+    np.sqrt( normvx**2 + normvy**2, out=values[:, 8] )
+    values[:, 9] = ax
+    values[:, 10] = ay
+    np.sqrt( ax**2 + ay**2, out=values[:, 11] )
+    np.sqrt( jx**2 + jy**2, out=values[:, 12] )
+    values[:, 13] = distance
+
+    # put team and player velocities, relative velocities, speeds, accelerations and distances in the data frame, with a single concatenation
+    columns = team_magnitudes + [player + "_" + magnitude for player in players for magnitude in magnitudes]
+    return add_columns(team, block, columns)
+
+def add_columns(team, block, columns):
+    """ add_columns( tracking_data, block, columns )
+
+    Returns a copy of the tracking data with the columns of block [frame, column] added with a single concatenation.
+    Columns already in the tracking data are overwritten and keep their position.
+    """
+    block = pd.DataFrame(block, index=team.index, columns=columns, copy=False)
+    existing = [column for column in columns if column in team.columns]
+    if existing:
+        team = team.copy()
+        team[existing] = block[existing]
+        block = block.drop(columns=existing)
+    return pd.concat([team, block], axis=1)
+
+def segment_starts(team, joins = None):
+    """ segment_starts( tracking_data )
+
+    Positions of the first frame of each contiguous segment of the tracking data. A segment starts at the first frame,
+    at every change of period, after every gap in the time of the frames larger than 1.5 times the usual time step,
+    and at the given joins.
+
+    Parameters
+    -----------
+        team: the tracking DataFrame for home or away team
+        joins: positions of additional segment starts, e.g. the frames where filter_dead_time spliced the data
+
+    Returns
+    -----------
+       starts : sorted array with the position of the first frame of each segment
+    """
+    n = len(team)
+    boundaries = np.zeros(n, dtype=bool)
+    boundaries[:1] = True
+    if 'Period' in team.columns:
+        period = team['Period'].to_numpy()
+        boundaries[1:] |= period[1:] != period[:-1]
+    dt = np.diff(team['Time [s]'].to_numpy())
+    if len(dt):
+        boundaries[1:] |= dt > 1.5 * np.nanmedian(dt)
+    if joins is not None:
+        joins = np.asarray(joins, dtype=int)
+        boundaries[joins[(joins >= 0) & (joins < n)]] = True
+    return np.flatnonzero(boundaries)
+
+def segment_differences(positions, dt, starts):
+    """ segment_differences( positions, dt, starts )
+
+    Velocity estimate from the frame to frame differences of the columns of positions [frame, column] over the time
+    steps dt. The first frame of each segment has no previous frame, it takes the velocity of the second one (NaN for
+    segments of a single frame).
+    """
+    velocities = np.diff(positions, axis=0, prepend=np.nan) / dt
+    # one-sided difference at the segment starts, instead of differencing across segments
+    lengths = np.diff(np.append(starts, len(positions)))
+    velocities[starts] = np.nan
+    starts = starts[lengths > 1]
+    velocities[starts] = velocities[starts + 1]
+    return velocities
+
+def smooth_segments(values, starts, filter_='Savitzky-Golay', window=7, polyorder=1):
+    """ smooth_segments( values, starts )
+
+    Smooths the columns of values [frame, column] independently within each contiguous segment, in a single batched
+    filter of the whole array followed by the correction of the frames close to the segment boundaries.
+
+    Parameters
+    -----------
+        values: array [frame, column] to smooth
+        starts: positions of the first frame of each segment, see segment_starts
+        filter_: 'Savitzky-Golay' or 'moving average'
+        window: smoothing window size in # of frames
+        polyorder: order of the polynomial for the Savitzky-Golay filter
+
+    Returns
+    -----------
+       smoothed : the smoothed array. As savgol_filter(mode='interp') on each segment for the Savitzky-Golay filter
+                  (segments shorter than the window are not smoothed), and as np.convolve(mode='same') on each
+                  segment for the moving average.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    starts = np.asarray(starts, dtype=int)
+    ends = np.append(starts[1:], n)
+    # segment of each frame
+    segment = np.repeat(np.arange(len(starts)), ends - starts)
+
+    if filter_=='Savitzky-Golay':
+        smoothed = ndimage.convolve1d(values, signal.savgol_coeffs(window, polyorder), axis=0, mode='constant')
+        half = window // 2
+        # polynomial fit to the first and last window of each segment, evaluated at its edge frames
+        vander = np.vander(np.arange(window), polyorder + 1)
+        fit = vander @ np.linalg.pinv(vander)
+        long = ends - starts >= window
+        first = starts[long][:, None] + np.arange(window)
+        last = ends[long][:, None] - window + np.arange(window)
+        smoothed[first[:, :half]] = np.einsum('hw,swc->shc', fit[:half], values[first])
+        smoothed[last[:, window - half:]] = np.einsum('hw,swc->shc', fit[window - half:], values[last])
+        # segments shorter than the window keep the unsmoothed values
+        short = ~long[segment]
+        smoothed[short] = values[short]
+    elif filter_=='moving average':
+        smoothed = ndimage.convolve1d(values, np.ones(window) / window, axis=0, mode='constant',
+                                      origin=-1 if window % 2 == 0 else 0)
+        # frames whose window crosses a segment boundary, averaged with the frames out of the segment as zeros
+        offsets = np.arange(-(window // 2), (window - 1) // 2 + 1)
+        edges = np.concatenate([starts[:, None] + np.arange(window // 2), ends[:, None] - 1 - np.arange((window - 1) // 2)], axis=1).ravel()
+        edges = np.unique(edges[(edges >= 0) & (edges < n)])
+        neighbours = edges[:, None] + offsets
+        inside = (neighbours >= starts[segment[edges]][:, None]) & (neighbours < ends[segment[edges]][:, None])
+        smoothed[edges] = np.where(inside[:, :, None], values[np.clip(neighbours, 0, n - 1)], 0).sum(axis=1) / window
+    else:
+        smoothed = values.copy()
+    return smoothed
+
+def splice_distances(team, joins):
+    """ splice_distances( tracking_data, joins )
+
+    Rebases the cumulative '_distance' columns of tracking data spliced at the positions joins (e.g. by
+    filter_dead_time), so that the distance covered in the frames removed before each join does not count.
+    """
+    columns = [c for c in team.columns if c.endswith('_distance')]
+    joins = np.asarray(joins, dtype=int)
+    joins = joins[(joins > 0) & (joins < len(team))]
+    if not columns or not len(joins):
+        return team
+    steps = np.diff(team[columns].to_numpy(), axis=0, prepend=0)
+    steps[0] = 0
+    steps[joins] = 0
+    return add_columns(team, np.cumsum(steps, axis=0), columns)
 
 def remove_player_cinematics(team):
     # remove player velocoties and acceleeration measures that are already in the 'team' dataframe
-    columns = [c for c in team.columns if c.split('_')[-1] in ['vx','vy','ax','ay','speed','acceleration','distance']] # Get the player ids
-    team = team.drop(columns=columns)
+    columns = [c for c in team.columns if c.split('_')[-1] in ['vx','vy','ax','ay','speed','acceleration','jerk','distance']] # Get the player ids
+    if columns:
+        team = team.drop(columns=columns)
     return team
 def remove_player_normals(team):
     # remove player normals and acceleeration measures that are already in the 'team' dataframe
     columns = [c for c in team.columns if c.split('_')[-1] in ['normx','normy']] # Get the player ids
-    team = team.drop(columns=columns)
+    if columns:
+        team = team.drop(columns=columns)
     return team
 
 def calc_player_norm_positions(team1, team2 = None, goalkeeper1 = None,
@@ -145,63 +287,65 @@ def calc_player_norm_positions(team1, team2 = None, goalkeeper1 = None,
     team1_players_ids = np.unique( [ c.split('_')[0]+'_'+c.split('_')[1] for c in team1.columns if c[:4] in ['Home','Away'] ] )
     team2_players_ids = np.unique([c.split('_')[0] + '_' + c.split('_')[1] for c in team2.columns if
                                    c.split('_')[0] in team2.columns[4].split('_')[0]])
-    #Initialitation of necessary variables to normalize positions 
-    team1['team_cmx']=0
-    team1['team_cmy']=0
-    team1['team_cmx2']=0
-    team1['team_cmy2']=0
-    team1['num_team']=0
-
-    # estimate normal positions for players in team1
-    for player in team1_players_ids: # cycle through players individually
-        if not normalize_goalkeeper:
-            if int(player.split("_")[1]) != int(goalkeeper1):
-                team1['team_cmx']=team1['team_cmx'].add(team1[player+'_x'], fill_value = 0)
-                team1['team_cmy']=team1['team_cmy'].add(team1[player+'_y'], fill_value = 0)
-                team1['team_cmx2']=team1['team_cmx2'].add(team1[player+'_x']**2, fill_value = 0)
-                team1['team_cmy2']=team1['team_cmy2'].add(team1[player+'_y']**2, fill_value = 0)
-                team1['num_team']=team1['num_team'].add(team1[player + '_x']/team1[player + '_x'], fill_value = 0)
-        else:
-            team1['team_cmx'] = team1['team_cmx'].add(team1[player + '_x'], fill_value=0)
-            team1['team_cmy'] = team1['team_cmy'].add(team1[player + '_y'], fill_value=0)
-            team1['team_cmx2'] = team1['team_cmx2'].add(team1[player + '_x'] ** 2, fill_value=0)
-            team1['team_cmy2'] = team1['team_cmy2'].add(team1[player + '_y'] ** 2, fill_value=0)
-            team1['num_team'] = team1['num_team'].add(team1[player + '_x'] / team1[player + '_x'], fill_value=0)
+    # positions of the players of both teams as [frame, player] blocks
+    x1 = team1[[player + "_x" for player in team1_players_ids]].to_numpy()
+    y1 = team1[[player + "_y" for player in team1_players_ids]].to_numpy()
+    x2 = team2[[player + "_x" for player in team2_players_ids]].to_numpy()
+    y2 = team2[[player + "_y" for player in team2_players_ids]].to_numpy()
+
+    # players taken into account for the center of mass and spread of the team
+    included1 = np.ones(len(team1_players_ids), dtype=bool)
+    included2 = np.ones(len(team2_players_ids), dtype=bool)
+    if not normalize_goalkeeper:
+        included1 = np.array([int(player.split("_")[1]) != int(goalkeeper1) for player in team1_players_ids], dtype=bool)
+        if global_normalization:
+            included2 = np.array([int(player.split("_")[1]) != int(goalkeeper2) for player in team2_players_ids], dtype=bool)
+    x = x1[:, included1]
+    y = y1[:, included1]
     if global_normalization:
-        for player in team2_players_ids:  # cycle through players individually
-            if not normalize_goalkeeper:
-                if int(player.split("_")[1]) != int(goalkeeper2):
-                    team1['team_cmx'] = team1['team_cmx'].add(team2[player + '_x'], fill_value=0)
-                    team1['team_cmy'] = team1['team_cmy'].add(team2[player + '_y'], fill_value=0)
-                    team1['team_cmx2'] = team1['team_cmx2'].add(team2[player + '_x'] ** 2, fill_value=0)
-                    team1['team_cmy2'] = team1['team_cmy2'].add(team2[player + '_y'] ** 2, fill_value=0)
-                    team1['num_team'] = team1['num_team'].add(team2[player + '_x'] / team2[player + '_x'], fill_value=0)
-            else:
-                team1['team_cmx'] = team1['team_cmx'].add(team2[player + '_x'], fill_value=0)
-                team1['team_cmy'] = team1['team_cmy'].add(team2[player + '_y'], fill_value=0)
-                team1['team_cmx2'] = team1['team_cmx2'].add(team2[player + '_x'] ** 2, fill_value=0)
-                team1['team_cmy2'] = team1['team_cmy2'].add(team2[player + '_y'] ** 2, fill_value=0)
-                team1['num_team'] = team1['num_team'].add(team2[player + '_x'] / team2[player + '_x'], fill_value=0)
-
-    team1['team_meanx']=team1['team_cmx']/team1['num_team']
-    team1['team_meany']=team1['team_cmy']/team1['num_team']
-    team1['team_varx']=team1['team_cmx2']/team1['num_team']-team1['team_meanx']**2
-    team1['team_vary']=team1['team_cmy2']/team1['num_team']-team1['team_meany']**2
-    team1['team_sdx']=team1['team_varx']**0.5
-    team1['team_sdy']=team1['team_vary']**0.5
-
-    for player in team1_players_ids:
-        # put player normal position in x,y direction, and total speed back in the data frame
-        team1[player + "_normx"] = (team1[player + "_x"]-team1['team_meanx'])/team1['team_sdx']
-        team1[player + "_normy"] = (team1[player + "_y"]-team1['team_meany'])/team1['team_sdy']
-
-    for player in team2_players_ids:
-        team1[player + "_normx"] = (team2[player + "_x"]-team1['team_meanx'])/team1['team_sdx']
-        team1[player + "_normy"] = (team2[player + "_y"]-team1['team_meany'])/team1['team_sdy']
-
-    team1["ball_normx"] = (team1["ball_x"]-team1["team_meanx"])/team1["team_sdx"]
-    team1["ball_normy"] = (team1["ball_y"]-team1["team_meany"])/team1["team_sdy"]
-
-
-
-    return team1
\ No newline at end of file
+        x = np.hstack([x, x2[:, included2]])
+        y = np.hstack([y, y2[:, included2]])
+
+    # masked reductions over the players on the pitch in each frame
+    on_pitch_x = ~np.isnan(x)
+    on_pitch_y = ~np.isnan(y)
+    x = np.where(on_pitch_x, x, 0.)
+    y = np.where(on_pitch_y, y, 0.)
+    num_team = on_pitch_x.sum(axis=1).astype(float)
+    cmx = x.sum(axis=1)
+    cmy = y.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        meanx = cmx/num_team
+        meany = cmy/num_team
+        # two-pass variance, always non negative unlike E[x^2]-E[x]^2
+        dx = np.where(on_pitch_x, x - meanx[:, None], 0.)
+        dy = np.where(on_pitch_y, y - meany[:, None], 0.)
+        varx = np.einsum('ij,ij->i', dx, dx)/num_team
+        vary = np.einsum('ij,ij->i', dy, dy)/num_team
+    sdx = np.sqrt(varx)
+    sdy = np.sqrt(vary)
+    team_magnitudes = {'team_cmx': cmx,
+                       'team_cmy': cmy,
+                       'team_cmx2': np.einsum('ij,ij->i', x, x),
+                       'team_cmy2': np.einsum('ij,ij->i', y, y),
+                       'num_team': num_team,
+                       'team_meanx': meanx,
+                       'team_meany': meany,
+                       'team_varx': varx,
+                       'team_vary': vary,
+                       'team_sdx': sdx,
+                       'team_sdy': sdy}
+
+    # normalized positions of the players of both teams and the ball, as [normx, normy] pairs by player
+    entities = list(team1_players_ids) + list(team2_players_ids) + ["ball"]
+    positions_x = np.hstack([x1, x2, team1[["ball_x"]].to_numpy()])
+    positions_y = np.hstack([y1, y2, team1[["ball_y"]].to_numpy()])
+    block = np.empty((len(team1), len(team_magnitudes) + 2*len(entities)), order="F")
+    block[:, :len(team_magnitudes)] = np.column_stack(list(team_magnitudes.values()))
+    normals = block[:, len(team_magnitudes):].reshape(len(team1), 2, len(entities), order="F")
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.divide(positions_x - meanx[:, None], sdx[:, None], out=normals[:, 0])
+        np.divide(positions_y - meany[:, None], sdy[:, None], out=normals[:, 1])
+
+    columns = list(team_magnitudes) + [entity + "_" + magnitude for entity in entities for magnitude in ["normx", "normy"]]
+    return add_columns(team1, block, columns)
@@ -1,90 +1,216 @@
 # Script intended to gather dataframe filtering functions.
 
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 
+class TimeWindows:
+    """
+    Accessor for time (or frame) windows of tracking data or events, built once and queried many times, e.g. by the
+    sliders of the dashboards.
+
+    Tracking data with a monotonic 'Time [s]' (or 'Frame') is binary searched and windows are positional slices, views
+    of the data without copies. Events are indexed by their start, so only the events starting in the window are
+    checked against its end. Any other data falls back to a boolean mask over all the rows.
+    """
+    def __init__(self, tracking_dataframe, frame = False):
+        self.data = tracking_dataframe
+        self.times = None
+        self.mask_times = None
+        self.starts = None
+        key = 'Frame' if frame else 'Time [s]'
+        if key in tracking_dataframe.columns:
+            times = tracking_dataframe[key].to_numpy()
+        elif frame and tracking_dataframe.index.name == 'Frame':
+            times = tracking_dataframe.index.to_numpy()
+        else:
+            times = None
+        if times is not None:
+            if len(times) < 2 or np.all(times[1:] >= times[:-1]):
+                self.times = times
+            else:
+                self.mask_times = times
+            return
+
+        # Interval index of the events on their start and end
+        start_key, end_key = ('Start Frame', 'End Frame') if frame else ('Start Time [s]', 'End Time [s]')
+        self.starts = tracking_dataframe[start_key].to_numpy(dtype=float)
+        self.ends = tracking_dataframe[end_key].to_numpy(dtype=float)
+        self.order = np.argsort(self.starts, kind='stable')
+        self.sorted_starts = self.starts[self.order]
+        # events ending before they start, not covered by the search on the start
+        self.reversed = np.flatnonzero(self.starts > self.ends)
+
+    def window(self, start, end):
+        """
+        Rows of the tracking data with time in [start, end], or events starting and ending within [start, end].
+        """
+        if self.times is not None:
+            first, last = self.rows(start, end)
+            return self.data.iloc[first:last]
+        if self.starts is None:
+            return self.data[(self.mask_times <= end) & (self.mask_times >= start)]
+        first = np.searchsorted(self.sorted_starts, start, side='left')
+        last = np.searchsorted(self.sorted_starts, end, side='right')
+        rows = np.concatenate([self.order[first:last], self.reversed[self.starts[self.reversed] > end]])
+        rows = np.sort(rows[self.ends[rows] <= end])
+        return self.data.iloc[rows]
+
+    __call__ = window
+
+    def rows(self, start, end):
+        """
+        First and last (excluded) positions of the rows of the tracking data with time in [start, end].
+        """
+        return np.searchsorted(self.times, start, side='left'), np.searchsorted(self.times, end, side='right')
+
+
 def time_window(tracking_dataframe, start, end, frame = False):
+    return TimeWindows(tracking_dataframe, frame=frame).window(start, end)
 
-    if frame:
-        try:
-            return tracking_dataframe[(tracking_dataframe['Frame'] <= end) & (tracking_dataframe['Frame'] >= start)]
-        except:
-            return tracking_dataframe[(tracking_dataframe['End Frame'] <= end) & (tracking_dataframe['Start Frame'] >= start)]
-    else:
-        try:
-            return tracking_dataframe[(tracking_dataframe['Time [s]'] <= end) & (tracking_dataframe['Time [s]'] >= start)]
-        except:
-            return tracking_dataframe[(tracking_dataframe['End Time [s]'] <= end) & (tracking_dataframe['Start Time [s]'] >= start)]
-        
+def interval_mask(times, lower, upper):
+    """
+    Boolean mask of the times falling in any of the closed ranges [lower, upper]. The ranges are sorted by their
+    lower bound once and every time is located with a single binary search, so that overlapping ranges are merged
+    and the cost does not grow with the number of ranges times the number of frames. Empty ranges and ranges with
+    NaN bounds do not mask any time, as with Series.between.
+    """
+    times = np.asarray(times, dtype=float)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    valid = lower <= upper
+    if not valid.any():
+        return np.zeros(times.shape, dtype=bool)
+    order = np.argsort(lower[valid], kind='stable')
+    lower = lower[valid][order]
+    # upper bound of the union of all the ranges starting before each one
+    upper = np.maximum.accumulate(upper[valid][order])
+    ranges = np.searchsorted(lower, times, side='right') - 1
+    return (ranges >= 0) & (upper[np.maximum(ranges, 0)] >= times)
+
+def frame_positions(original_frames):
+    """
+    Inverse of the original_frames array kept by filter_dead_time: array indexed by original frame holding its
+    position in the filtered data, or -1 if the frame was removed.
+    """
+    positions = np.full(original_frames.max() + 1 if len(original_frames) else 0, -1, dtype=np.int64)
+    positions[original_frames] = np.arange(len(original_frames))
+    return positions
+
+def translate_frames(frames, positions):
+    """
+    Positions in the filtered data of the given original frames, through the array returned by frame_positions.
+    Frames removed by the filter, outside the data or NaN are translated to NaN.
+    """
+    frames = np.asarray(frames, dtype=float)
+    translated = np.full(frames.shape, np.nan)
+    inside = (frames >= 0) & (frames < len(positions))
+    translated[inside] = positions[frames[inside].astype(np.int64)]
+    translated[translated < 0] = np.nan
+    if np.isnan(translated).any():
+        return translated
+    return translated.astype(np.int64)
 
 def filter_dead_time(match_object):
+    """
+    Removes from the tracking data the frames between the end of the event preceding each set piece and the start
+    of the set piece, and brings the events to the filtered frames and times. The mapping between the original
+    frames and the positions in the filtered data is kept in the original_frames and frame_positions attributes
+    of the match (see frame_positions and translate_frames).
+
+    Returns the removed time ranges, with the 'Join Frame' where the data was spliced after each range.
+    """
     print('Filtering dead time...\n')
     indices = match_object.events[match_object.events["Type"] == "SET PIECE"].index[1:]
     lower = match_object.events.iloc[indices-1]['End Time [s]']
     lower.index = indices
     upper = match_object.events.iloc[indices]['Start Time [s]']
     ranges = pd.concat([lower,upper], axis=1)
-    for period in ranges.iterrows():
-        match_object.tracking_home = match_object.tracking_home[~match_object.tracking_home['Time [s]'].between(period[1][0], period[1][1])]
-        match_object.tracking_away = match_object.tracking_away[~match_object.tracking_away['Time [s]'].between(period[1][0], period[1][1])]
-        # TODO: Dataframe with matched dead times steps
-
-    unreset_indices = match_object.tracking_home.index
-    match_object.tracking_home = match_object.tracking_home.reset_index(drop=True)
-    match_object.tracking_away = match_object.tracking_away.reset_index(drop=True)
-    dead_frames_reset_dict = dict(zip(unreset_indices, match_object.tracking_home.index))
-    match_object.events["Start Frame"] = match_object.events["Start Frame"].map(dead_frames_reset_dict)
-    match_object.events["End Frame"] = match_object.events["End Frame"].map(dead_frames_reset_dict)
-    match_object.events["Start Time [s]"] = (match_object.events["Start Frame"])*0.04
-    match_object.events["End Time [s]"] = (match_object.events["End Frame"])*0.04
-
-    match_object.tracking_home["Time [s]"] = match_object.tracking_home.index * 0.04
-    match_object.tracking_away["Time [s]"] = match_object.tracking_away.index * 0.04
-
-    match_object.tracking_home.index.name = "Frame"
-    match_object.tracking_away.index.name = "Frame"
+    dt = 1 / match_object.framerate
+
+    tracking_home = match_object.tracking_home
+    tracking_away = match_object.tracking_away
+    # Both teams share the frames, the mask is built once from the home times
+    times = tracking_home['Time [s]'].to_numpy()
+    kept = np.flatnonzero(~interval_mask(times, ranges.iloc[:, 0].to_numpy(), ranges.iloc[:, 1].to_numpy()))
+    unreset_indices = tracking_home.index[kept]
+    # position in the filtered data of the first frame after each removed range, where the data is spliced
+    # (-1 if the range did not remove any frame)
+    join_frames = np.searchsorted(times[kept], ranges.iloc[:, 1].values, side='right')
+    spliced = np.zeros(len(unreset_indices) + 1, dtype=bool)
+    spliced[1:-1] = np.diff(unreset_indices.values) > 1
+    ranges['Join Frame'] = np.where(spliced[join_frames], join_frames, -1)
+    tracking_home = tracking_home.iloc[kept].reset_index(drop=True)
+    tracking_away = tracking_away.iloc[kept].reset_index(drop=True)
+
+    match_object.original_frames = unreset_indices.to_numpy(dtype=np.int64)
+    match_object.frame_positions = frame_positions(match_object.original_frames)
+    match_object.events["Start Frame"] = translate_frames(match_object.events["Start Frame"], match_object.frame_positions)
+    match_object.events["End Frame"] = translate_frames(match_object.events["End Frame"], match_object.frame_positions)
+    match_object.events["Start Time [s]"] = (match_object.events["Start Frame"])*dt
+    match_object.events["End Time [s]"] = (match_object.events["End Frame"])*dt
+
+    tracking_home["Time [s]"] = tracking_home.index * dt
+    tracking_away["Time [s]"] = tracking_away.index * dt
+
+    tracking_home.index.name = "Frame"
+    tracking_away.index.name = "Frame"
+    match_object.tracking_home = tracking_home
+    match_object.tracking_away = tracking_away
     return ranges
 
+def possession_segments(events_df):
+    """
+    Table of the possessions of the match, one row per run of consecutive events of the same team, with its
+    'Start Time [s]' (start of the first event of the run), 'End Time [s]' (start of the first event of the next run)
+    and 'Team'. The changes of team are found with a single difference over the team codes of the events. The last
+    run of the match has no end and is not included.
+    """
+    teams = events_df['Team'].to_numpy()
+    codes = pd.factorize(teams)[0]
+    changes = np.ones(len(codes), dtype=bool)
+    changes[1:] = codes[1:] != codes[:-1]
+    starts = np.flatnonzero(changes)
+    times = events_df['Start Time [s]'].to_numpy(dtype=float)
+    return pd.DataFrame({'Start Time [s]': times[starts[:-1]],
+                         'End Time [s]': times[starts[1:]],
+                         'Team': teams[starts[:-1]]})
+
+def possession_frames(tracking_dataframe, segments, team = 'Home'):
+    """
+    Positions (integer arrays) of the frames of tracking_dataframe inside the possessions of team, and of the
+    remaining frames, from the table returned by possession_segments. All the possessions are selected at once
+    with a single interval mask, e.g. tracking_dataframe.iloc[possession] holds the frames in possession.
+    """
+    segments = segments[segments['Team'] == team]
+    mask = interval_mask(tracking_dataframe['Time [s]'].to_numpy(),
+                         segments['Start Time [s]'].to_numpy(),
+                         segments['End Time [s]'].to_numpy())
+    return np.flatnonzero(mask), np.flatnonzero(~mask)
+
 def possesion_filter(match_object, 
                      possesion_df=None, 
                      defense_df=None,
                      events_df=None, 
                      possesion_team = 'Home'):
-    if not possesion_df:
+    if possesion_df is None:
         if possesion_team == 'Home':
             possesion_df = match_object.tracking_home
         else:
             possesion_df = match_object.tracking_away
-    if not defense_df:
+    if defense_df is None:
         if possesion_team == 'Home':
             defense_df = match_object.tracking_away
         else:
             defense_df = match_object.tracking_home
-    if not events_df:
+    if events_df is None:
         events_df = match_object.events
-    
-    possesion = False
-    number_of_possesions = 0
-    possesions = {}
-
-    for index, row in events_df.iterrows():
-        if row['Team'] == possesion_team:
-            if not possesion:
-                number_of_possesions += 1
-                possesions[number_of_possesions] = [row['Start Time [s]']]
-                possesion = True
-        else:
-            if possesion:
-                possesions[number_of_possesions].append(row['Start Time [s]'])
-                possesion = False
-    
-    filtered_possesion = pd.DataFrame()
-    for value in possesions.values():
-        try:
-            filtered_possesion = filtered_possesion.append(possesion_df[possesion_df['Time [s]'].between(value[0],value[1], inclusive = 'both')])
-            defense_df = defense_df[~defense_df['Time [s]'].between(value[0],value[1], inclusive = 'both')]
-        except IndexError:
-            pass
-    return filtered_possesion, defense_df
+
+    segments = possession_segments(events_df)
+    possesion, _ = possession_frames(possesion_df, segments, possesion_team)
+    _, defense = possession_frames(defense_df, segments, possesion_team)
+    return possesion_df.iloc[possesion], defense_df.iloc[defense]
 
 def ball_position_filter(match_object, 
                      home_df=None, 
@@ -113,3 +239,142 @@ def ball_position_filter(match_object,
     
     return home_df, away_df
 
+
+class FrameSelection:
+    """
+    Boolean mask over the frames of a match, as returned by the predicates of FrameQuery. Selections combine with
+    & (and), | (or), ^ (xor) and ~ (not) without touching the tracking data, which is only indexed once with the
+    final selection: selection.select(match.tracking_home), or selection.indices for the integer positions.
+    """
+    def __init__(self, mask):
+        self.mask = np.asarray(mask, dtype=bool)
+
+    def __and__(self, other):
+        return FrameSelection(self.mask & other.mask)
+
+    def __or__(self, other):
+        return FrameSelection(self.mask | other.mask)
+
+    def __xor__(self, other):
+        return FrameSelection(self.mask ^ other.mask)
+
+    def __invert__(self):
+        return FrameSelection(~self.mask)
+
+    def __len__(self):
+        return len(self.mask)
+
+    def __array__(self, dtype=None):
+        return self.mask if dtype is None else self.mask.astype(dtype)
+
+    @property
+    def count(self):
+        return int(np.count_nonzero(self.mask))
+
+    @property
+    def indices(self):
+        return np.flatnonzero(self.mask)
+
+    def select(self, tracking_dataframe):
+        """
+        Selected frames of a tracking dataframe of the match (tracking_home or tracking_away).
+        """
+        return tracking_dataframe.iloc[self.indices]
+
+
+class FrameQuery:
+    """
+    Predicates over the frames of a match, each one evaluated once on the tracking tensor and cached, e.g. the frames
+    of the first period with the home team in possession and the ball in the last third:
+
+        query = match.query()
+        selection = query.period(1) & query.possession('Home') & query.ball_zone(left_bound=17.5)
+        home_df = selection.select(match.tracking_home)
+    """
+    # Masks kept, the least recently used are dropped first (a mask is a boolean per frame, ~145 KB per match)
+    max_masks = 64
+
+    def __init__(self, match_object, view = 'Home'):
+        self.match = match_object
+        self.view = view
+        self._masks = OrderedDict()
+        self._segments = None
+
+    def _cached(self, key, mask):
+        if key in self._masks:
+            self._masks.move_to_end(key)
+        else:
+            self._masks[key] = mask()
+            if len(self._masks) > self.max_masks:
+                self._masks.popitem(last=False)
+        return FrameSelection(self._masks[key])
+
+    def clear(self):
+        """
+        Drops the cached masks, e.g. when the tracking data of the match changes.
+        """
+        self._masks.clear()
+        self._segments = None
+
+    @property
+    def frame_data(self):
+        return self.match.tracking.frame_data[self.view]
+
+    @property
+    def times(self):
+        return self.frame_data['Time [s]'].to_numpy()
+
+    def all(self):
+        return FrameSelection(np.ones(len(self.frame_data), dtype=bool))
+
+    def period(self, period):
+        return self._cached(('period', period), lambda: self.frame_data['Period'].to_numpy() == period)
+
+    def time(self, start, end):
+        """
+        Frames with time in [start, end].
+        """
+        return self._cached(('time', start, end), lambda: (self.times >= start) & (self.times <= end))
+
+    def possession(self, team):
+        """
+        Frames in the possessions of team (see possession_segments).
+        """
+        def mask():
+            if self._segments is None:
+                self._segments = possession_segments(self.match.events)
+            segments = self._segments[self._segments['Team'] == team]
+            return interval_mask(self.times, segments['Start Time [s]'].to_numpy(), segments['End Time [s]'].to_numpy())
+        return self._cached(('possession', team), mask)
+
+    def ball_zone(self, left_bound = None, right_bound = None, top_bound = None, bottom_bound = None):
+        """
+        Frames with the ball inside the given bounds, as in ball_position_filter. Frames without ball are not selected.
+        """
+        def mask():
+            ball_x = self.match.tracking.get('ball', 'x', view=self.view)[:, 0]
+            ball_y = self.match.tracking.get('ball', 'y', view=self.view)[:, 0]
+            mask = ~(np.isnan(ball_x) | np.isnan(ball_y))
+            if left_bound is not None:
+                mask &= ball_x >= left_bound
+            if right_bound is not None:
+                mask &= ball_x <= right_bound
+            if top_bound is not None:
+                mask &= ball_y <= top_bound
+            if bottom_bound is not None:
+                mask &= ball_y >= bottom_bound
+            return mask
+        return self._cached(('ball_zone', left_bound, right_bound, top_bound, bottom_bound), mask)
+
+    def event(self, types, before = 0., after = 0., key = 'Type'):
+        """
+        Frames from before seconds ahead of the start to after seconds past the end of any event whose key column
+        ('Type' or 'Subtype') is in types, e.g. query.event('SHOT', before=10.) for the build-up of the shots.
+        """
+        types = [types] if isinstance(types, str) else list(types)
+        def mask():
+            events = self.match.events[self.match.events[key].isin(types)]
+            return interval_mask(self.times,
+                                 events['Start Time [s]'].to_numpy(dtype=float) - before,
+                                 events['End Time [s]'].to_numpy(dtype=float) + after)
+        return self._cached(('event', key, tuple(types), before, after), mask)
@@ -26,12 +26,17 @@ Example: function_name(data_source = 'metrica-sports')
 
 """
 
+import os
 import re
+import json
+import shutil
+import hashlib
 import pandas as pd
 import csv
 import numpy as np
 from Tracking_Constants import *
 import xml.etree.ElementTree as ET
+from io import StringIO
 
 def read_match_data(data_source, match_id, metadata_path, tracking_path, events_path, home_path, away_path):
 
@@ -76,6 +81,20 @@ def read_match_data(data_source, match_id, metadata_path, tracking_path, events_
 
     return tracking_home.truncate(before=kick_off_home), tracking_away.truncate(before=kick_off_away), events
 
+def match_data_paths(data_source, match_id, metadata_path, tracking_path, events_path, home_path, away_path):
+    """
+    Returns the list of input files read by read_match_data() for the given data source and match identifiers.
+    """
+    if data_source == "FCB":
+        paths = [metadata_path, tracking_path, events_path]
+    elif data_source in ["FCB_csv", "tactics"]:
+        paths = [home_path, away_path, events_path]
+    else:
+        DATADIR = get_datadir(data_source)
+        paths = [tracking_data_path(data_source, match_id, teamname) for teamname in ['Home', 'Away']]
+        paths.append('{}/{}'.format(DATADIR, f"/Sample_Game_{match_id}/Sample_Game_{match_id}_RawEventsData.csv"))
+    return [path for path in paths if path is not None]
+
 def get_datadir(source):
     if source == 'metrica-sports':
         DATADIR = '../data/MetricaSportsSampleData/data'
@@ -121,26 +140,99 @@ def tracking_data(data_source,game_id,teamname):
     Returns:
     tracking: Dataframe with the tracking data read from source.
     """
-    DATADIR = get_datadir(data_source)
+    if data_source == 'metrica-sports':
+        teamfile, columns = tracking_data_columns(data_source, game_id, teamname)
+        # Second: read in tracking data and place into pandas Dataframe
+        tracking = pd.read_csv(teamfile, names=columns, index_col='Frame', skiprows=3)
+    return tracking
+
+def tracking_data_columns(data_source, game_id, teamname):
+    """
+    Reads the headers of the tracking data file from given data source and match identifiers and returns
+    the path of the file and the column names, so that the file can be read at once or in blocks.
+
+    Parameters:
+
+    data_source (string): Identifier of the data source, must be chosen from the available:
+                            - 'metrica-sports'
 
+    match_id (int): Identifier of the match from the data source.
+
+    teamname (string): Name of the team to be read.
+
+    Returns:
+    teamfile, columns: Path of the tracking data file and list with its column names.
+    """
     if data_source == 'metrica-sports':
-        teamfile = f"/Sample_Game_{game_id}/Sample_Game_{game_id}_RawTrackingData_{teamname}_Team.csv"
+        teamfile = tracking_data_path(data_source, game_id, teamname)
         # First:  deal with file headers so that we can get the player names correct
-        csvfile =  open('{}/{}'.format(DATADIR, teamfile), 'r') # create a csv file reader
-        reader = csv.reader(csvfile) 
-        teamnamefull = next(reader)[3].lower()
-        print(f"Reading team: {teamnamefull}")
-        # construct column names
-        jerseys = [x for x in next(reader) if x != ''] # extract player jersey numbers from second row
-        columns = next(reader)
+        with open(teamfile, 'r') as csvfile:
+            reader = csv.reader(csvfile) # create a csv file reader
+            teamnamefull = next(reader)[3].lower()
+            print(f"Reading team: {teamnamefull}")
+            # construct column names
+            jerseys = [x for x in next(reader) if x != ''] # extract player jersey numbers from second row
+            columns = next(reader)
         for i, j in enumerate(jerseys): # create x & y position column headers for each player
             columns[i*2+3] = "{}_{}_x".format(teamname, j)
             columns[i*2+4] = "{}_{}_y".format(teamname, j)
         columns[-2] = "ball_x" # column headers for the x & y positions of the ball
         columns[-1] = "ball_y"
-        # Second: read in tracking data and place into pandas Dataframe
-        tracking = pd.read_csv('{}/{}'.format(DATADIR, teamfile), names=columns, index_col='Frame', skiprows=3)
-    return tracking
+    return teamfile, columns
+
+def tracking_data_path(data_source, game_id, teamname):
+    """
+    Returns the path of the tracking data file of a team from given data source and match identifiers.
+    """
+    DATADIR = get_datadir(data_source)
+    if data_source == 'metrica-sports':
+        teamfile = '{}/{}'.format(DATADIR, f"/Sample_Game_{game_id}/Sample_Game_{game_id}_RawTrackingData_{teamname}_Team.csv")
+    return teamfile
+
+def iter_tracking_data(data_source, game_id, teamname, chunk_size=CHUNK_FRAMES, max_memory=None, as_dataframe=True):
+    """
+    Generator version of tracking_data(). Reads the tracking data in blocks of at most chunk_size frames,
+    so that the whole match never needs to be held in memory. Blocks never span two periods.
+
+    Parameters:
+
+    data_source (string): Identifier of the data source, must be chosen from the available:
+                            - 'metrica-sports'
+
+    match_id (int): Identifier of the match from the data source.
+
+    teamname (string): Name of the team to be read.
+
+    chunk_size (int): Maximum number of frames per block.
+
+    max_memory (int): Optional memory ceiling in bytes for a block, it reduces chunk_size if needed.
+
+    as_dataframe (bool): Yield dataframes with the same columns as tracking_data() if True, otherwise
+                         yield (frames, values) NumPy arrays with the remaining columns in the same order.
+
+    Yields:
+    tracking: Dataframe (or frames and values arrays) with a block of the tracking data.
+    """
+    teamfile, columns = tracking_data_columns(data_source, game_id, teamname)
+    chunk_size = chunk_frames(chunk_size, max_memory, bytes_per_frame=8 * len(columns))
+
+    for chunk in pd.read_csv(teamfile, names=columns, index_col='Frame', skiprows=3, chunksize=chunk_size):
+        # Split the chunk where the period changes
+        breaks = np.flatnonzero(np.diff(chunk['Period'].values)) + 1
+        for first, last in zip(np.r_[0, breaks], np.r_[breaks, len(chunk)]):
+            block = chunk.iloc[first:last]
+            if as_dataframe:
+                yield block
+            else:
+                yield block.index.values, block.values
+
+def chunk_frames(chunk_size, max_memory, bytes_per_frame):
+    """
+    Number of frames per block given the requested chunk_size and an optional memory ceiling in bytes.
+    """
+    if max_memory:
+        chunk_size = min(chunk_size, max_memory // bytes_per_frame)
+    return max(1, int(chunk_size))
 
 def merge_tracking_data(home,away):
     """
@@ -222,6 +314,12 @@ def to_single_playing_direction(home,away,events):
 def find_players(team):
     return np.unique( [ c.split('_')[0]+'_'+c.split('_')[1] for c in team.columns if ('x' in c.split('_') and c.split('_')[0] != 'ball') ] )
 
+def find_framerate(team):
+    '''
+    Frames per second of the tracking data, from the median timestep between consecutive frames
+    '''
+    return round(1 / np.nanmedian(np.diff(team['Time [s]'].to_numpy(dtype=float))), 2)
+
 # Functions below not reviewed from the original Laurie Shaw's version.
 def find_playing_direction(team,teamname):
     '''
@@ -258,17 +356,24 @@ def find_goalkeeper_2(match):
     cols_to_plot = [s for s in tracking_all.columns.tolist() if (sub in s) & ("ball" not in s)]
     return 1
 
-def read_FCB_data(metadata_path, tracking_data_path, events_path):
-    """
-    This function takes the path of the metadata, tracking data and event data and returns them as pandas dataframes.
+def read_FCB_metadata(metadata_path):
     """
-    df = pd.DataFrame()
-    df.index.name = "Frame"
-    df["Time [s]"] = np.nan
+    Parses the EPTS/FIFA metadata XML of the FCB tracking data. The channel-to-column mapping of every
+    DataFormatSpecification part is resolved once here, so that the tracking lines can be tokenized
+    without walking the XML again.
 
-    tree = ET.parse(metadata_path)
-    root = tree.getroot()
-    game_parts = root.findall('.//DataFormatSpecification')
+    Parameters:
+
+    metadata_path (string): Path of the metadata XML file.
+
+    Returns:
+    metadata: Dictionary with the 'framerate', the 'game_parts_frame' tuple (first_half_start, first_half_end,
+              second_half_start, second_half_end), the ordered output 'columns' and the resolved 'parts'.
+              Each part holds its 'start_frame', 'end_frame', the frame 'separator', all the 'separators' of the
+              line, the number of tokens 'n_tokens', the token positions to read 'tokens' and their output
+              columns 'targets'.
+    """
+    root = ET.parse(metadata_path).getroot()
 
     game_parts_path = ".//Metadata/GlobalConfig/ProviderGlobalParameters/ProviderParameter/"
     game_parts_frame = (int(root.findtext(game_parts_path + "Name[.='first_half_start']../Value")),
@@ -278,59 +383,189 @@ def read_FCB_data(metadata_path, tracking_data_path, events_path):
 
     framerate = float(root.findtext(".//Metadata/GlobalConfig/FrameRate"))
 
-    # Open file
+    parts = []
+    player_columns = []
+    ball_columns = []
+    # Channels are resolved once per part, the players on the pitch only change between parts
+    for game_part in root.findall('.//DataFormatSpecification'):
+        # Every leaf of the specification is one token of the line once all the separators are unified
+        leaves = [leaf for leaf in game_part.iter() if leaf.tag in ['StringRegister', 'PlayerChannelRef', 'BallChannelRef']]
+        separators = {game_part.attrib['separator']} | {register.attrib['separator'] for register in game_part.iter('SplitRegister')}
+
+        players_data_format = list(list(game_part)[1])
+        shirts = [int(list(player)[0].attrib['playerChannelId'].split("_")[0].strip("player")) for player in players_data_format]
+        shirts.sort()
+        home_shirts = shirts[:11]
+
+        tokens = []
+        names = []
+        for token, leaf in enumerate(leaves):
+            if leaf.tag == 'PlayerChannelRef':
+                shirt_number, channel = leaf.attrib['playerChannelId'].split("_", 1)
+                if channel not in ['x', 'y']:
+                    continue
+                shirt_number = shirt_number.strip("player")
+                team = "Home" if int(shirt_number) in home_shirts else "Away"
+                name = f"{team}_{shirt_number}_{channel}"
+                if name not in player_columns:
+                    player_columns.append(name)
+            elif leaf.tag == 'BallChannelRef':
+                name = "ball_" + leaf.attrib['channelId']
+                if name not in ball_columns:
+                    ball_columns.append(name)
+            else:
+                continue
+            tokens.append(token)
+            names.append(name)
+        parts.append({'start_frame': int(game_part.attrib['startFrame']),
+                      'end_frame': int(game_part.attrib['endFrame']),
+                      'separator': game_part.attrib['separator'],
+                      'separators': separators,
+                      'n_tokens': len(leaves),
+                      'tokens': tokens,
+                      'names': names})
+
+    columns = ["Time [s]", "Period"] + player_columns + ball_columns
+    column_index = {column: index for index, column in enumerate(columns)}
+    for part in parts:
+        part['targets'] = [column_index[name] for name in part.pop('names')]
+
+    return {'framerate': framerate,
+            'game_parts_frame': game_parts_frame,
+            'columns': columns,
+            'parts': parts}
+
+def parse_FCB_lines(lines, metadata, out=None):
+    """
+    Tokenizes raw EPTS/FIFA tracking lines (frame:player;player;...:ball:...) into a NumPy array with the
+    column layout given by read_FCB_metadata(). Each part of the game is parsed with a single vectorized
+    read_csv call instead of one assignment per value.
 
-    file = open(tracking_data_path, mode="r")
-    line = file.readline().split(":") 
+    Parameters:
 
-    part = 0
-    end_frame = int(game_parts[part].attrib['endFrame'])
-    players_data_format = game_parts[part].getchildren()[1].getchildren()
-    shirts = [int(player.getchildren()[0].attrib['playerChannelId'].split("_")[0].strip("player")) for player in players_data_format]
-    shirts.sort()
-    home_shirts = shirts[:11]
-    away_shirts = shirts[11:]
+    lines: List of tracking lines (strings) sorted by frame, without empty lines.
 
-    while line[0] is not '\n':
-        frame = int(line[0])
-        if frame <= game_parts_frame[2]:
-            df.loc[frame, "Period"] = 1
-        else:
-            df.loc[frame, "Period"] = 2
-
-        if frame < end_frame:
-            players_data = line[1].split(";")
-            for index, player in enumerate(players_data_format):
-                fields = player.getchildren()
-                for index_field, field in enumerate(fields[:2]):
-                    player_data = players_data[index].split(",")
-                    shirt_number = field.attrib['playerChannelId'].split("_")[0].strip("player")
-                    if int(shirt_number) in home_shirts:
-                        df.loc[frame, field.attrib['playerChannelId'].replace("player", "Home_")] = float(player_data[index_field])
-                    elif int(shirt_number) in away_shirts:
-                        df.loc[frame, field.attrib['playerChannelId'].replace("player", "Away_")] = float(player_data[index_field])
-
-            ball_data = line[2].split(',')
-            df.loc[frame, 'ball_x'] = float(ball_data[0])
-            df.loc[frame, 'ball_y'] = float(ball_data[1])
-        else:
-            part+=1
-            end_frame = int(game_parts[part].attrib['endFrame'])
-            players_data_format = game_parts[part].getchildren()[1].getchildren()
-            shirts = [int(player.getchildren()[0].attrib['playerChannelId'].split("_")[0].strip("player")) for player in players_data_format]
-            shirts.sort()
-            home_shirts = shirts[:11]
-            away_shirts = shirts[11:]
-        line = file.readline().split(":") 
-
-    df["Time [s]"] = df.index*1/framerate
-    home_tracking = df.loc[:,~df.columns.str.startswith('Away')]
-    away_tracking = df.loc[:,~df.columns.str.startswith('Home')]
+    metadata: Dictionary returned by read_FCB_metadata().
+
+    out: Optional preallocated float array of shape (len(lines), len(metadata['columns'])) to write into.
+
+    Returns:
+    frames, out: Array with the frame numbers of the lines and the array with the parsed values.
+    """
+    separator = metadata['parts'][0]['separator']
+    frames = np.fromiter((line[:line.index(separator)] for line in lines), dtype=np.int64, count=len(lines))
+
+    if out is None:
+        out = np.empty((len(lines), len(metadata['columns'])))
+    out.fill(np.nan)
+
+    framerate = metadata['framerate']
+    out[:, 0] = frames / framerate
+    out[:, 1] = np.where(frames < metadata['game_parts_frame'][2], 1, 2)
+
+    for part in metadata['parts']:
+        first = frames.searchsorted(part['start_frame'], side='left')
+        last = frames.searchsorted(part['end_frame'], side='right')
+        if first == last:
+            continue
+        block = "\n".join(lines[first:last])
+        for separator in part['separators']:
+            block = block.replace(separator, ',')
+        values = pd.read_csv(StringIO(block),
+                             header=None,
+                             names=range(part['n_tokens']),
+                             usecols=part['tokens'],
+                             dtype=np.float64)
+        out[first:last, part['targets']] = values.to_numpy()
+
+    return frames, out
+
+def read_FCB_data(metadata_path, tracking_data_path, events_path):
+    """
+    This function takes the path of the metadata, tracking data and event data and returns them as pandas dataframes.
+
+    The whole tracking file is read at once and tokenized into a preallocated array, with the channel to column
+    mapping of each DataFormatSpecification part resolved only once (see read_FCB_metadata).
+    """
+    metadata = read_FCB_metadata(metadata_path)
+
+    with open(tracking_data_path, mode="r") as file:
+        lines = file.read().splitlines()
+    # The file ends with an empty line
+    lines = [line for line in lines if line]
+
+    frames, values = parse_FCB_lines(lines, metadata)
+    home_tracking, away_tracking, df = FCB_dataframes(frames, values, metadata)
     
     events=df
     
     return home_tracking, away_tracking, events
 
+def FCB_dataframes(frames, values, metadata):
+    """
+    Builds the home, away and full tracking dataframes from the arrays returned by parse_FCB_lines().
+    """
+    df = pd.DataFrame(values, index=pd.Index(frames, name="Frame"), columns=metadata['columns'])
+    home_tracking = df.loc[:,~df.columns.str.startswith('Away')]
+    away_tracking = df.loc[:,~df.columns.str.startswith('Home')]
+    return home_tracking, away_tracking, df
+
+def iter_FCB_data(metadata_path, tracking_data_path, chunk_size=CHUNK_FRAMES, max_memory=None, as_dataframe=True):
+    """
+    Generator version of read_FCB_data(). Reads the tracking file line by line and yields blocks of at
+    most chunk_size frames with the final column schema, so that the whole match never needs to be held
+    in memory. Blocks never span the first_half_start, first_half_end, second_half_start or
+    second_half_end boundaries of the metadata.
+
+    Parameters:
+
+    metadata_path (string): Path of the metadata XML file.
+
+    tracking_data_path (string): Path of the tracking data file.
+
+    chunk_size (int): Maximum number of frames per block.
+
+    max_memory (int): Optional memory ceiling in bytes for a block (parsed values plus raw lines), it
+                      reduces chunk_size if needed.
+
+    as_dataframe (bool): Yield (home_tracking, away_tracking) dataframes as read_FCB_data() if True,
+                         otherwise yield (frames, values) NumPy arrays with the columns of
+                         read_FCB_metadata(metadata_path)['columns'].
+
+    Yields:
+    home_tracking, away_tracking: Dataframes (or frames and values arrays) with a block of the tracking data.
+    """
+    metadata = read_FCB_metadata(metadata_path)
+    separator = metadata['parts'][0]['separator']
+    first_half_start, first_half_end, second_half_start, second_half_end = metadata['game_parts_frame']
+    boundaries = sorted({first_half_start, first_half_end + 1, second_half_start, second_half_end + 1})
+
+    def block(lines):
+        frames, values = parse_FCB_lines(lines, metadata)
+        if as_dataframe:
+            return FCB_dataframes(frames, values, metadata)[:2]
+        return frames, values
+
+    lines = []
+    block_size = None
+    with open(tracking_data_path, mode="r") as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            frame = int(line[:line.index(separator)])
+            if block_size is None:
+                # Raw line plus its parsed values
+                block_size = chunk_frames(chunk_size, max_memory, bytes_per_frame=2 * len(line) + 8 * len(metadata['columns']))
+            if lines and (len(lines) >= block_size or frame >= block_end):
+                yield block(lines)
+                lines = []
+            if not lines:
+                block_end = next((boundary for boundary in boundaries if boundary > frame), np.inf)
+            lines.append(line)
+    if lines:
+        yield block(lines)
+
 def read_FCB_csv(home_path, away_path, events_path):
     home_tracking = pd.read_csv(home_path)
     away_tracking = pd.read_csv(away_path)
@@ -344,3 +579,172 @@ def read_tactics(home_path, away_path, events_path):
     away_tracking = pd.read_csv(away_path)
     events = pd.read_csv(events_path)
     return home_tracking, away_tracking, events
+
+def save_dataframe(df, path):
+    """
+    Saves a dataframe in a columnar binary layout inside the directory path. The columns sharing a numeric
+    dtype are stored together as a column-major .npy file, so that load_dataframe() can memory-map them and
+    only the columns in use are read from disk. Any other column is stored as text with a mask of nulls.
+
+    Parameters:
+
+    df: Dataframe to be saved.
+
+    path (string): Directory where the dataframe is saved, created if needed.
+    """
+    os.makedirs(path, exist_ok=True)
+    groups = {}
+    for column, dtype in df.dtypes.items():
+        groups.setdefault(dtype.str if dtype.kind in 'biuf' else 'text', []).append(column)
+
+    layout = {'columns': list(df.columns), 'index_name': df.index.name, 'blocks': []}
+    np.save(os.path.join(path, 'index.npy'), df.index.to_numpy())
+    for number, (kind, columns) in enumerate(groups.items()):
+        block = {'file': f'block_{number}.npy', 'columns': columns, 'kind': kind}
+        if kind == 'text':
+            nulls = df[columns].isna().to_numpy()
+            values = np.where(nulls, '', df[columns].to_numpy(dtype=object)).astype(str)
+            block['nulls'] = f'block_{number}_nulls.npy'
+            np.save(os.path.join(path, block['nulls']), np.asfortranarray(nulls))
+        else:
+            values = df[columns].to_numpy()
+        np.save(os.path.join(path, block['file']), np.asfortranarray(values))
+        layout['blocks'].append(block)
+
+    with open(os.path.join(path, 'layout.json'), 'w') as file:
+        json.dump(layout, file)
+
+def load_dataframe(path, mmap=True):
+    """
+    Loads a dataframe saved with save_dataframe().
+
+    Parameters:
+
+    path (string): Directory where the dataframe was saved.
+
+    mmap (bool): If True the numeric columns are memory-mapped (copy-on-write) instead of read, so that
+                 loading is immediate and only the columns in use are paged in.
+
+    Returns:
+    df: Dataframe with the same columns, dtypes and index as the saved one.
+    """
+    with open(os.path.join(path, 'layout.json'), 'r') as file:
+        layout = json.load(file)
+    mmap_mode = 'c' if mmap else None
+
+    index = pd.Index(np.load(os.path.join(path, 'index.npy')), name=layout['index_name'])
+    blocks = []
+    for block in layout['blocks']:
+        if block['kind'] == 'text':
+            values = np.load(os.path.join(path, block['file'])).astype(object)
+            values[np.load(os.path.join(path, block['nulls']))] = np.nan
+        else:
+            values = np.load(os.path.join(path, block['file']), mmap_mode=mmap_mode)
+        blocks.append(pd.DataFrame(values, index=index, columns=block['columns'], copy=False))
+
+    if not blocks:
+        return pd.DataFrame(index=index)
+    df = pd.concat(blocks, axis=1, copy=False)
+    if list(df.columns) != layout['columns']:
+        df = df[layout['columns']]
+    return df
+
+def save_graph_shards(graphs, path, shard_size=1000):
+    """
+    Saves a sequence of graphs (dictionaries of arrays, e.g. from Tracking_Statistics.rolling_pass_graphs) in
+    compressed .npz shards of shard_size graphs inside the directory path. Each array of a shard is the concatenation
+    of the arrays of its graphs along the first axis, with the offsets of every graph in '<key>_offsets' (scalars are
+    stacked instead), so that a shard is written and read as a handful of contiguous arrays instead of a file per graph.
+
+    Returns:
+    shards: List of the paths of the shards written.
+    """
+    os.makedirs(path, exist_ok=True)
+    shards = []
+    batch = []
+
+    def write(batch):
+        arrays = {}
+        for key in batch[0]:
+            values = [np.asarray(graph[key]) for graph in batch]
+            if all(value.ndim == 0 for value in values):
+                arrays[key] = np.stack(values)
+                continue
+            arrays[key] = np.concatenate(values)
+            arrays[f'{key}_offsets'] = np.concatenate([[0], np.cumsum([len(value) for value in values])])
+        shards.append(os.path.join(path, f'shard_{len(shards):05d}.npz'))
+        np.savez_compressed(shards[-1], **arrays)
+
+    for graph in graphs:
+        batch.append(graph)
+        if len(batch) == shard_size:
+            write(batch)
+            batch = []
+    if batch:
+        write(batch)
+    return shards
+
+def iter_graph_shards(path):
+    """
+    Yields the graphs saved with save_graph_shards() in the directory path, in the order they were saved.
+    """
+    for shard in sorted(name for name in os.listdir(path) if re.fullmatch(r'shard_\d+\.npz', name)):
+        with np.load(os.path.join(path, shard)) as data:
+            arrays = {key: data[key] for key in data.files}
+        keys = [key for key in arrays if not key.endswith('_offsets')]
+        key = keys[0]
+        n_graphs = len(arrays[f'{key}_offsets']) - 1 if f'{key}_offsets' in arrays else len(arrays[key])
+        for number in range(n_graphs):
+            graph = {}
+            for key in keys:
+                if f'{key}_offsets' in arrays:
+                    offsets = arrays[f'{key}_offsets']
+                    graph[key] = arrays[key][offsets[number]:offsets[number + 1]]
+                else:
+                    graph[key] = arrays[key][number]
+            yield graph
+
+def cache_key(paths, parameters):
+    """
+    Content address of a cached match: hash of the content of the input files and the (JSON serializable)
+    parameters used to build it.
+    """
+    key = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode())
+    for path in paths:
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                key.update(block)
+    return key.hexdigest()
+
+def cache_store(save, path):
+    """
+    Writes a cache entry calling save(directory) on a temporary directory which is then renamed to path,
+    so that an interrupted write never leaves a partial entry behind.
+    """
+    temporary_path = f"{path}.tmp-{os.getpid()}"
+    save(temporary_path)
+    try:
+        os.rename(temporary_path, path)
+    except OSError:
+        # The entry was written meanwhile by another process
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+def evict_cache(cache_dir, max_size, keep=None):
+    """
+    Deletes the least recently used entries of the cache directory until their total size on disk is below
+    max_size (in bytes). The entry keep is never deleted.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if not entry.is_dir() or '.tmp-' in entry.name:
+            continue
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(entry.path) for name in names)
+        entries.append((entry.stat().st_mtime, size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        if keep is not None and os.path.samefile(path, keep):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
@@ -1,51 +1,55 @@
+import warnings
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from Tracking_Constants import *
 from Tracking_Filters import time_window
+import Tracking_IO as io
 
 
 def bivariate_normal_distribution(tracking_data, players = None, ball = False, against = False):
+    """
+    Means, standard deviations and covariance ellipses of the positions of the players (or the ball) over the frames
+    of tracking_data, one row per player, with their mean velocities and distance covered. Players without any
+    normalized position in the frames are dropped. With against, only the statistics of the normalized positions
+    are computed (the opponents in the dataframe of a team only have normalized positions).
+
+    All the players are stacked in [frame, player] arrays, so every statistic is a single reduction over the frames.
+    """
     if ball:
         players = ['ball']
+    normx, normy = stack_columns(tracking_data, players, ['normx', 'normy'])
+    if ball:
         dist_stats = pd.DataFrame()
     else:
-        
-        for player in players:
-            if np.isnan(tracking_data[player + '_normx'].mean()): # Double mean calculation, maybe fix this
-                players = players[players != player]
+        playing = ~np.isnan(normx).all(axis=0)
+        players = np.asarray(players)[playing]
+        normx, normy = normx[:, playing], normy[:, playing]
         dist_stats = pd.DataFrame({'player_number': [player.split('_')[1] for player in players]})
         dist_stats['player'] = players
+    norm_means, norm_stds, norm_covariances = pair_statistics(normx, normy)
     if not against:
-        dist_stats['x_mean'] = [tracking_data[player+'_x'].mean() for player in players]
-        dist_stats['y_mean'] = [tracking_data[player+'_y'].mean() for player in players]
-        dist_stats['vx_mean'] = [tracking_data[player + '_vx'].mean() for player in players]
-        dist_stats['vy_mean'] = [tracking_data[player + '_vy'].mean() for player in players]
-        dist_stats['distance'] = [np.sqrt(tracking_data[player+'_x'].diff()**2+tracking_data[player+'_x'].diff()**2).sum() for player in players]
-    dist_stats['normx_mean'] = [tracking_data[player+'_normx'].mean() for player in players]
-    dist_stats['normy_mean'] = [tracking_data[player+'_normy'].mean() for player in players]
+        x, y, vx, vy = stack_columns(tracking_data, players, ['x', 'y', 'vx', 'vy'])
+        means, stds, covariances = pair_statistics(x, y)
+        dist_stats['x_mean'] = means[:, 0]
+        dist_stats['y_mean'] = means[:, 1]
+        with warnings.catch_warnings():
+            # Mean of the players without any velocity in the frames
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            dist_stats['vx_mean'] = np.nanmean(vx, axis=0)
+            dist_stats['vy_mean'] = np.nanmean(vy, axis=0)
+        dist_stats['distance'] = window_distance(tracking_data, players)
+    dist_stats['normx_mean'] = norm_means[:, 0]
+    dist_stats['normy_mean'] = norm_means[:, 1]
 
     if len(tracking_data) > 1:
         if not against:
-            cov_matrices = [tracking_data[[player+'_x',player+'_y']].cov() for player in players]
-            try:
-                values, vectors = np.linalg.eig(cov_matrices)
-                dist_stats['cov_x_std'] = np.sqrt(values[:,0])
-                dist_stats['cov_y_std'] = np.sqrt(values[:,1])
-                dist_stats['cov_angle'] = np.arctan(vectors[:,0,1]/vectors[:,0,0])
-            except:
-                pass
-            dist_stats['x_std'] = [tracking_data[player+'_x'].std() for player in players]
-            dist_stats['y_std'] = [tracking_data[player+'_y'].std() for player in players]
-        try:
-            cov_matrices = [tracking_data[[player+'_normx',player+'_normy']].cov() for player in players]
-            values, vectors = np.linalg.eig(cov_matrices)
-            dist_stats['cov_normx_std'] = np.sqrt(values[:,0])
-            dist_stats['cov_normy_std'] = np.sqrt(values[:,1])
-            dist_stats['cov_norm_angle'] = np.arctan(vectors[:,0,1]/vectors[:,0,0])
-        except:
-            pass
-        dist_stats['normx_std'] = [tracking_data[player+'_normx'].std() for player in players]
-        dist_stats['normy_std'] = [tracking_data[player+'_normy'].std() for player in players]
+            covariance_ellipses(dist_stats, covariances, '')
+            dist_stats['x_std'] = stds[:, 0]
+            dist_stats['y_std'] = stds[:, 1]
+        covariance_ellipses(dist_stats, norm_covariances, 'norm')
+        dist_stats['normx_std'] = norm_stds[:, 0]
+        dist_stats['normy_std'] = norm_stds[:, 1]
     else:
         if not against:
             dist_stats['cov_x_std'] = 0
@@ -61,6 +65,254 @@ def bivariate_normal_distribution(tracking_data, players = None, ball = False, a
 
     return dist_stats
 
+def stack_columns(tracking_data, players, channels):
+    """
+    Values of the channels of the players in tracking_data, one [frame, player] array per channel, read with a
+    single column selection.
+    """
+    columns = [f'{player}_{channel}' for channel in channels for player in players]
+    values = tracking_data[columns].to_numpy(dtype=float)
+    return np.split(values, len(channels), axis=1)
+
+def pair_statistics(x, y):
+    """
+    Means [player, 2] and standard deviations [player, 2] of the columns of x and y, shaped [frame, player], and
+    covariance matrices [player, 2, 2] of each (x, y) pair over the frames where both are valid. NaN values are
+    skipped and the standard deviations and covariances use ddof=1 (NaN with less than two frames), as in pandas.
+    """
+    valid_x = ~np.isnan(x)
+    valid_y = ~np.isnan(y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n_x, mean_x, dx, var_x = centered_moments(x, valid_x)
+        n_y, mean_y, dy, var_y = centered_moments(y, valid_y)
+        means = np.column_stack([mean_x, mean_y])
+        stds = np.sqrt(np.column_stack([var_x, var_y]))
+        if (valid_x == valid_y).all():
+            # Coordinates missing together, the covariances share the frames of the variances
+            n = n_x
+            covxy = np.einsum('ij,ij->j', dx, dy) / (n - 1)
+        else:
+            valid = valid_x & valid_y
+            n, _, dx, var_x = centered_moments(x, valid)
+            _, _, dy, var_y = centered_moments(y, valid)
+            covxy = np.einsum('ij,ij->j', dx, dy) / (n - 1)
+        covariances = np.stack([np.column_stack([var_x, covxy]), np.column_stack([covxy, var_y])], axis=1)
+    covariances[n < 2] = np.nan
+    return means, stds, covariances
+
+def centered_moments(values, valid):
+    """
+    Number of valid values, mean, values centered on the mean (zero where not valid) and variance with ddof=1 (NaN
+    with less than two values) of each column of values [frame, player], over the valid values.
+    """
+    n = valid.sum(axis=0)
+    centered = np.where(valid, values, 0.)
+    mean = centered.sum(axis=0) / n
+    centered = np.where(valid, centered - mean, 0.)
+    variance = np.einsum('ij,ij->j', centered, centered) / (n - 1)
+    variance[n < 2] = np.nan
+    return n, mean, centered, variance
+
+def window_distance(tracking_data, players):
+    """
+    Distance covered by each player in the frames of tracking_data, as the difference of the last and first values
+    of the cumulative '_distance' columns. Falls back to adding up the steps between frames if they are missing.
+    """
+    if len(tracking_data) == 0:
+        return np.zeros(len(players))
+    columns = [player + '_distance' for player in players]
+    if all(column in tracking_data.columns for column in columns):
+        distance = tracking_data[columns].to_numpy()
+        return distance[-1] - distance[0]
+    return [np.sqrt(tracking_data[player+'_x'].diff()**2+tracking_data[player+'_y'].diff()**2).sum() for player in players]
+
+# Coordinate pairs indexed by MomentIndex, by family
+MOMENT_FAMILIES = {'': ('x', 'y'), 'norm': ('normx', 'normy'), 'v': ('vx', 'vy')}
+
+class MomentIndex:
+    """
+    Prefix sums of the moments (valid count, sum of x, y, x^2, y^2 and xy) of the raw, normalized and velocity
+    coordinates of every player and the ball of a tracking dataframe, so that the statistics of
+    bivariate_normal_distribution over any time window are computed from two rows of the index instead of
+    aggregating the frames of the window, e.g. by the sliders of the dashboards:
+
+        moments = MomentIndex(match.tracking_home)
+        dist_stats = moments.stats(600., 900., match.home_players)
+
+    The sums are stored at the boundaries of blocks of block frames (plus the frames of the window outside
+    whole blocks, read from the dataframe), which keeps the index small while the cost of a window does not grow with
+    its length. The values are centered on the mean of each column before they are accumulated, so that the variances
+    do not lose precision on long matches. Frames are counted for a pair of coordinates when both are valid.
+    """
+    def __init__(self, tracking_data, block = 25):
+        self.block = block
+        self.n_frames = len(tracking_data)
+        self.times = tracking_data['Time [s]'].to_numpy()
+        n_blocks = self.n_frames // block
+        self.entities = {}
+        self.columns = {}
+        self.shifts = {}
+        self.prefix = {}
+        entities = list(dict.fromkeys(column.rsplit('_', 1)[0] for column in tracking_data.columns
+                                      if column.endswith('_x') or column.endswith('_normx')))
+        for family, (x_key, y_key) in MOMENT_FAMILIES.items():
+            self.entities[family] = {}
+            self.columns[family] = []
+            shifts = []
+            sums = []
+            for entity in entities:
+                if f'{entity}_{x_key}' not in tracking_data.columns or f'{entity}_{y_key}' not in tracking_data.columns:
+                    continue
+                # columns of the dataframe in their own dtype, views of the dataframe rather than copies, for the
+                # frames outside whole blocks; the moments are computed in float64 (see _moments)
+                x = tracking_data[f'{entity}_{x_key}'].to_numpy()
+                y = tracking_data[f'{entity}_{y_key}'].to_numpy()
+                with warnings.catch_warnings():
+                    # Players that never play have no mean
+                    warnings.simplefilter('ignore', category=RuntimeWarning)
+                    shift = np.nan_to_num(np.array([np.nanmean(x), np.nanmean(y)]))
+                self.entities[family][entity] = len(self.columns[family])
+                self.columns[family].append((x, y))
+                shifts.append(shift)
+                moments = self._moments(x[:n_blocks * block], y[:n_blocks * block], shift)
+                sums.append(moments.reshape(n_blocks, block, 6).sum(axis=1))
+            self.shifts[family] = np.array(shifts).reshape(-1, 2)
+            prefix = np.zeros((n_blocks + 1, len(sums), 6))
+            if sums:
+                np.cumsum(np.stack(sums, axis=1), axis=0, out=prefix[1:])
+            self.prefix[family] = prefix
+        self.distances = {entity: tracking_data[f'{entity}_distance'].to_numpy()
+                          for entity in entities if f'{entity}_distance' in tracking_data.columns}
+
+    @staticmethod
+    def _moments(x, y, shift):
+        """
+        Moments of every frame, shaped [frame, 6], zero for the frames without both coordinates.
+        """
+        valid = ~(np.isnan(x) | np.isnan(y))
+        dx = np.where(valid, np.asarray(x, dtype=float) - shift[0], 0.)
+        dy = np.where(valid, np.asarray(y, dtype=float) - shift[1], 0.)
+        return np.column_stack([valid, dx, dy, dx * dx, dy * dy, dx * dy])
+
+    def rows(self, start, end):
+        """
+        First and last (excluded) positions of the frames with time in [start, end].
+        """
+        return np.searchsorted(self.times, start, side='left'), np.searchsorted(self.times, end, side='right')
+
+    def moments(self, family, entities, first, last):
+        """
+        Moments of the given entities over the frames first:last, shaped [entity, 6], from the prefix sums of the
+        whole blocks inside the window and the frames at its edges.
+        """
+        positions = [self.entities[family][entity] for entity in entities]
+        first_block = -(-first // self.block)
+        last_block = last // self.block
+        if first_block > last_block:
+            edges = [(first, last)]
+            sums = np.zeros((len(positions), 6))
+        else:
+            edges = [(first, first_block * self.block), (last_block * self.block, last)]
+            sums = self.prefix[family][last_block, positions] - self.prefix[family][first_block, positions]
+        for begin, stop in edges:
+            if stop > begin:
+                for row, position in enumerate(positions):
+                    x, y = self.columns[family][position]
+                    sums[row] += self._moments(x[begin:stop], y[begin:stop], self.shifts[family][position]).sum(axis=0)
+        return sums
+
+    def distributions(self, family, entities, first, last):
+        """
+        Means [entity, 2], standard deviations [entity, 2] and covariance matrices [entity, 2, 2] (with ddof=1, NaN
+        for less than two frames) of the given entities over the frames first:last.
+        """
+        n, sx, sy, sxx, syy, sxy = self.moments(family, entities, first, last).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.column_stack([sx, sy]) / n[:, None] + self.shifts[family][[self.entities[family][entity] for entity in entities]]
+            varx = np.maximum(sxx - sx * sx / n, 0.) / (n - 1)
+            vary = np.maximum(syy - sy * sy / n, 0.) / (n - 1)
+            covxy = (sxy - sx * sy / n) / (n - 1)
+        varx[n < 2] = vary[n < 2] = covxy[n < 2] = np.nan
+        covariances = np.stack([np.column_stack([varx, covxy]), np.column_stack([covxy, vary])], axis=1)
+        return means, np.sqrt(np.column_stack([varx, vary])), covariances
+
+    def distance(self, entities, first, last):
+        """
+        Distance covered by each entity over the frames first:last, as window_distance.
+        """
+        if last <= first:
+            return np.zeros(len(entities))
+        return np.array([float(self.distances[entity][last - 1]) - float(self.distances[entity][first])
+                         for entity in entities])
+
+    def stats(self, start, end, players = None, ball = False, against = False):
+        """
+        Same dataframe as bivariate_normal_distribution(time_window(tracking_data, start, end), players, ball, against).
+        """
+        first, last = self.rows(start, end)
+        if ball:
+            players = ['ball']
+        norm_means, norm_stds, norm_covariances = self.distributions('norm', players, first, last)
+        if ball:
+            dist_stats = pd.DataFrame()
+        else:
+            playing = ~np.isnan(norm_means[:, 0])
+            players = np.asarray(players)[playing]
+            norm_means, norm_stds, norm_covariances = norm_means[playing], norm_stds[playing], norm_covariances[playing]
+            dist_stats = pd.DataFrame({'player_number': [player.split('_')[1] for player in players]})
+            dist_stats['player'] = players
+        if not against:
+            means, stds, covariances = self.distributions('', players, first, last)
+            dist_stats['x_mean'] = means[:, 0]
+            dist_stats['y_mean'] = means[:, 1]
+            velocities = self.distributions('v', players, first, last)[0]
+            dist_stats['vx_mean'] = velocities[:, 0]
+            dist_stats['vy_mean'] = velocities[:, 1]
+            dist_stats['distance'] = self.distance(players, first, last)
+        dist_stats['normx_mean'] = norm_means[:, 0]
+        dist_stats['normy_mean'] = norm_means[:, 1]
+
+        if last - first > 1:
+            if not against:
+                covariance_ellipses(dist_stats, covariances, '')
+                dist_stats['x_std'] = stds[:, 0]
+                dist_stats['y_std'] = stds[:, 1]
+            covariance_ellipses(dist_stats, norm_covariances, 'norm')
+            dist_stats['normx_std'] = norm_stds[:, 0]
+            dist_stats['normy_std'] = norm_stds[:, 1]
+        else:
+            if not against:
+                dist_stats['cov_x_std'] = 0
+                dist_stats['cov_y_std'] = 0
+                dist_stats['cov_angle'] = 0
+                dist_stats['x_std'] = 0
+                dist_stats['y_std'] = 0
+            dist_stats['cov_normx_std'] = 0
+            dist_stats['cov_normy_std'] = 0
+            dist_stats['cov_norm_angle'] = 0
+            dist_stats['normx_std'] = 0
+            dist_stats['normy_std'] = 0
+
+        return dist_stats
+
+def covariance_ellipses(dist_stats, cov_matrices, norm_key = ''):
+    """
+    Adds the axes ('cov_x_std', 'cov_y_std') and angle ('cov_angle') of the ellipses of the covariance matrices
+    [player, 2, 2] to dist_stats, or the 'cov_normx_std', 'cov_normy_std' and 'cov_norm_angle' columns for the
+    normalized coordinates (norm_key='norm'). All the matrices are decomposed with a single batched eigh, the first
+    axis is the minor one and the angle is the direction of the first axis. Players without a defined matrix get NaN.
+    """
+    defined = ~np.isnan(cov_matrices).any(axis=(1, 2))
+    values = np.full((len(cov_matrices), 2), np.nan)
+    vectors = np.full((len(cov_matrices), 2, 2), np.nan)
+    if defined.any():
+        values[defined], vectors[defined] = np.linalg.eigh(cov_matrices[defined])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dist_stats[f'cov_{norm_key}x_std'] = np.sqrt(np.maximum(values[:,0], 0))
+        dist_stats[f'cov_{norm_key}y_std'] = np.sqrt(np.maximum(values[:,1], 0))
+        dist_stats['cov_norm_angle' if norm_key else 'cov_angle'] = np.arctan(vectors[:,1,0]/vectors[:,0,0])
+    return dist_stats
+
 def histogram(tracking_data, 
               players=None, 
               ball=False, 
@@ -71,26 +323,26 @@ def histogram(tracking_data,
               return_dicts = True,
               **kwargs):
     if ball:
-        if normalised:
-            positions_x = tracking_data['ball_normx']
-            positions_y = tracking_data['ball_normy']
-        else:
-            positions_x = tracking_data['ball_x']
-            positions_y = tracking_data['ball_y']
-    else:
-        positions_x = pd.Series(dtype='float')
-        positions_y = pd.Series(dtype='float')
-        if normalised:
-            for player in players:
-                positions_x = pd.concat([positions_x, tracking_data[player + '_normx']])
-                positions_y = pd.concat([positions_y, tracking_data[player + '_normy']])
-        else:
-            for player in players:
-                positions_x = pd.concat([positions_x, tracking_data[player + '_x']])
-                positions_y = pd.concat([positions_y, tracking_data[player + '_y']])
+        players = ['ball']
+    positions_x, positions_y = stack_columns(tracking_data, players, ['normx', 'normy'] if normalised else ['x', 'y'])
+    half_width, half_height, binsx, binsy = histogram_bins(normalised, field_dimen, binsx, binsy)
+
+    xhist, xedges = np.histogram(positions_x.ravel(), range = (-half_width,half_width), bins=binsx, **kwargs)
+    yhist, yedges = np.histogram(positions_y.ravel(), range = (-half_height,half_height), bins=binsy, **kwargs)
+    return histogram_output(xhist, yhist, xedges, yedges, return_dicts)
+
+def histogram_bins(normalised=None, field_dimen=None, binsx=None, binsy=None):
+    """
+    Half width, half height and number of bins along x and y of the histograms of the positions: the given field
+    dimensions, +-4 for the normalized positions (100 bins) or the default pitch (one bin per meter).
+    """
     if field_dimen:
         half_width = field_dimen[0]/2
         half_height = field_dimen[1]/2
+        if not binsx:
+            binsx = int(field_dimen[0])
+        if not binsy:
+            binsy = int(field_dimen[1])
     elif normalised:
         half_width = 4
         half_height = 4
@@ -105,11 +357,430 @@ def histogram(tracking_data,
             binsx = int(FIELD_DIMENSIONS[0])
         if not binsy:
             binsy = int(FIELD_DIMENSIONS[1])
+    return half_width, half_height, binsx, binsy
 
-    xhist, xedges = np.histogram(positions_x, range = (-half_width,half_width), bins=binsx, **kwargs)
-    yhist, yedges = np.histogram(positions_y, range = (-half_height,half_height), bins=binsy, **kwargs)
+def histogram_output(xhist, yhist, xedges, yedges, return_dicts = True):
     if return_dicts:
         return {'top_x':xhist/xhist.max(), 'bottom_x':xhist*0, 'left_x':xedges[:-1], 'right_x':xedges[1:]}, {'right_y':yhist/yhist.max(), 'left_y':yhist*0, 'bottom_y':yedges[:-1], 'top_y':yedges[1:]}
     else:
         return xhist/xhist.max(), yhist/yhist.max(), xedges, yedges
-        
\ No newline at end of file
+
+def bin_indices(values, edges):
+    """
+    Bin of each value in the uniform bins given by edges, as np.histogram (the last bin includes the right edge),
+    or -1 for NaN values and values out of the edges.
+    """
+    bins = np.searchsorted(edges, values, side='right') - 1
+    bins[values == edges[-1]] = len(edges) - 2
+    bins[(bins < 0) | (bins > len(edges) - 2)] = -1
+    return bins
+
+class HistogramCube:
+    """
+    Occupancy counts of the positions (raw or normalized) of every player and the ball of a tracking dataframe,
+    binned once and summed up to every time bucket, so that the histograms of any time window and subset of players
+    are computed from two buckets instead of binning the frames of the window again, e.g. by the sliders of the
+    dashboards:
+
+        cube = HistogramCube(match.tracking_home)
+        home_x, home_y = cube.histogram(600., 900., match.home_players)
+        heatmap = cube.heatmap(600., 900., match.home_players)
+
+    The x and y marginals are accumulated every block frames and the 2D heatmaps, much larger, every heatmap_block
+    frames (and only once a heatmap is requested). The frames of a window outside whole buckets are counted from the
+    bins of each frame, kept as small integers.
+    """
+    def __init__(self, tracking_data, normalised = None, field_dimen = None, binsx = None, binsy = None,
+                 block = 250, heatmap_block = 1500):
+        self.block = block
+        self.heatmap_block = heatmap_block
+        self.times = tracking_data['Time [s]'].to_numpy()
+        half_width, half_height, self.binsx, self.binsy = histogram_bins(normalised, field_dimen, binsx, binsy)
+        self.xedges = np.linspace(-half_width, half_width, self.binsx + 1)
+        self.yedges = np.linspace(-half_height, half_height, self.binsy + 1)
+        key = 'norm' if normalised else ''
+        entities = [column.rsplit('_', 1)[0] for column in tracking_data.columns if column.rsplit('_', 1)[-1] == f'{key}x']
+        entities = [entity for entity in entities if f'{entity}_{key}y' in tracking_data.columns]
+        self.entities = {entity: position for position, entity in enumerate(entities)}
+        x, y = stack_columns(tracking_data, entities, [f'{key}x', f'{key}y'])
+        dtype = np.int16 if max(self.binsx, self.binsy) < 2**15 else np.int32
+        self.bins_x = bin_indices(x, self.xedges).astype(dtype)
+        self.bins_y = bin_indices(y, self.yedges).astype(dtype)
+        self.prefix_x = self._prefix(self.bins_x, self.binsx, block)
+        self.prefix_y = self._prefix(self.bins_y, self.binsy, block)
+        self.bins_xy = None
+        self.prefix_xy = None
+
+    @staticmethod
+    def _prefix(bins, n_bins, block):
+        """
+        Counts of each bin of every entity up to the start of each bucket of block frames, [bucket + 1, entity, bin].
+        """
+        n_blocks = len(bins) // block
+        n_entities = bins.shape[1]
+        bins = bins[:n_blocks * block]
+        valid = bins >= 0
+        buckets = np.broadcast_to((np.arange(n_blocks * block) // block)[:, None], bins.shape)
+        entities = np.broadcast_to(np.arange(n_entities)[None, :], bins.shape)
+        counts = np.bincount(((buckets * n_entities + entities) * n_bins + bins)[valid],
+                             minlength=n_blocks * n_entities * n_bins)
+        prefix = np.zeros((n_blocks + 1, n_entities, n_bins), dtype=np.int32)
+        np.cumsum(counts.reshape(n_blocks, n_entities, n_bins), axis=0, out=prefix[1:])
+        return prefix
+
+    @staticmethod
+    def _counts(prefix, bins, n_bins, block, positions, first, last):
+        """
+        Counts of each bin over the frames first:last of the given entities, from the buckets inside the window and
+        the frames at its edges.
+        """
+        first_block = -(-first // block)
+        last_block = last // block
+        if first_block > last_block:
+            edges = [(first, last)]
+            counts = np.zeros(n_bins, dtype=np.int64)
+        else:
+            edges = [(first, first_block * block), (last_block * block, last)]
+            counts = (prefix[last_block, positions] - prefix[first_block, positions]).sum(axis=0, dtype=np.int64)
+        for begin, stop in edges:
+            if stop > begin:
+                window = bins[begin:stop, positions]
+                counts += np.bincount(window[window >= 0], minlength=n_bins)
+        return counts
+
+    def rows(self, start, end):
+        """
+        First and last (excluded) positions of the frames with time in [start, end].
+        """
+        return np.searchsorted(self.times, start, side='left'), np.searchsorted(self.times, end, side='right')
+
+    def positions(self, players = None, ball = False):
+        return np.array([self.entities[entity] for entity in (['ball'] if ball else players)], dtype=int)
+
+    def marginals(self, start, end, players = None, ball = False):
+        """
+        Counts of the x and y positions of the players (or the ball) with time in [start, end] in each bin.
+        """
+        first, last = self.rows(start, end)
+        positions = self.positions(players, ball)
+        return (self._counts(self.prefix_x, self.bins_x, self.binsx, self.block, positions, first, last),
+                self._counts(self.prefix_y, self.bins_y, self.binsy, self.block, positions, first, last))
+
+    def histogram(self, start, end, players = None, ball = False, return_dicts = True):
+        """
+        Same output as histogram(time_window(tracking_data, start, end), players, ball, normalised, ...).
+        """
+        xhist, yhist = self.marginals(start, end, players, ball)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return histogram_output(xhist, yhist, self.xedges, self.yedges, return_dicts)
+
+    def heatmap(self, start, end, players = None, ball = False):
+        """
+        Counts [binsx, binsy] of the positions of the players (or the ball) with time in [start, end] in each bin
+        of the 2D grid given by the edges xedges and yedges, as np.histogram2d.
+        """
+        if self.prefix_xy is None:
+            valid = (self.bins_x >= 0) & (self.bins_y >= 0)
+            self.bins_xy = np.where(valid, self.bins_x.astype(np.int32) * self.binsy + self.bins_y, -1)
+            self.prefix_xy = self._prefix(self.bins_xy, self.binsx * self.binsy, self.heatmap_block)
+        first, last = self.rows(start, end)
+        counts = self._counts(self.prefix_xy, self.bins_xy, self.binsx * self.binsy, self.heatmap_block,
+                              self.positions(players, ball), first, last)
+        return counts.reshape(self.binsx, self.binsy)
+
+# Columns of the passes averaged by the pass networks
+PASS_COLUMNS = ['Start Time [s]', 'End Time [s]', 'Start X', 'Start Y', 'End X', 'End Y']
+
+def pass_events(events, team = None):
+    """
+    Passes of the events (of the team, 'Home' or 'Away', if given) with both players, times and locations,
+    sorted by start time.
+    """
+    passes = events[events['Type'] == 'PASS']
+    if team is not None:
+        passes = passes[passes['From'].str.split('_').str[0] == team]
+    passes = passes.dropna(subset=['From', 'To'] + PASS_COLUMNS)
+    return passes.iloc[np.argsort(passes['Start Time [s]'].to_numpy(), kind='stable')]
+
+def player_passes(events, players):
+    """
+    Passes of the events between the given players (see pass_events), with the positions in players of their
+    senders and receivers. Passes of other players, e.g. without tracking data, are dropped.
+    """
+    player_index = {player: position for position, player in enumerate(players)}
+    passes = pass_events(events)
+    passes = passes[passes['From'].isin(player_index) & passes['To'].isin(player_index)]
+    return passes, passes['From'].map(player_index).to_numpy(dtype=int), passes['To'].map(player_index).to_numpy(dtype=int)
+
+class PassIndex:
+    """
+    Cumulative pass counts and sums of the pass locations of a team per (from, to) pair of players, along the passes
+    sorted by start time, so that the pass network of any time window is the difference of two rows of the index:
+
+        passes = PassIndex(match.events, 'Home')
+        network = passes.network(600., 900.)
+
+    Players are mapped to integers in lexicographic order (passes.players), a row of the index is a dense
+    [from, to] matrix. As in time_window, the passes of a window start and end within it. Passes without players,
+    times or locations are not indexed.
+    """
+    def __init__(self, events, team):
+        passes = pass_events(events, team)
+        self.players = np.array(sorted(set(passes['From']) | set(passes['To'])), dtype=object)
+        player_index = {player: position for position, player in enumerate(self.players)}
+        n_players = len(self.players)
+        self.pairs = (passes['From'].map(player_index).to_numpy(dtype=int) * n_players +
+                      passes['To'].map(player_index).to_numpy(dtype=int))
+        self.starts = passes['Start Time [s]'].to_numpy(dtype=float)
+        self.ends = passes['End Time [s]'].to_numpy(dtype=float)
+        self.values = passes[PASS_COLUMNS].to_numpy(dtype=float)
+        # longest pass, passes starting earlier than that before the end of a window also end before it
+        self.max_duration = np.max(self.ends - self.starts, initial=0.)
+        # passes ending before they start, not covered by the search on the start
+        self.reversed = np.flatnonzero(self.starts > self.ends)
+
+        rows = np.arange(1, len(self.pairs) + 1)
+        self.counts = np.zeros((len(self.pairs) + 1, n_players * n_players), dtype=np.int32)
+        self.counts[rows, self.pairs] = 1
+        np.cumsum(self.counts, axis=0, out=self.counts)
+        self.sums = np.zeros((len(self.pairs) + 1, n_players * n_players, len(PASS_COLUMNS)))
+        self.sums[rows, self.pairs] = self.values
+        np.cumsum(self.sums, axis=0, out=self.sums)
+
+    def matrices(self, start, end):
+        """
+        Number of passes [from, to] and sums of their PASS_COLUMNS [from, to, column] in the time window [start, end].
+        """
+        first = np.searchsorted(self.starts, start, side='left')
+        last = np.searchsorted(self.starts, end, side='right')
+        counts = self.counts[last] - self.counts[first] if last > first else np.zeros_like(self.counts[0])
+        sums = self.sums[last] - self.sums[first] if last > first else np.zeros_like(self.sums[0])
+        # passes starting in the window and ending after it
+        candidates = max(first, np.searchsorted(self.starts, end - self.max_duration, side='left'))
+        outside = candidates + np.flatnonzero(self.ends[candidates:last] > end)
+        # passes ending in the window before they start, after the window
+        inside = self.reversed[(self.starts[self.reversed] > end) & (self.ends[self.reversed] <= end)]
+        np.subtract.at(counts, self.pairs[outside], 1)
+        np.subtract.at(sums, self.pairs[outside], self.values[outside])
+        np.add.at(counts, self.pairs[inside], 1)
+        np.add.at(sums, self.pairs[inside], self.values[inside])
+        n_players = len(self.players)
+        return counts.reshape(n_players, n_players), sums.reshape(n_players, n_players, len(PASS_COLUMNS))
+
+    def network(self, start, end):
+        """
+        Passes between each pair of players in the time window [start, end], one row per pair sorted by 'From' and
+        'To', with the mean of the PASS_COLUMNS and the number of passes 'Freq'.
+        """
+        counts, sums = self.matrices(start, end)
+        senders, receivers = np.nonzero(counts)
+        network = pd.DataFrame({'From': self.players[senders], 'To': self.players[receivers]})
+        means = sums[senders, receivers] / counts[senders, receivers][:, None]
+        for position, column in enumerate(PASS_COLUMNS):
+            network[column] = means[:, position]
+        network['Freq'] = counts[senders, receivers]
+        return network
+
+class PassGraphs:
+    """
+    Pass networks of a match between the players on the pitch in any time window, as the weighted adjacency matrices
+    and the edge and node features taken by graph models. The passes are coded by their players and sorted by start
+    time, and the positions of the players are indexed by MomentIndex, once, so that a graph only takes a few binary
+    searches and bincounts:
+
+        graphs = PassGraphs(match)   # or match.pass_graphs()
+        adjacency, edges, nodes = graphs.graph(600., 900.)
+    """
+    def __init__(self, match_object):
+        self.home_players = np.asarray(match_object.home_players, dtype=object)
+        self.away_players = np.asarray(match_object.away_players, dtype=object)
+        self.players = np.concatenate([self.home_players, self.away_players])
+        passes, self.senders, self.receivers = player_passes(match_object.events, self.players)
+        self.starts = passes['Start Time [s]'].to_numpy(dtype=float)
+        self.ends = passes['End Time [s]'].to_numpy(dtype=float)
+        self.values = passes[PASS_COLUMNS].to_numpy(dtype=float)
+        # passes ending before they start, not covered by the search on the start
+        self.reversed = np.flatnonzero(self.starts > self.ends)
+        self.home_moments = MomentIndex(match_object.tracking_home)
+        self.away_moments = MomentIndex(match_object.tracking_away)
+
+    def passes(self, start, end):
+        """
+        Positions of the passes starting and ending within [start, end], as time_window.
+        """
+        first = np.searchsorted(self.starts, start, side='left')
+        last = np.searchsorted(self.starts, end, side='right')
+        rows = np.concatenate([np.arange(first, last), self.reversed[self.starts[self.reversed] > end]])
+        return rows[self.ends[rows] <= end]
+
+    def nodes(self, start, end):
+        """
+        Statistics of the players on the pitch in [start, end] (see bivariate_normal_distribution), the home players
+        from the home tracking data and the away players from the away tracking data, one row per node.
+        """
+        home_stats = self.home_moments.stats(start, end, self.home_players)
+        away_stats = self.away_moments.stats(start, end, self.away_players)
+        return pd.concat([home_stats, away_stats], ignore_index=True)
+
+    def graph(self, start, end):
+        """
+        Pass network of the time window [start, end].
+
+        Returns
+        -------
+            adjacency: scipy.sparse csr_matrix [node, node] with the number of passes between each pair of nodes.
+            edges: DataFrame with a row per stored value of the adjacency, in the same order: 'From' and 'To' nodes,
+                   the mean of the PASS_COLUMNS of their passes and the number of passes 'Freq'.
+            nodes: DataFrame with the statistics of the players on the pitch (see nodes), the nodes of the graph.
+        """
+        nodes = self.nodes(start, end)
+        n_nodes = len(nodes)
+        # node of each player of the match, -1 for the players not on the pitch
+        node_index = pd.Index(nodes['player']).get_indexer(self.players)
+        rows = self.passes(start, end)
+        senders = node_index[self.senders[rows]]
+        receivers = node_index[self.receivers[rows]]
+        on_pitch = (senders >= 0) & (receivers >= 0)
+        rows = rows[on_pitch]
+        # pairs in row-major order, the order of the values of a csr matrix
+        pairs, pair_index = np.unique(senders[on_pitch] * n_nodes + receivers[on_pitch], return_inverse=True)
+        counts = np.bincount(pair_index, minlength=len(pairs))
+        senders, receivers = np.divmod(pairs, n_nodes)
+        adjacency = sparse.csr_matrix((counts, (senders, receivers)), shape=(n_nodes, n_nodes))
+
+        edges = pd.DataFrame({'From': senders, 'To': receivers})
+        for position, column in enumerate(PASS_COLUMNS):
+            edges[column] = np.bincount(pair_index, weights=self.values[rows, position], minlength=len(pairs)) / counts
+        edges['Freq'] = counts
+        return adjacency, edges, nodes
+
+def pass_graph(match_object, start, end):
+    """
+    Pass network of the match in the time window [start, end] as (adjacency, edges, nodes), see PassGraphs.graph.
+    The passes and positions of the match are indexed on the first call and reused by the following ones.
+    """
+    return match_object.pass_graphs().graph(start, end)
+
+# Node features of the graphs of rolling_pass_graphs
+GRAPH_NODE_FEATURES = ['x_mean', 'y_mean', 'normx_mean', 'normy_mean']
+
+def window_means(tracking_data, entities, families, first, last):
+    """
+    Means of the coordinate pairs of the MOMENT_FAMILIES of the entities over the frames first[i]:last[i] of each
+    window, shaped [window, entity, 2 * family], NaN without any frame where both coordinates are valid, as
+    bivariate_normal_distribution. The frames are summed once, between consecutive window bounds, and the sums of
+    every window are the differences of their prefix sums, so overlapping windows do not sum their frames again.
+    """
+    bounds = np.unique(np.concatenate([first, last]))
+    first = np.searchsorted(bounds, first)
+    last = np.searchsorted(bounds, last)
+    means = []
+    for family in families:
+        x, y = stack_columns(tracking_data.iloc[:bounds[-1]], entities, MOMENT_FAMILIES[family])
+        valid = ~(np.isnan(x) | np.isnan(y))
+        prefix = np.zeros((len(bounds), len(entities), 3))
+        for position, values in enumerate([valid.astype(float), np.where(valid, x, 0.), np.where(valid, y, 0.)]):
+            if len(bounds) > 1:
+                np.cumsum(np.add.reduceat(values, bounds[:-1], axis=0), axis=0, out=prefix[1:, :, position])
+        sums = prefix[last] - prefix[first]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means.append(sums[:, :, 1:] / sums[:, :, :1])
+    return np.concatenate(means, axis=2)
+
+def rolling_pass_graphs(match_object, window_size, step_size):
+    """
+    Pass networks of the match over rolling time windows [start, start + window_size], with start moving by
+    step_size from the first frame while the window is within the match, e.g. to build a dataset for graph models.
+
+    All the windows are computed in a single sweep: the frames are summed once between window bounds (see
+    window_means) and the passes are assigned to every window they fall in at once, sorted by start time, before
+    their pairs of players are aggregated with a single bincount.
+
+    Yields
+    -------
+    graph : Dictionary per window with
+            'start', 'end': Bounds of the window.
+            'nodes': Positions in match_object.all_players of the players on the pitch, the nodes of the graph.
+            'x': [node, feature] GRAPH_NODE_FEATURES of the nodes.
+            'edge_index': [edge, 2] 'From' and 'To' nodes of each pair of players with passes, in row-major order.
+            'edge_weight': [edge] Number of passes of each pair.
+            'edge_attr': [edge, column] Mean of the PASS_COLUMNS of the passes of each pair.
+            'y': Mean position (x, y) of the ball.
+    """
+    tracking_home = match_object.tracking_home
+    tracking_away = match_object.tracking_away
+    times = tracking_home['Time [s]'].to_numpy()
+    n_windows = max(int(np.floor((times[-1] - times[0] - window_size) / step_size)) + 1, 0)
+    starts = times[0] + step_size * np.arange(n_windows)
+    ends = starts + window_size
+    first = np.searchsorted(times, starts, side='left')
+    last = np.searchsorted(times, ends, side='right')
+    if n_windows == 0:
+        return
+
+    players = np.concatenate([match_object.home_players, match_object.away_players])
+    features = np.concatenate([window_means(tracking_home, match_object.home_players, ['', 'norm'], first, last),
+                               window_means(tracking_away, match_object.away_players, ['', 'norm'], first, last)], axis=1)
+    ball = window_means(tracking_home, ['ball'], [''], first, last)[:, 0]
+    # players with normalized positions in the window, numbered in order as the nodes of its graph
+    on_pitch = ~np.isnan(features[:, :, GRAPH_NODE_FEATURES.index('normx_mean')])
+    node_index = np.where(on_pitch, np.cumsum(on_pitch, axis=1) - 1, -1)
+
+    passes, senders, receivers = player_passes(match_object.events, players)
+    pass_starts = passes['Start Time [s]'].to_numpy(dtype=float)
+    pass_ends = passes['End Time [s]'].to_numpy(dtype=float)
+    values = passes[PASS_COLUMNS].to_numpy(dtype=float)
+    # windows and passes of every pass starting in a window, as time_window
+    pass_first = np.searchsorted(pass_starts, starts, side='left')
+    pass_counts = np.searchsorted(pass_starts, ends, side='right') - pass_first
+    windows = np.repeat(np.arange(n_windows), pass_counts)
+    rows = np.arange(len(windows)) + np.repeat(pass_first - (np.cumsum(pass_counts) - pass_counts), pass_counts)
+    # passes ending before they start belong to the windows ending between their end and start
+    for row in np.flatnonzero(pass_starts > pass_ends):
+        reversed_windows = np.flatnonzero((ends >= pass_ends[row]) & (ends < pass_starts[row]))
+        windows = np.concatenate([windows, reversed_windows])
+        rows = np.concatenate([rows, np.full(len(reversed_windows), row)])
+    window_senders = node_index[windows, senders[rows]]
+    window_receivers = node_index[windows, receivers[rows]]
+    inside = (pass_ends[rows] <= ends[windows]) & (window_senders >= 0) & (window_receivers >= 0)
+
+    # pairs sorted by window and then in row-major order
+    n_players = len(players)
+    pairs, pair_index = np.unique((windows[inside] * n_players + window_senders[inside]) * n_players + window_receivers[inside],
+                                  return_inverse=True)
+    counts = np.bincount(pair_index, minlength=len(pairs))
+    means = np.column_stack([np.bincount(pair_index, weights=values[rows[inside], position], minlength=len(pairs))
+                             for position in range(len(PASS_COLUMNS))]) / counts[:, None]
+    pair_windows, pair_players = np.divmod(pairs, n_players * n_players)
+    edge_index = np.column_stack(np.divmod(pair_players, n_players))
+    edge_offsets = np.searchsorted(pair_windows, np.arange(n_windows + 1))
+
+    for window in range(n_windows):
+        nodes = np.flatnonzero(on_pitch[window])
+        edges = slice(edge_offsets[window], edge_offsets[window + 1])
+        yield {'start': starts[window],
+               'end': ends[window],
+               'nodes': nodes,
+               'x': features[window, nodes],
+               'edge_index': edge_index[edges],
+               'edge_weight': counts[edges],
+               'edge_attr': means[edges],
+               'y': ball[window]}
+
+def save_pass_graph_dataset(matches, window_size, step_size, path, shard_size = 1000):
+    """
+    Saves the rolling_pass_graphs of every match in .npz shards inside the directory path (see
+    Tracking_IO.save_graph_shards), with compact dtypes and the 'match_id' of each graph. Read them back with
+    Tracking_IO.iter_graph_shards(path).
+    """
+    def graphs():
+        for match_object in matches:
+            for graph in rolling_pass_graphs(match_object, window_size, step_size):
+                graph['match_id'] = match_object.match_id
+                graph['nodes'] = graph['nodes'].astype(np.uint8 if len(match_object.all_players) <= 256 else np.int32)
+                graph['edge_index'] = graph['edge_index'].astype(graph['nodes'].dtype)
+                graph['edge_weight'] = graph['edge_weight'].astype(np.int32)
+                for key in ['x', 'edge_attr', 'y']:
+                    graph[key] = graph[key].astype(np.float32)
+                yield graph
+    return io.save_graph_shards(graphs(), path, shard_size)
@@ -0,0 +1,253 @@
+"""
+Dense array representation of the tracking data of a match.
+
+The tracking dataframes of the project have one column per player and magnitude ('Home_11_x', 'Away_5_normvx',
+'ball_speed', ...). A TrackingTensor holds the same values in a single float32 array shaped [frame, entity, channel],
+with an entity index (home players, away players and the ball) and a channel index ('x', 'y', 'vx', ...), so that a
+whole team can be sliced with a single indexing operation instead of parsing column names.
+
+The home and away dataframes are two views of the same match: the absolute channels (positions, velocities, speed,
+accelerations, distance) are shared, while the channels computed relative to a team (normalized and center of mass
+magnitudes) differ. The latter are stored once per view, prefixed by the team of the view: 'Away_normx' is the x
+coordinate normalized in the frame of the away team. Absolute channels that differ between views (e.g. a ball tracked
+separately in each team file) are stored the same way. Any other column (Period, Time [s], team_* magnitudes) is kept
+per view in a small dataframe.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+import Tracking_IO as io
+
+# Channels that do not depend on the team taken as reference
+ABSOLUTE_CHANNELS = ['x', 'y', 'vx', 'vy', 'speed', 'ax', 'ay', 'acceleration', 'jerk', 'distance']
+TEAMS = ['Home', 'Away']
+
+
+def split_column(column):
+    """
+    Splits a tracking column name into its entity and channel, e.g. 'Home_11_normvx' -> ('Home_11', 'normvx').
+    Columns not referring to a player or the ball return None as entity.
+    """
+    fields = column.split('_')
+    if fields[0] in TEAMS and len(fields) > 2:
+        return fields[0] + '_' + fields[1], '_'.join(fields[2:])
+    if fields[0] == 'ball' and len(fields) > 1:
+        return 'ball', '_'.join(fields[1:])
+    return None, column
+
+
+class TrackingTensor:
+    def __init__(self, data, index, entities, channels, frame_data, layouts):
+        """
+        Parameters
+        -----------
+            data: float32 array shaped [frame, entity, channel].
+            index: Index of the frames (the index of the tracking dataframes).
+            entities: List of entity names ('Home_11', 'Away_5', 'ball') along the second axis of data.
+            channels: List of channel names ('x', 'vx', 'Home_normx', ...) along the third axis of data.
+            frame_data: Dictionary with a dataframe per view holding the columns that are not entity channels.
+            layouts: Dictionary with the ordered list of [column, entity, channel] of the dataframe of each view,
+                     entity and channel are None for the columns kept in frame_data.
+        """
+        self.data = data
+        self.index = index
+        self.entities = list(entities)
+        self.channels = list(channels)
+        self.frame_data = frame_data
+        self.layouts = layouts
+        self.entity_index = {entity: position for position, entity in enumerate(self.entities)}
+        self.channel_index = {channel: position for position, channel in enumerate(self.channels)}
+        self.teams = {team: np.array([position for position, entity in enumerate(self.entities)
+                                      if entity.split('_')[0] == team], dtype=int) for team in TEAMS + ['ball']}
+        # Tensor channel holding each (entity, column channel) of the dataframe of every view
+        self.view_channels = {view: {(entity, split_column(column)[1]): channel
+                                     for column, entity, channel in layout if entity is not None}
+                              for view, layout in self.layouts.items()}
+
+    @classmethod
+    def from_dataframes(cls, views):
+        """
+        Builds the tensor from the tracking dataframes of each view, e.g. {'Home': tracking_home, 'Away': tracking_away}.
+        All the dataframes must share the same index.
+        """
+        index = next(iter(views.values())).index
+        for view, df in views.items():
+            if not df.index.equals(index):
+                raise ValueError(f"The tracking dataframe of the {view} view does not have the same frames as the others.")
+
+        entities = []
+        channels = []
+        # Column of the first view holding each shared (entity, channel) series
+        shared = {}
+        frame_data = {}
+        layouts = {}
+        for view, df in views.items():
+            frame_columns = []
+            layouts[view] = []
+            for column in df.columns:
+                entity, channel = split_column(column)
+                if entity is None:
+                    frame_columns.append(column)
+                    layouts[view].append([column, None, None])
+                    continue
+                if channel in ABSOLUTE_CHANNELS:
+                    if (entity, channel) not in shared:
+                        shared[(entity, channel)] = df[column]
+                    elif not np.array_equal(shared[(entity, channel)].to_numpy(dtype=np.float32),
+                                            df[column].to_numpy(dtype=np.float32), equal_nan=True):
+                        channel = f"{view}_{channel}"
+                else:
+                    channel = f"{view}_{channel}"
+                if entity not in entities:
+                    entities.append(entity)
+                if channel not in channels:
+                    channels.append(channel)
+                layouts[view].append([column, entity, channel])
+            frame_data[view] = df[frame_columns].copy()
+
+        # Home players first, then away players and the ball
+        entities = sorted(entities, key=lambda entity: ['Home', 'Away', 'ball'].index(entity.split('_')[0]))
+        entity_index = {entity: position for position, entity in enumerate(entities)}
+        channel_index = {channel: position for position, channel in enumerate(channels)}
+
+        data = np.full((len(index), len(entities), len(channels)), np.nan, dtype=np.float32, order='F')
+        for view, df in views.items():
+            columns, view_entities, view_channels = zip(*[entry for entry in layouts[view] if entry[1] is not None])
+            data[:, [entity_index[entity] for entity in view_entities], [channel_index[channel] for channel in view_channels]] = \
+                df[list(columns)].to_numpy(dtype=np.float32)
+        return cls(data, index, entities, channels, frame_data, layouts)
+
+    @property
+    def views(self):
+        return list(self.layouts)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + sum(df.memory_usage(index=False).sum() for df in self.frame_data.values())
+
+    def entity_positions(self, entities):
+        """
+        Positions along the entity axis of a list of entity names, a single name, a team ('Home', 'Away') or 'ball'.
+        """
+        if isinstance(entities, str):
+            if entities in self.teams:
+                return self.teams[entities]
+            entities = [entities]
+        return np.array([self.entity_index[entity] for entity in entities], dtype=int)
+
+    def channel_positions(self, channels):
+        """
+        Positions along the channel axis of a list of tensor channel names ('x', 'Home_normx', ...) or a single name.
+        """
+        if isinstance(channels, str):
+            return self.channel_index[channels]
+        return np.array([self.channel_index[channel] for channel in channels], dtype=int)
+
+    def get(self, entities, channels, view=None):
+        """
+        Values of the given entities and channels. Returns an array shaped [frame, entity, channel], or
+        [frame, entity] when a single channel name is given.
+
+        Without view the channels are tensor channel names ('x', 'Home_normx'). With a view ('Home' or 'Away') they
+        are the channels of the columns of that view ('x', 'normx'), i.e. tensor.get('Away', 'normx', view='Home')
+        holds the same values as the 'Away_N_normx' columns of the home dataframe.
+        """
+        entity_positions = self.entity_positions(entities)
+        single = isinstance(channels, str)
+        channels = [channels] if single else list(channels)
+        if view is None:
+            values = self.data[:, entity_positions][:, :, self.channel_positions(channels)]
+        else:
+            view_channels = self.view_channels[view]
+            channel_positions = np.array([[self.channel_index[view_channels.get((self.entities[position], channel), channel)]
+                                           for channel in channels] for position in entity_positions], dtype=int)
+            values = self.data[:, entity_positions[:, None], channel_positions.reshape(len(entity_positions), len(channels))]
+        return values[:, :, 0] if single else values
+
+    def take(self, rows):
+        """
+        New tensor with the given frame positions (integer array or boolean mask).
+        """
+        rows = np.flatnonzero(rows) if np.asarray(rows).dtype == bool else np.asarray(rows)
+        return TrackingTensor(np.asfortranarray(self.data[rows]),
+                              self.index[rows],
+                              self.entities,
+                              self.channels,
+                              {view: df.iloc[rows] for view, df in self.frame_data.items()},
+                              self.layouts)
+
+    def to_dataframe(self, view):
+        """
+        Tracking dataframe of the view ('Home' or 'Away') with the same columns, in the same order, as the
+        dataframe the tensor was built from.
+        """
+        frame_data = self.frame_data[view]
+        # float columns, in a single array, and the other frame data columns inserted at their positions afterwards
+        inserted = [(position, column) for position, (column, entity, _) in enumerate(self.layouts[view])
+                    if entity is None and frame_data[column].dtype.kind != 'f']
+        layout = [entry for position, entry in enumerate(self.layouts[view]) if (position, entry[0]) not in inserted]
+        values = np.empty((len(self.index), len(layout)), order='F')
+        tensor_columns = []
+        entities = []
+        channels = []
+        for position, (column, entity, channel) in enumerate(layout):
+            if entity is None:
+                values[:, position] = frame_data[column].values
+                continue
+            tensor_columns.append(position)
+            entities.append(self.entity_index[entity])
+            channels.append(self.channel_index[channel])
+        values[:, tensor_columns] = self.data[:, entities, channels]
+
+        df = pd.DataFrame(values, index=self.index.copy(), columns=[column for column, _, _ in layout], copy=False)
+        for position, column in inserted:
+            df.insert(position, column, frame_data[column].values.copy())
+        return df
+
+    def holds(self, view, df):
+        """
+        Whether the dataframe has the columns, frames and values of the dataframe of the view, its float columns
+        compared in float32 as they are packed in the tensor.
+        """
+        expected = self.to_dataframe(view)
+        if df.equals(expected):
+            return True
+        if not (df.columns.equals(expected.columns) and df.index.equals(expected.index) and df.dtypes.equals(expected.dtypes)):
+            return False
+        floats = [column for column, dtype in expected.dtypes.items() if dtype.kind == 'f']
+        others = [column for column, dtype in expected.dtypes.items() if dtype.kind != 'f']
+        return (df[others].equals(expected[others])
+                and np.array_equal(df[floats].to_numpy(dtype=np.float32), expected[floats].to_numpy(dtype=np.float32),
+                                   equal_nan=True))
+
+    def save(self, path):
+        """
+        Saves the tensor in the directory path. The data array is stored column-major, so that every
+        [entity, channel] series is contiguous on disk and memory-mapping only pages in the series in use.
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'data.npy'), np.asfortranarray(self.data))
+        np.save(os.path.join(path, 'index.npy'), self.index.to_numpy())
+        for view, df in self.frame_data.items():
+            io.save_dataframe(df, os.path.join(path, f'frame_data_{view}'))
+        layout = {'index_name': self.index.name,
+                  'entities': self.entities,
+                  'channels': self.channels,
+                  'layouts': self.layouts}
+        with open(os.path.join(path, 'layout.json'), 'w') as file:
+            json.dump(layout, file)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a tensor saved with TrackingTensor.save(path), memory-mapping (copy-on-write) the data if mmap is True.
+        """
+        with open(os.path.join(path, 'layout.json'), 'r') as file:
+            layout = json.load(file)
+        data = np.load(os.path.join(path, 'data.npy'), mmap_mode='c' if mmap else None)
+        index = pd.Index(np.load(os.path.join(path, 'index.npy')), name=layout['index_name'])
+        frame_data = {view: io.load_dataframe(os.path.join(path, f'frame_data_{view}'), mmap=mmap) for view in layout['layouts']}
+        return cls(data, index, layout['entities'], layout['channels'], frame_data, layout['layouts'])
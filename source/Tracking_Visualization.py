@@ -13,7 +13,9 @@ from bokeh.io import output_notebook
 from bokeh.application import Application
 from bokeh.application.handlers import FunctionHandler
 
-from bokeh.models import FreehandDrawTool, TapTool, CheckboxGroup
+from bokeh.models import FreehandDrawTool, TapTool, CheckboxGroup, CustomJS, LinearColorMapper
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 import pandas as pd
 
 from Tracking_Constants import *
@@ -37,7 +39,8 @@ def draw_pitch(field_dimen=FIELD_DIMENSIONS,
                paraboloid_gradient=True,
                paraboloid_strength=1 / 5,
                stripes_number=7,
-               pixel_factor=10,
+               pixel_factor=None,
+               seed=0,
                axis_visible=False,
                extra_padding = False,
                **kwargs):
@@ -61,8 +64,10 @@ def draw_pitch(field_dimen=FIELD_DIMENSIONS,
         noise_strength:
         paraboloid_gradient:
         paraboloid_strength:
-        pixel_factor:
-        
+        pixel_factor: Pixels of the grass texture per meter. Default: size, the pixels of the figure per meter.
+        seed: Seed of the grass noise, None for new noise on every call. Textures of a seed (or without noise) are
+              computed once and cached.
+
     Returns
     -----------
        bokeh Figure : Returns a figure with a football pitch drawn on it.
@@ -96,21 +101,24 @@ def draw_pitch(field_dimen=FIELD_DIMENSIONS,
     else:
         p = fig
 
-    d = generate_grass_pattern(field_dimen,
-                               padding,
-                               pattern=pattern,
-                               noise=noise,
-                               stripes_number=stripes_number,
-                               noise_strength=noise_strength,
-                               paraboloid_gradient=paraboloid_gradient,
-                               paraboloid_strength=paraboloid_strength,
-                               pixel_factor=pixel_factor)
+    palette = linear_cmap(color_from=color_from, color_to=color_to)
+    d = grass_image(field_dimen,
+                    padding,
+                    pattern=pattern,
+                    noise=noise,
+                    stripes_number=stripes_number,
+                    noise_strength=noise_strength,
+                    paraboloid_gradient=paraboloid_gradient,
+                    paraboloid_strength=paraboloid_strength,
+                    pixel_factor=size if pixel_factor is None else pixel_factor,
+                    n_colors=len(palette),
+                    seed=seed)
     p.image(image=[d],
             x=-field_dimen[0] / 2 - padding,
             y=-field_dimen[1] / 2 - padding,
             dw=field_dimen[0] + 2 * padding,
             dh=field_dimen[1] + 2 * padding,
-            palette=linear_cmap(color_from=color_from, color_to=color_to),
+            color_mapper=LinearColorMapper(palette=palette, low=0, high=len(palette)),
             level="image",
             alpha=grass_alpha)
 
@@ -176,7 +184,8 @@ def generate_grass_pattern(field_dimen=FIELD_DIMENSIONS,
                            paraboloid_gradient=True,
                            paraboloid_strength=1 / 5,
                            stripes_number=7,
-                           pixel_factor=10):
+                           pixel_factor=10,
+                           seed=None):
     if pixel_factor > 50:
         raise ValueError('pixel_factor argument can\'t exceed 50')
     x = np.linspace(0, field_dimen[0], pixel_factor * int(field_dimen[0]))
@@ -185,7 +194,8 @@ def generate_grass_pattern(field_dimen=FIELD_DIMENSIONS,
     d = np.zeros(shape=xx.shape)
 
     if noise:
-        d += np.random.randint(0, noise_strength, xx.shape)
+        random = np.random if seed is None else np.random.RandomState(seed)
+        d += random.randint(0, noise_strength, xx.shape)
     if paraboloid_gradient:
         d -= ((xx - field_dimen[0] / 2) ** 2 + 5 * (yy - field_dimen[1] / 2) ** 2) * paraboloid_strength
 
@@ -206,6 +216,54 @@ def generate_grass_pattern(field_dimen=FIELD_DIMENSIONS,
     return d
 
 
+def grass_image(field_dimen=FIELD_DIMENSIONS,
+                padding=5,
+                pattern="stripes",
+                noise=True,
+                noise_strength=1000,
+                paraboloid_gradient=True,
+                paraboloid_strength=1 / 5,
+                stripes_number=7,
+                pixel_factor=10,
+                n_colors=40,
+                seed=None):
+    """ Grass pattern of generate_grass_pattern as an indexed uint8 image, to draw with a LinearColorMapper of n_colors
+    colors from low=0 to high=n_colors. Each pixel is the color a mapper over the range of the pattern would give it,
+    and the image is 8 times lighter to send to the browser.
+
+    Deterministic textures, with a seed or without noise, are computed once and cached by their parameters.
+
+    Returns
+    -------
+    image : Read-only 2D uint8 array.
+    """
+    parameters = (tuple(field_dimen), padding, pattern, noise, noise_strength, paraboloid_gradient, paraboloid_strength,
+                  stripes_number, pixel_factor, n_colors, seed)
+    if noise and seed is None:
+        return _grass_image.__wrapped__(*parameters)
+    return _grass_image(*parameters)
+
+
+@lru_cache(maxsize=16)
+def _grass_image(field_dimen, padding, pattern, noise, noise_strength, paraboloid_gradient, paraboloid_strength,
+                 stripes_number, pixel_factor, n_colors, seed):
+    d = generate_grass_pattern(field_dimen,
+                               padding,
+                               pattern=pattern,
+                               noise=noise,
+                               stripes_number=stripes_number,
+                               noise_strength=noise_strength,
+                               paraboloid_gradient=paraboloid_gradient,
+                               paraboloid_strength=paraboloid_strength,
+                               pixel_factor=pixel_factor,
+                               seed=seed)
+    low, high = d.min(), d.max()
+    scale = n_colors / (high - low) if high > low else 0
+    image = np.clip(np.floor((d - low) * scale), 0, n_colors - 1).astype(np.uint8)
+    image.flags.writeable = False
+    return image
+
+
 def linear_cmap(color_from=LOW_GRASS_COLOR, color_to=HIGH_GRASS_COLOR):
     """ Create a linear gradient from one color to another.
 
@@ -220,6 +278,301 @@ def linear_cmap(color_from=LOW_GRASS_COLOR, color_to=HIGH_GRASS_COLOR):
     return cmap
 
 
+def pass_network(pass_index, start, end, dist_stats, norm_key=''):
+    """ Pass network of a team in the time window [start, end], drawn between the mean positions of the players.
+
+    Parameters
+    -----------
+        pass_index: PassIndex of the team.
+        dist_stats: Distribution statistics of the players of the team in the window.
+        norm_key: '' or 'norm', prefix of the mean position columns of dist_stats.
+
+    Returns
+    -------
+    passes : DataFrame with a row per pair of players, as PassIndex.network, with the 'Alpha' of each edge and the
+             'Start X mean', 'Start Y mean', 'End X mean' and 'End Y mean' positions of the players.
+    """
+    passes = pass_index.network(start, end)
+    passes['Alpha'] = passes['Freq'] / passes['Freq'].max()
+    stats = dist_stats.set_index('player')
+    for position, players in [('Start', passes['From']), ('End', passes['To'])]:
+        passes[f"{position} X mean"] = stats[f'{norm_key}x_mean'].reindex(players).to_numpy()
+        passes[f"{position} Y mean"] = stats[f'{norm_key}y_mean'].reindex(players).to_numpy()
+    return passes
+
+
+def source_columns(data):
+    """ Columns of a DataFrame or of a dictionary of Series or arrays, as NumPy arrays owning their memory, so that later
+    patches of a ColumnDataSource never write into the tracking data.
+    """
+    if isinstance(data, pd.DataFrame):
+        data = ColumnDataSource.from_df(data)
+    return {name: np.array(values) for name, values in data.items()}
+
+
+def update_source(source, data):
+    """ Set the data of a ColumnDataSource sending only what changed to the browser.
+
+    Patches are sent as JSON, so only columns with a few changed rows are patched, by runs of consecutive rows. Columns
+    with more changed rows are replaced alone, as binary arrays. When the names, lengths or types of the columns
+    differ from the shown ones, the whole data is replaced.
+
+    Parameters
+    -----------
+        source: ColumnDataSource to update.
+        data: DataFrame or dictionary of columns, as accepted by source_columns.
+    """
+    data = source_columns(data)
+    shown = source.data
+    if set(data) != set(shown):
+        source.data = data
+        return
+    patches = {}
+    columns = {}
+    for name, values in data.items():
+        old = shown[name]
+        # patches write into the shown arrays, which must be ours
+        if not (isinstance(old, np.ndarray) and old.base is None and old.shape == values.shape
+                and old.dtype == values.dtype):
+            source.data = data
+            return
+        changed = old != values
+        if values.dtype.kind == 'f':
+            changed &= ~(np.isnan(old) & np.isnan(values))
+        rows = np.flatnonzero(changed)
+        if 4 * len(rows) > len(values):
+            columns[name] = values
+        elif len(rows):
+            # runs of consecutive rows
+            bounds = np.flatnonzero(np.diff(rows) > 1) + 1
+            patches[name] = [(slice(run[0], run[-1] + 1), values[run[0]:run[-1] + 1])
+                             for run in np.split(rows, bounds)]
+    if columns:
+        source.data.update(columns)
+    if patches:
+        source.patch(patches)
+
+
+class WindowSource:
+    """ ColumnDataSource showing columns of tracking data in a time window.
+
+    When the window moves forward and overlaps the shown one, only the new rows are streamed to the browser, with a
+    rollover dropping the old ones; otherwise the data is replaced.
+
+    Parameters
+    -----------
+        source: ColumnDataSource to update.
+        windows: TimeWindows of the tracking data.
+        columns: Dictionary of the names of the source columns to the tracking data columns they show.
+    """
+
+    def __init__(self, source, windows, columns):
+        self.source = source
+        self.windows = windows
+        self.columns = columns
+        self.values = None
+        self.rows = None
+        self.empty = True
+
+    def show(self, start, end):
+        """
+        Show the rows with time in [start, end].
+        """
+        if self.windows.times is None:
+            window = self.windows(start, end)
+            self.source.data = {name: window[column].to_numpy() for name, column in self.columns.items()}
+            self.empty = False
+            return
+        if self.values is None:
+            self.values = {name: self.windows.data[column].to_numpy() for name, column in self.columns.items()}
+        first, last = self.windows.rows(start, end)
+        if self.rows == (first, last):
+            return
+        if self.rows is not None and self.rows[0] <= first < self.rows[1] < last:
+            self.source.stream({name: values[self.rows[1]:last] for name, values in self.values.items()},
+                               rollover=last - first)
+        else:
+            self.source.data = {name: values[first:last].copy() for name, values in self.values.items()}
+        self.rows = (first, last)
+        self.empty = False
+
+    def clear(self):
+        """
+        Show no rows.
+        """
+        if not self.empty:
+            self.source.data = {name: [] for name in self.columns}
+        self.rows = None
+        self.empty = True
+
+
+# Worker threads of the dashboard callbacks, shared by all the dashboards and started on first use
+DASHBOARD_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='dashboard')
+
+
+class CoalescedCallback:
+    """ Widget callback of the Bokeh server computing its update in a worker thread.
+
+    request() reads the widgets on the document thread and returns the arguments of compute(*args), which runs in
+    the executor; apply(result) updates the models on the next tick of the document. A single computation runs at a
+    time: changes arriving meanwhile are coalesced into the latest one, computed once the running computation is
+    applied. While dragging a slider, the figure is thus redrawn every computation, at most two behind the slider.
+
+    Parameters
+    -----------
+        model: Model whose document is updated.
+        request, compute, apply: Functions described above.
+        executor: concurrent.futures executor running compute. Default: DASHBOARD_EXECUTOR.
+    """
+
+    def __init__(self, model, request, compute, apply, executor=None):
+        self.model = model
+        self.request = request
+        self.compute = compute
+        self.apply = apply
+        self.executor = DASHBOARD_EXECUTOR if executor is None else executor
+        self.pending = None
+        self.running = False
+
+    def __call__(self, attrname, old, new):
+        args = self.request()
+        document = self.model.document
+        if document is None:
+            self.apply(self.compute(*args))
+            return
+        self.pending = args
+        if not self.running:
+            self._submit(document)
+
+    def _submit(self, document):
+        args, self.pending = self.pending, None
+        self.running = True
+        future = self.executor.submit(self.compute, *args)
+        future.add_done_callback(lambda future: document.add_next_tick_callback(partial(self._done, document, future)))
+
+    def _done(self, document, future):
+        self.running = False
+        try:
+            self.apply(future.result())
+        finally:
+            if self.pending is not None:
+                self._submit(document)
+
+
+def team_update(window, players, moments, cube, against, sources, inst, passes=None, norm_key=''):
+    """ Callback of the sliding-window dashboards updating the statistics, histograms, trajectories and pass network of
+    a team.
+
+    Parameters
+    -----------
+        window: Function returning the (start, end) time window of the team.
+        players: Players of the team.
+        moments, cube: MomentIndex and HistogramCube of the tracking data the statistics are computed on.
+        against: Whether the statistics are computed against the other team, as in MomentIndex.stats.
+        sources: Dictionary of the 'stats', 'hist_x' and 'hist_y' ColumnDataSources of the team.
+        inst: Dictionary of the WindowSource of the trajectory of each player.
+        passes: Tuple of the PassIndex of the team, the ColumnDataSource and renderer of its pass network and the number
+                of passes of the widest edge, None without pass network.
+        norm_key: '' or 'norm', prefix of the mean position columns.
+
+    Returns
+    -------
+    callback : CoalescedCallback.
+    """
+    def request():
+        # Read the widgets on the document thread
+        start, end = window()
+        selected = [str(sources['stats'].data['player'][indice]) for indice in sources['stats'].selected.indices]
+        return start, end, selected, passes is not None and passes[2].visible
+
+    def compute(start, end, selected, show_passes):
+        dist_stats = moments.stats(start, end, players, against=against)
+        network = None
+        if show_passes:
+            pass_index, _, _, max_passes = passes
+            network = pass_network(pass_index, start, end, dist_stats, norm_key)
+            network['Line_Width'] = 15 * network['Freq'] / max_passes
+        hist = cube.histogram(start, end, selected if selected else players)
+        return start, end, selected, dist_stats.to_dict('series'), network, hist
+
+    def apply(result):
+        start, end, selected, dist_stats, network, (hist_x, hist_y) = result
+        if network is not None:
+            update_source(passes[1], network)
+        update_source(sources['stats'], dist_stats)
+        for player, player_inst in inst.items():
+            if player in selected:
+                player_inst.show(start, end)
+            else:
+                player_inst.clear()
+        update_source(sources['hist_x'], hist_x)
+        update_source(sources['hist_y'], hist_y)
+
+    return CoalescedCallback(sources['stats'], request, compute, apply)
+
+
+def ball_update(window, moments, home_windows, away_windows, events_windows, source, inst, center_of_mass=None,
+                scoreboard=None):
+    """ Callback of the sliding-window dashboards updating the ball statistics and trajectory, the centre of mass of the
+    teams and the scoreboard.
+
+    Parameters
+    -----------
+        window: Function returning the (start, end) time window of the ball, called on the document thread.
+        moments: MomentIndex of the ball statistics.
+        home_windows, away_windows, events_windows: TimeWindows of the tracking data and events.
+        source: ColumnDataSource of the ball statistics.
+        inst: WindowSource of the ball trajectory.
+        center_of_mass: Tuple of the ColumnDataSource and Label of the centre of mass of the teams, None to skip them.
+        scoreboard: Label of the score, None to skip it.
+
+    Returns
+    -------
+    callback : CoalescedCallback.
+    """
+    def request():
+        start, end = window()
+        return start, end, len(source.selected.indices) == 1
+
+    def compute(start, end, show_ball):
+        ball_dist_stats = moments.stats(start, end, ball=True).to_dict('series')
+        cm_data = cm_text = score = None
+        if center_of_mass is not None:
+            home_df = home_windows(start, end)
+            away_df = away_windows(start, end)
+            cm_df = pd.concat([home_df[["team_meanx", "team_meany"]].agg(['mean']),
+                               away_df[["team_meanx", "team_meany"]].agg(['mean'])])
+            cm_series = np.sqrt((np.sqrt((away_df[["team_meanx", "team_meany"]]
+                                          - home_df[["team_meanx", "team_meany"]]) ** 2) ** 2).sum(axis=1))
+            cm_distance = cm_series.mean()
+            std_distance = cm_series.std()
+            cm_text = f'd = ({cm_distance:.2f} ± {std_distance:.2f})m'
+            cm_data = cm_df.to_dict("series")
+        if scoreboard is not None:
+            events_df = events_windows(start, end)
+            away_goals = events_df[
+                    (events_df["Subtype"] == "ON TARGET-GOAL") & (events_df["Team"] == "Away")].shape[0]
+            home_goals = events_df[
+                (events_df["Subtype"] == "ON TARGET-GOAL") & (events_df["Team"] == "Home")].shape[0]
+            score = f'{home_goals}:{away_goals}'
+        return start, end, show_ball, ball_dist_stats, cm_data, cm_text, score
+
+    def apply(result):
+        start, end, show_ball, ball_dist_stats, cm_data, cm_text, score = result
+        update_source(source, ball_dist_stats)
+        if show_ball:
+            inst.show(start, end)
+        else:
+            inst.clear()
+        if cm_data is not None:
+            center_of_mass[1].text = cm_text
+            update_source(center_of_mass[0], cm_data)
+        if score is not None:
+            scoreboard.text = score
+
+    return CoalescedCallback(source, request, compute, apply)
+
+
 def plot_sliding_window(match_object,
                         filtered_home_df=None,
                         filtered_away_df=None,
@@ -293,112 +646,51 @@ def plot_sliding_window(match_object,
                                    format='00:00:00', show_value=False,
                                    bar_color='black', height=20)
     # Set up data
-    home_df = time_window(tracking_home,
-                          home_time_window.value[0],
-                          home_time_window.value[1])
-    away_df = time_window(tracking_away,
-                          away_time_window.value[0],
-                          away_time_window.value[1])
-    events_df = time_window(events,
-                            away_time_window.value[0],
-                            away_time_window.value[1])
+    home_windows = TimeWindows(tracking_home)
+    away_windows = TimeWindows(tracking_away)
+    events_windows = TimeWindows(events)
+    home_passes = PassIndex(events, 'Home')
+    away_passes = PassIndex(events, 'Away')
+    home_moments = MomentIndex(tracking_home)
+    away_moments = MomentIndex(tracking_away)
+    home_cube = HistogramCube(tracking_home, normalised=isinstance(normalized, str))
+    away_cube = HistogramCube(tracking_away, normalised=isinstance(normalized, str))
+    home_df = home_windows(home_time_window.value[0], home_time_window.value[1])
+    away_df = away_windows(away_time_window.value[0], away_time_window.value[1])
+    events_df = events_windows(away_time_window.value[0], away_time_window.value[1])
     if isinstance(normalized, str):
-        ball_dist_stats = bivariate_normal_distribution(home_df, ball=True)
+        ball_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], ball=True)
         if normalized == 'Home':
-            home_x, home_y = histogram(home_df, match_object.home_players, density=True, normalised=True)
-            away_x, away_y = histogram(home_df, match_object.away_players, density=True, normalised=True)
-            home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players)
-            away_dist_stats = bivariate_normal_distribution(home_df, match_object.away_players, against=True)
+            home_x, home_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+            away_x, away_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.away_players)
+            home_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+            away_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.away_players, against=True)
         elif normalized == 'Away':
-            home_x, home_y = histogram(away_df, match_object.home_players, density=True, normalised=True)
-            away_x, away_y = histogram(away_df, match_object.away_players, density=True, normalised=True)
-            away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players)
-            home_dist_stats = bivariate_normal_distribution(away_df, match_object.home_players, against=True)
+            home_x, home_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.home_players)
+            away_x, away_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            away_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            home_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.home_players, against=True)
         elif normalized == 'Both':
-            home_x, home_y = histogram(home_df, match_object.home_players, density=True, normalised=True)
-            away_x, away_y = histogram(away_df, match_object.away_players, density=True, normalised=True)
-            away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players)
-            home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players)
+            home_x, home_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+            away_x, away_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            away_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            home_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
         norm_key = 'norm'
         norm_key_angle = 'norm_'
     else:
-        ball_dist_stats = bivariate_normal_distribution(home_df, ball=True)
-        home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players)
-        away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players)
-        home_x, home_y = histogram(home_df, match_object.home_players, density=False)
-        away_x, away_y = histogram(away_df, match_object.away_players, density=False)
+        ball_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], ball=True)
+        home_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+        away_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+        home_x, home_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+        away_x, away_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
         norm_key = ''
         norm_key_angle = ''
     if pass_graph:
-        passes_home = events_df[
-            (events_df['Type'] == 'PASS') & (events_df["From"].str.split("_").str[0] == "Home")].groupby(['From',
-                                                                                                          'To',
-                                                                                                          'Start Time [s]',
-                                                                                                          'End Time [s]',
-                                                                                                          'Start X',
-                                                                                                          'Start Y',
-                                                                                                          'End X',
-                                                                                                          'End Y']).size().reset_index(
-            name="Freq")
-        passes_home = passes_home.groupby(['From', 'To']).sum().reset_index()
-        passes_home = passes_home.apply(lambda x: x / passes_home['Freq'] if x.name in ['Start Time [s]',
-                                                                                        'End Time [s]',
-                                                                                        'Start X',
-                                                                                        'End X',
-                                                                                        'Start Y',
-                                                                                        'End Y',
-                                                                                        ] else x)
-        passes_home['Alpha'] = passes_home['Freq'] / passes_home['Freq'].max()
+        passes_home = pass_network(home_passes, home_time_window.value[0], home_time_window.value[1], home_dist_stats, norm_key)
         max_passes_home = passes_home['Freq'].max()
-
-        passes_home["Start X mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                       player in
-                                       passes_home['From']]
-        passes_home["Start Y mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                       player in
-                                       passes_home['From']]
-        passes_home["End X mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                     player in
-                                     passes_home['To']]
-        passes_home["End Y mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                     player in
-                                     passes_home['To']]
-
-        passes_away = events_df[
-            (events_df['Type'] == 'PASS') & (events_df["From"].str.split("_").str[0] == "Away")].groupby(['From',
-                                                                                                          'To',
-                                                                                                          'Start Time [s]',
-                                                                                                          'End Time [s]',
-                                                                                                          'Start X',
-                                                                                                          'Start Y',
-                                                                                                          'End X',
-                                                                                                          'End Y']).size().reset_index(
-            name="Freq")
-        passes_away = passes_away.groupby(['From', 'To']).sum().reset_index()
-        passes_away = passes_away.apply(lambda x: x / passes_away['Freq'] if x.name in ['Start Time [s]',
-                                                                                        'End Time [s]',
-                                                                                        'Start X',
-                                                                                        'End X',
-                                                                                        'Start Y',
-                                                                                        'End Y',
-                                                                                        ] else x)
-
-        passes_away['Alpha'] = passes_away['Freq'] / passes_away['Freq'].max()
+        passes_away = pass_network(away_passes, away_time_window.value[0], away_time_window.value[1], away_dist_stats, norm_key)
         max_passes_away = passes_away['Freq'].max()
 
-        passes_away["Start X mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                       player in
-                                       passes_away['From']]
-        passes_away["Start Y mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                       player in
-                                       passes_away['From']]
-        passes_away["End X mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                     player in
-                                     passes_away['To']]
-        passes_away["End Y mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                     player in
-                                     passes_away['To']]
-
         max_passes = max(max_passes_home, max_passes_away)
 
         passes_home['Line_Width'] = 15 * passes_home['Freq'] / max_passes
@@ -431,11 +723,19 @@ def plot_sliding_window(match_object,
             color=match_object.away_color, line_color=match_object.away_color, alpha=0.5)
 
     sources_home = ColumnDataSource(data=home_dist_stats.to_dict('series'))
-    sources_home_inst = ColumnDataSource(data=dict(x=[], y=[]))
     sources_ball = ColumnDataSource(data=ball_dist_stats.to_dict('series'))
     sources_ball_inst = ColumnDataSource(data=dict(x=[], y=[]))
+    ball_inst = WindowSource(sources_ball_inst, home_windows, dict(x=f"ball_{norm_key}x", y=f"ball_{norm_key}y"))
     sources_away = ColumnDataSource(data=away_dist_stats.to_dict('series'))
-    sources_away_inst = ColumnDataSource(data=dict(x=[], y=[]))
+    # trajectories of the selected players, in the tracking data their distribution statistics are computed on
+    home_inst = {player: WindowSource(ColumnDataSource(data=dict(x=[], y=[])),
+                                      away_windows if normalized == 'Away' else home_windows,
+                                      dict(x=f"{player}_{norm_key}x", y=f"{player}_{norm_key}y"))
+                 for player in home_dist_stats['player'].astype(str)}
+    away_inst = {player: WindowSource(ColumnDataSource(data=dict(x=[], y=[])),
+                                      home_windows if normalized == 'Home' else away_windows,
+                                      dict(x=f"{player}_{norm_key}x", y=f"{player}_{norm_key}y"))
+                 for player in away_dist_stats['player'].astype(str)}
 
     renderer1 = plot.circle(f'{norm_key}x_mean', f'{norm_key}y_mean', source=sources_away, alpha=0.5, size=15,
                             color=match_object.away_color)
@@ -467,8 +767,10 @@ def plot_sliding_window(match_object,
         plot.add_layout(cm_distance_label)
     taptool.renderers = [renderer1, renderer2, renderer3, renderer4, renderer5]
 
-    plot.multi_line('x', 'y', source=sources_home_inst, color=match_object.home_color)
-    plot.multi_line('x', 'y', source=sources_away_inst, color=match_object.away_color)
+    for inst in home_inst.values():
+        plot.line('x', 'y', source=inst.source, color=match_object.home_color)
+    for inst in away_inst.values():
+        plot.line('x', 'y', source=inst.source, color=match_object.away_color)
     plot.line('x', 'y', source=sources_ball_inst, color='black')
 
     labels_home = LabelSet(x=f'{norm_key}x_mean', y=f'{norm_key}y_mean', text='player_number',
@@ -518,191 +820,39 @@ def plot_sliding_window(match_object,
 
         plot.add_layout(scoreboard)
 
-    def update_data_home(attrname, old, new):
-        # Get the current slider values
-        c = home_time_window
-        flag = False
-        if isinstance(normalized, str):
-            flag = True
-            if normalized == 'Home' or normalized == 'Both':
-                home_df = time_window(tracking_home, c.value[0], c.value[1])
-            elif normalized == 'Away':
-                home_df = time_window(tracking_away, c.value[0], c.value[1])
-        else:
-            home_df = time_window(tracking_home, c.value[0], c.value[1])
-
-        home_events_df = time_window(events, c.value[0], c.value[1])
-
-        home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players, against=flag)
-        if pass_graph:
-            if pass_network_home_renderer.visible:
-                passes_home = home_events_df[
-                    (home_events_df['Type'] == 'PASS') & (
-                            home_events_df["From"].str.split("_").str[0] == "Home")].groupby(['From',
-                                                                                              'To',
-                                                                                              'Start Time [s]',
-                                                                                              'End Time [s]',
-                                                                                              'Start X',
-                                                                                              'Start Y',
-                                                                                              'End X',
-                                                                                              'End Y']).size().reset_index(
-                    name="Freq")
-                passes_home = passes_home.groupby(['From', 'To']).sum().reset_index()
-                passes_home = passes_home.apply(lambda x: x / passes_home['Freq'] if x.name in ['Start Time [s]',
-                                                                                                'End Time [s]',
-                                                                                                'Start X',
-                                                                                                'End X',
-                                                                                                'Start Y',
-                                                                                                'End Y',
-                                                                                                ] else x)
-
-                passes_home['Alpha'] = passes_home['Freq'] / passes_home['Freq'].max()
-                passes_home['Line_Width'] = 15 * passes_home['Freq'] / max_passes
-
-                passes_home["Start X mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_home['From']]
-                passes_home["Start Y mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_home['From']]
-                passes_home["End X mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_home['To']]
-                passes_home["End Y mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_home['To']]
-                sources_home_passes.data = passes_home
-
-        sources_home.data = home_dist_stats.to_dict(
-            'series')
-        if len(sources_home.selected.indices) >= 1:
-            x = []
-            y = []
-            players = []
-            for indice in sources_home.selected.indices:
-                player = str(sources_home.data['player'][indice])
-                x.append(home_df[f"{player}_{norm_key}x"])
-                y.append(home_df[f"{player}_{norm_key}y"])
-                players.append(player)
-            sources_home_inst.data = dict(x=x, y=y)
-            source_home_hist_x.data, source_home_hist_y.data = histogram(home_df, players, density=True,
-                                                                         normalised=flag)
-        else:
-            sources_home_inst.data = dict(x=[], y=[])
-            source_home_hist_x.data, source_home_hist_y.data = histogram(home_df, match_object.home_players,
-                                                                         density=True, normalised=flag)
-
-    def update_data_away(attrname, old, new):
-        # Get the current slider values
-        c = away_time_window
-        flag = False
-        if isinstance(normalized, str):
-            flag = True
-            if normalized == 'Away' or normalized == 'Both':
-                away_df = time_window(tracking_away, c.value[0], c.value[1])
-            elif normalized == 'Home':
-                away_df = time_window(tracking_home, c.value[0], c.value[1])
-        else:
-            away_df = time_window(tracking_away, c.value[0], c.value[1])
-
-        away_events_df = time_window(events, c.value[0], c.value[1])
-
-        away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players, against=flag)
-        if pass_graph:
-            if pass_network_away_renderer.visible:
-                passes_away = away_events_df[
-                    (away_events_df['Type'] == 'PASS') & (
-                            away_events_df["From"].str.split("_").str[0] == "Away")].groupby(
-                    ['From',
-                     'To',
-                     'Start Time [s]',
-                     'End Time [s]',
-                     'Start X',
-                     'Start Y',
-                     'End X',
-                     'End Y']).size().reset_index(
-                    name="Freq")
-                passes_away = passes_away.groupby(['From', 'To']).sum().reset_index()
-                passes_away = passes_away.apply(lambda x: x / passes_away['Freq'] if x.name in ['Start Time [s]',
-                                                                                                'End Time [s]',
-                                                                                                'Start X',
-                                                                                                'End X',
-                                                                                                'Start Y',
-                                                                                                'End Y',
-                                                                                                ] else x)
-                passes_away['Alpha'] = passes_away['Freq'] / passes_away['Freq'].max()
-                passes_away['Line_Width'] = 15 * passes_away['Freq'] / max_passes
-
-                passes_away["Start X mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_away['From']]
-                passes_away["Start Y mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_away['From']]
-                passes_away["End X mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_away['To']]
-                passes_away["End Y mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_away['To']]
-                sources_away_passes.data = passes_away
-
-        sources_away.data = away_dist_stats.to_dict(
-            'series')
-        if len(sources_away.selected.indices) >= 1:
-            x = []
-            y = []
-            players = []
-            for indice in sources_away.selected.indices:
-                player = str(sources_away.data['player'][indice])
-                x.append(away_df[f"{player}_{norm_key}x"])
-                y.append(away_df[f"{player}_{norm_key}y"])
-                players.append(player)
-            sources_away_inst.data = dict(x=x, y=y)
-            source_away_hist_x.data, source_away_hist_y.data = histogram(away_df, players, density=True,
-                                                                         normalised=flag)
-        else:
-            sources_away_inst.data = dict(x=[], y=[])
-            source_away_hist_x.data, source_away_hist_y.data = histogram(away_df, match_object.away_players,
-                                                                         density=True, normalised=flag)
-
-    def update_data_ball(attrname, old, new):
-        # Get the current slider values
-        c = ball_time_window
-        home_time_window.value = c.value
-        away_time_window.value = c.value
-        home_df = time_window(tracking_home, c.value[0], c.value[1])
-        away_df = time_window(tracking_away, c.value[0], c.value[1])
-        events_df = time_window(events, c.value[0], c.value[1])
-        sources_ball.data = bivariate_normal_distribution(home_df, ball=True).to_dict('series')
-        if len(sources_ball.selected.indices) == 1:
-            sources_ball_inst.data = dict(x=home_df[f"ball_{norm_key}x"],
-                                          y=home_df[f"ball_{norm_key}y"])
-        else:
-            sources_ball_inst.data = dict(x=[], y=[])
-        if center_of_mass & (not normalized):
-            cm_df = pd.concat([home_df[["team_meanx", "team_meany"]].agg(['mean']),
-                               away_df[["team_meanx", "team_meany"]].agg(['mean'])])
-            cm_series = np.sqrt((np.sqrt((away_df[["team_meanx", "team_meany"]]
-                                          - home_df[["team_meanx", "team_meany"]]) ** 2) ** 2).sum(axis=1))
-            cm_distance = cm_series.mean()
-            std_distance = cm_series.std()
-            cm_distance_label.text = f'd = ({cm_distance:.2f} ± {std_distance:.2f})m'
-            cm_source.data = cm_df.to_dict("series")
-        if scoreboard:
-            away_goals = events_df[
-                    (events_df["Subtype"] == "ON TARGET-GOAL") & (events_df["Team"] == "Away")].shape[0]
-            home_goals = events_df[
-                (events_df["Subtype"] == "ON TARGET-GOAL") & (events_df["Team"] == "Home")].shape[0]
-            scoreboard.text = f'{home_goals}:{away_goals}'
+    # Recompute in a worker thread, keeping only the latest slider value while dragging
+    against = isinstance(normalized, str)
+    update_data_home = team_update(lambda: (home_time_window.value[0], home_time_window.value[1]),
+                                   match_object.home_players,
+                                   away_moments if normalized == 'Away' else home_moments,
+                                   away_cube if normalized == 'Away' else home_cube,
+                                   against,
+                                   dict(stats=sources_home, hist_x=source_home_hist_x, hist_y=source_home_hist_y),
+                                   home_inst,
+                                   (home_passes, sources_home_passes, pass_network_home_renderer, max_passes)
+                                   if pass_graph else None,
+                                   norm_key)
+    update_data_away = team_update(lambda: (away_time_window.value[0], away_time_window.value[1]),
+                                   match_object.away_players,
+                                   home_moments if normalized == 'Home' else away_moments,
+                                   home_cube if normalized == 'Home' else away_cube,
+                                   against,
+                                   dict(stats=sources_away, hist_x=source_away_hist_x, hist_y=source_away_hist_y),
+                                   away_inst,
+                                   (away_passes, sources_away_passes, pass_network_away_renderer, max_passes)
+                                   if pass_graph else None,
+                                   norm_key)
+
+    def ball_window():
+        # the team sliders follow the ball slider
+        home_time_window.value = ball_time_window.value
+        away_time_window.value = ball_time_window.value
+        return ball_time_window.value[0], ball_time_window.value[1]
+
+    update_data_ball = ball_update(ball_window, home_moments, home_windows, away_windows, events_windows,
+                                   sources_ball, ball_inst,
+                                   (cm_source, cm_distance_label) if center_of_mass & (not normalized) else None,
+                                   scoreboard if scoreboard else None)
 
     def update_checkbox(attrname, old, new):
         pass_network_home_renderer.visible = (0 in checkbox_group.active)
@@ -742,12 +892,65 @@ def plot_sliding_window(match_object,
     return inputs
 
 
+# Channels of the players and the ball drawn by play_match
+PLAYBACK_CHANNELS = ['x', 'y', 'vx', 'vy', 'normx', 'normy']
+
+
+class MatchPlayback:
+    """
+    Playback data model of play_match, built once per match from its tracking tensor: for each view ('Home' or
+    'Away') and team of the view ('Home', 'Away' or 'ball') a contiguous float32 array shaped [frame, entity, channel]
+    with the PLAYBACK_CHANNELS of the team (only 'normx' and 'normy' for the opponents, the only channels of the
+    view for them), and the player labels. A frame of the animation is then a row of each array.
+    """
+    def __init__(self, match_object):
+        tensor = match_object.tracking
+        self.times = tensor.frame_data['Home']['Time [s]'].to_numpy()
+        self.n_frames = len(self.times)
+        self.channels = {}
+        self.values = {}
+        self.labels = {}
+        for view in ['Home', 'Away']:
+            for team in ['Home', 'Away', 'ball']:
+                channels = PLAYBACK_CHANNELS if team in [view, 'ball'] else ['normx', 'normy']
+                entities = [tensor.entities[position] for position in tensor.entity_positions(team)
+                            if (tensor.entities[position], channels[0]) in tensor.view_channels[view]]
+                self.channels[(view, team)] = {channel: position for position, channel in enumerate(channels)}
+                self.values[(view, team)] = np.ascontiguousarray(tensor.get(entities, channels, view=view))
+                self.labels[(view, team)] = np.array([entity.split('_')[-1] for entity in entities])
+
+    def frame(self, view, team, k):
+        """
+        Data of the team in the view at frame position k for a ColumnDataSource: a NumPy array per channel, the end
+        of the velocity vectors ('end_vx', 'end_vy') of the team of the view and the player labels. Players off the
+        pitch have NaN positions, which are not drawn.
+        """
+        values = self.values[(view, team)][k]
+        data = {channel: values[:, position] for channel, position in self.channels[(view, team)].items()}
+        if team == view:
+            data['end_vx'] = data['vx'] + data['x']
+            data['end_vy'] = data['vy'] + data['y']
+        if team != 'ball':
+            data['player'] = self.labels[(view, team)]
+        return data
+
+
 def play_match(match_object,
                filtered_home_df=None,
                filtered_away_df=None,
                filtered_events=None,
                normalized=None,
+               client_side=False,
+               playback_window=None,
                **kwargs):
+    """
+    Plays the tracking data of the match on a pitch and on the normalized plots of both teams, with a slider over the
+    frames, play/pause and speed buttons, and a table of the events to seek to.
+
+    By default every frame is pushed to the browser by a Bokeh server application. With client_side the frames in
+    playback_window (start, end) [s], the whole match if None, are shipped once to the browser as float32 arrays and
+    the playback, speed changes and seeking run in JavaScript in a standalone document, without a server.
+    """
     # Set up plot
     plot = draw_pitch(tools=('tap', 'pan'), toolbar_location='left', **kwargs)
     norm_plot_home = figure(toolbar_location=None, width=int(plot.width / 2), height=int(plot.width / 2),
@@ -780,35 +983,25 @@ def play_match(match_object,
     plot.toolbar.active_drag = draw_tool
     taptool = plot.select(type=TapTool)[0]
 
-    frame_home = match_object.tracking_home.iloc[[0]]
-    frame_home.columns = frame_home.columns.str.rsplit(r'_', 1, expand=True)
-    home_df = frame_home.stack(0).droplevel(0).filter(like="Home", axis=0)
-    home_away_df = frame_home.stack(0).droplevel(0).filter(like="Away", axis=0)
-    home_away_df['player'] = home_away_df.index.str.split("_").str[1]
-    home_df['player'] = home_df.index.str.split("_").str[1]
-    home_df['end_vx'] = home_df['vx'] + home_df['x']
-    home_df['end_vy'] = home_df['vy'] + home_df['y']
-
-    frame_away = match_object.tracking_away.iloc[[0]]
-    frame_away.columns = frame_away.columns.str.rsplit(r'_', 1, expand=True)
-    away_df = frame_away.stack(0).droplevel(0).filter(like="Away", axis=0)
-    away_home_df = frame_away.stack(0).droplevel(0).filter(like="Home", axis=0)
-    away_home_df['player'] = away_home_df.index.str.split("_").str[1]
-    away_df['player'] = away_df.index.str.split("_").str[1]
-    away_df['end_vx'] = away_df['vx'] + away_df['x']
-    away_df['end_vy'] = away_df['vy'] + away_df['y']
-
-    ball_home_df = frame_home.stack(0).droplevel(0).filter(like="ball", axis=0)
-    ball_away_df = frame_away.stack(0).droplevel(0).filter(like="ball", axis=0)
-
-    sources_home = ColumnDataSource(data=home_df.to_dict('series'))
-    sources_away = ColumnDataSource(data=away_df.to_dict('series'))
-    sources_home_away = ColumnDataSource(data=home_away_df.to_dict('series'))
-    sources_away_home = ColumnDataSource(data=away_home_df.to_dict('series'))
-    sources_home_ball = ColumnDataSource(data=ball_home_df.to_dict('series'))
-    sources_away_ball = ColumnDataSource(data=ball_away_df.to_dict('series'))
-
-    sources_events = ColumnDataSource(time_window(match_object.events, 0 - 200, 0 + 200, frame=True).to_dict("Series"))
+    playback = MatchPlayback(match_object)
+    events_windows = TimeWindows(match_object.events)
+    if playback_window is None:
+        first, last = 0, playback.n_frames
+    else:
+        first = int(np.searchsorted(playback.times, playback_window[0], side='left'))
+        last = int(np.searchsorted(playback.times, playback_window[1], side='right'))
+
+    sources_home = ColumnDataSource(data=playback.frame('Home', 'Home', first))
+    sources_away = ColumnDataSource(data=playback.frame('Away', 'Away', first))
+    sources_home_away = ColumnDataSource(data=playback.frame('Home', 'Away', first))
+    sources_away_home = ColumnDataSource(data=playback.frame('Away', 'Home', first))
+    sources_home_ball = ColumnDataSource(data=playback.frame('Home', 'ball', first))
+    sources_away_ball = ColumnDataSource(data=playback.frame('Away', 'ball', first))
+
+    if client_side:
+        sources_events = ColumnDataSource(events_windows(playback.times[first], playback.times[last - 1]).to_dict("Series"))
+    else:
+        sources_events = ColumnDataSource(time_window(match_object.events, first - 200, first + 200, frame=True).to_dict("Series"))
 
     columns = [
         TableColumn(field="Team", title="Team"),
@@ -845,7 +1038,7 @@ def play_match(match_object,
     plot.segment(x0="x", y0="y", x1="end_vx", y1="end_vy", line_color=match_object.away_color, source=sources_away,
                  line_width=3)
 
-    freq = Slider(title="Game Time", value=0, start=0, end=len(match_object.tracking_home), step=1, width_policy='max')
+    freq = Slider(title="Game Time", value=first, start=first, end=last - 1, step=1, width_policy='max')
 
     labels_home = LabelSet(x='x', y='y', text='player',
                            source=sources_home, text_color="white",
@@ -875,90 +1068,143 @@ def play_match(match_object,
     norm_plot_home.add_layout(labels_home_away_norm)
     norm_plot_away.add_layout(labels_away_home_norm)
 
-    def update_data(attrname, old, new):
-        k = int(freq.value)
-
-        frame_home = match_object.tracking_home.iloc[[k]]
-        frame_home.columns = frame_home.columns.str.rsplit(r'_', 1, expand=True)
-        home_df = frame_home.stack(0).droplevel(0).filter(like="Home", axis=0)
-        home_away_df = frame_home.stack(0).droplevel(0).filter(like="Away", axis=0)
-        home_away_df['player'] = home_away_df.index.str.split("_").str[1]
-        home_df['player'] = home_df.index.str.split("_").str[1]
-        home_df['end_vx'] = home_df['vx'] + home_df['x']
-        home_df['end_vy'] = home_df['vy'] + home_df['y']
-
-        frame_away = match_object.tracking_away.iloc[[k]]
-        frame_away.columns = frame_away.columns.str.rsplit(r'_', 1, expand=True)
-        away_df = frame_away.stack(0).droplevel(0).filter(like="Away", axis=0)
-        away_home_df = frame_away.stack(0).droplevel(0).filter(like="Home", axis=0)
-        away_home_df['player'] = away_home_df.index.str.split("_").str[1]
-        away_df['player'] = away_df.index.str.split("_").str[1]
-        away_df['end_vx'] = away_df['vx'] + away_df['x']
-        away_df['end_vy'] = away_df['vy'] + away_df['y']
-
-        ball_home_df = frame_home.stack(0).droplevel(0).filter(like="ball", axis=0)
-        ball_away_df = frame_away.stack(0).droplevel(0).filter(like="ball", axis=0)
-
-        sources_home.data = home_df.to_dict('series')
-        sources_away.data = away_df.to_dict('series')
-        sources_home_ball.data = ball_home_df.to_dict('series')
-        sources_away_ball.data = ball_away_df.to_dict('series')
-        sources_home_away.data = home_away_df.to_dict('series')
-        sources_away_home.data = away_home_df.to_dict('series')
-
-        time = int(frame_home['Time [s]'].iloc[0])
-
-        sources_events.data = time_window(match_object.events, 0, time).to_dict("Series")
-
-    freq.on_change('value', update_data)
-
     button = Button(label='►', width=60)
     forward_button = Button(label='▸▸', width=60)
     backward_button = Button(label='◂◂', width=60)
 
-    global update_rate
-    update_rate = 1
+    if client_side:
+        # Frames of the window of every source, flattened [frame, entity, channel], and their times
+        groups = [('Home', 'Home'), ('Away', 'Away'), ('Home', 'ball'), ('Away', 'ball'), ('Home', 'Away'), ('Away', 'Home')]
+        sources = [sources_home, sources_away, sources_home_ball, sources_away_ball, sources_home_away, sources_away_home]
+        stores = [ColumnDataSource(data={'values': playback.values[group][first:last].ravel()}) for group in groups]
+        times = ColumnDataSource(data={'times': playback.times[first:last]})
+        channels = [list(playback.channels[group]) for group in groups]
+
+        draw_frame = CustomJS(args=dict(slider=freq, stores=stores, sources=sources, channels=channels), code="""
+            const k = Math.floor(slider.value) - slider.start
+            for (let g = 0; g < sources.length; g++) {
+                const values = stores[g].data['values']
+                const data = sources[g].data
+                const n_channels = channels[g].length
+                const n_entities = data[channels[g][0]].length
+                const offset = k * n_entities * n_channels
+                for (let c = 0; c < n_channels; c++) {
+                    const column = data[channels[g][c]]
+                    for (let e = 0; e < n_entities; e++)
+                        column[e] = values[offset + e * n_channels + c]
+                }
+                if ('end_vx' in data) {
+                    for (let e = 0; e < n_entities; e++) {
+                        data['end_vx'][e] = data['vx'][e] + data['x'][e]
+                        data['end_vy'][e] = data['vy'][e] + data['y'][e]
+                    }
+                }
+                sources[g].change.emit()
+            }
+        """)
+        freq.js_on_change('value', draw_frame)
+
+        # The playback state is kept on the play button, in the browser
+        button.js_on_click(CustomJS(args=dict(button=button, slider=freq), code="""
+            if (button.label == '►') {
+                button.label = '❚❚'
+                button._update_rate = 1
+                button._callback_id = setInterval(() => {
+                    let frame = slider.value + button._update_rate
+                    if (frame > slider.end)
+                        frame = slider.start
+                    slider.value = frame
+                }, 40)
+            } else {
+                button.label = '►'
+                clearInterval(button._callback_id)
+            }
+        """))
+        forward_button.js_on_click(CustomJS(args=dict(button=button), code="button._update_rate = (button._update_rate || 1) * 2"))
+        backward_button.js_on_click(CustomJS(args=dict(button=button), code="button._update_rate = (button._update_rate || 1) / 2"))
+
+        sources_events.selected.js_on_change('indices', CustomJS(args=dict(events=sources_events, times=times, slider=freq), code="""
+            if (events.selected.indices.length == 0)
+                return
+            const time = events.data['Start Time [s]'][events.selected.indices[0]]
+            const frame_times = times.data['times']
+            // Binary search of the closest frame
+            let low = 0
+            let high = frame_times.length - 1
+            while (low < high) {
+                const middle = (low + high) >> 1
+                if (frame_times[middle] < time)
+                    low = middle + 1
+                else
+                    high = middle
+            }
+            if (low > 0 && time - frame_times[low - 1] < frame_times[low] - time)
+                low -= 1
+            slider.value = slider.start + low
+        """))
+    else:
+        def update_data(attrname, old, new):
+            k = int(freq.value)
 
-    def animate_update():
-        frame = freq.value + update_rate
-        if frame > len(match_object.tracking_home):
-            frame = 0
-        freq.value = frame
+            sources_home.data = playback.frame('Home', 'Home', k)
+            sources_away.data = playback.frame('Away', 'Away', k)
+            sources_home_ball.data = playback.frame('Home', 'ball', k)
+            sources_away_ball.data = playback.frame('Away', 'ball', k)
+            sources_home_away.data = playback.frame('Home', 'Away', k)
+            sources_away_home.data = playback.frame('Away', 'Home', k)
 
-    def animate():
-        global callback_id
-        global update_rate
-        if button.label == '►':
-            button.label = '❚❚'
-            update_rate = 1
-            callback_id = curdoc().add_periodic_callback(animate_update, 40)
-        else:
-            button.label = '►'
-            curdoc().remove_periodic_callback(callback_id)
-            callback_id = None
+            time = int(playback.times[k])
 
-    def forward_update():
-        global update_rate
-        update_rate *= 2
+            sources_events.data = events_windows(0, time).to_dict("Series")
 
-    def backward_update():
-        global update_rate
-        update_rate /= 2
+        freq.on_change('value', update_data)
 
-    button.on_click(animate)
-    forward_button.on_click(forward_update)
-    backward_button.on_click(backward_update)
-
-    def select_event(attr, old, new):
-        selectionRowIndex = sources_events.selected.indices[0]
-        freq.value = match_object.tracking_home['Time [s]'].sub(
-            sources_events.data['Start Time [s]'][selectionRowIndex]).abs().idxmin()
-
-    sources_events.selected.on_change('indices', select_event)
+        global update_rate
+        update_rate = 1
+
+        def animate_update():
+            frame = freq.value + update_rate
+            if frame >= last:
+                frame = first
+            freq.value = frame
+
+        def animate():
+            global callback_id
+            global update_rate
+            if button.label == '►':
+                button.label = '❚❚'
+                update_rate = 1
+                callback_id = curdoc().add_periodic_callback(animate_update, 40)
+            else:
+                button.label = '►'
+                curdoc().remove_periodic_callback(callback_id)
+                callback_id = None
+
+        def forward_update():
+            global update_rate
+            update_rate *= 2
+
+        def backward_update():
+            global update_rate
+            update_rate /= 2
+
+        button.on_click(animate)
+        forward_button.on_click(forward_update)
+        backward_button.on_click(backward_update)
+
+        def select_event(attr, old, new):
+            selectionRowIndex = sources_events.selected.indices[0]
+            freq.value = first + int(np.abs(playback.times[first:last] - sources_events.data['Start Time [s]'][selectionRowIndex]).argmin())
+
+        sources_events.selected.on_change('indices', select_event)
 
     inputs = gridplot([[row(norm_plot_home, norm_plot_away)], [plot], [data_table],
                        [row([backward_button, button, forward_button, freq])]], merge_tools=False)
 
+    if client_side:
+        show(row(inputs, width=800))
+        return inputs
+
     def modify_doc(doc):
         doc.add_root(row(inputs, width=800))
 
@@ -1035,112 +1281,51 @@ def plot_sliding_window_spinner(match_object,
                               step=0.4)
 
     # Set up data
-    home_df = time_window(tracking_home,
-                          home_time_window.value[0],
-                          home_time_window.value[1])
-    away_df = time_window(tracking_away,
-                          away_time_window.value[0],
-                          away_time_window.value[1])
-    events_df = time_window(events,
-                            away_time_window.value[0],
-                            away_time_window.value[1])
+    home_windows = TimeWindows(tracking_home)
+    away_windows = TimeWindows(tracking_away)
+    events_windows = TimeWindows(events)
+    home_passes = PassIndex(events, 'Home')
+    away_passes = PassIndex(events, 'Away')
+    home_moments = MomentIndex(tracking_home)
+    away_moments = MomentIndex(tracking_away)
+    home_cube = HistogramCube(tracking_home, normalised=isinstance(normalized, str))
+    away_cube = HistogramCube(tracking_away, normalised=isinstance(normalized, str))
+    home_df = home_windows(home_time_window.value[0], home_time_window.value[1])
+    away_df = away_windows(away_time_window.value[0], away_time_window.value[1])
+    events_df = events_windows(away_time_window.value[0], away_time_window.value[1])
     if isinstance(normalized, str):
-        ball_dist_stats = bivariate_normal_distribution(home_df, ball=True)
+        ball_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], ball=True)
         if normalized == 'Home':
-            home_x, home_y = histogram(home_df, match_object.home_players, density=True, normalised=True)
-            away_x, away_y = histogram(home_df, match_object.away_players, density=True, normalised=True)
-            home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players)
-            away_dist_stats = bivariate_normal_distribution(home_df, match_object.away_players, against=True)
+            home_x, home_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+            away_x, away_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.away_players)
+            home_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+            away_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.away_players, against=True)
         elif normalized == 'Away':
-            home_x, home_y = histogram(away_df, match_object.home_players, density=True, normalised=True)
-            away_x, away_y = histogram(away_df, match_object.away_players, density=True, normalised=True)
-            away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players)
-            home_dist_stats = bivariate_normal_distribution(away_df, match_object.home_players, against=True)
+            home_x, home_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.home_players)
+            away_x, away_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            away_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            home_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.home_players, against=True)
         elif normalized == 'Both':
-            home_x, home_y = histogram(home_df, match_object.home_players, density=True, normalised=True)
-            away_x, away_y = histogram(away_df, match_object.away_players, density=True, normalised=True)
-            away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players)
-            home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players)
+            home_x, home_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+            away_x, away_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            away_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+            home_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
         norm_key = 'norm'
         norm_key_angle = 'norm_'
     else:
-        ball_dist_stats = bivariate_normal_distribution(home_df, ball=True)
-        home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players)
-        away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players)
-        home_x, home_y = histogram(home_df, match_object.home_players, density=True)
-        away_x, away_y = histogram(away_df, match_object.away_players, density=True)
+        ball_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], ball=True)
+        home_dist_stats = home_moments.stats(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+        away_dist_stats = away_moments.stats(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
+        home_x, home_y = home_cube.histogram(home_time_window.value[0], home_time_window.value[1], match_object.home_players)
+        away_x, away_y = away_cube.histogram(away_time_window.value[0], away_time_window.value[1], match_object.away_players)
         norm_key = ''
         norm_key_angle = ''
     if pass_graph:
-        passes_home = events_df[
-            (events_df['Type'] == 'PASS') & (events_df["From"].str.split("_").str[0] == "Home")].groupby(['From',
-                                                                                                          'To',
-                                                                                                          'Start Time [s]',
-                                                                                                          'End Time [s]',
-                                                                                                          'Start X',
-                                                                                                          'Start Y',
-                                                                                                          'End X',
-                                                                                                          'End Y']).size().reset_index(
-            name="Freq")
-        passes_home = passes_home.groupby(['From', 'To']).sum().reset_index()
-        passes_home = passes_home.apply(lambda x: x / passes_home['Freq'] if x.name in ['Start Time [s]',
-                                                                                        'End Time [s]',
-                                                                                        'Start X',
-                                                                                        'End X',
-                                                                                        'Start Y',
-                                                                                        'End Y',
-                                                                                        ] else x)
-        passes_home['Alpha'] = passes_home['Freq'] / passes_home['Freq'].max()
+        passes_home = pass_network(home_passes, home_time_window.value[0], home_time_window.value[1], home_dist_stats, norm_key)
         max_passes_home = passes_home['Freq'].max()
-
-        passes_home["Start X mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                       player in
-                                       passes_home['From']]
-        passes_home["Start Y mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                       player in
-                                       passes_home['From']]
-        passes_home["End X mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                     player in
-                                     passes_home['To']]
-        passes_home["End Y mean"] = [home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                     player in
-                                     passes_home['To']]
-
-        passes_away = events_df[
-            (events_df['Type'] == 'PASS') & (events_df["From"].str.split("_").str[0] == "Away")].groupby(['From',
-                                                                                                          'To',
-                                                                                                          'Start Time [s]',
-                                                                                                          'End Time [s]',
-                                                                                                          'Start X',
-                                                                                                          'Start Y',
-                                                                                                          'End X',
-                                                                                                          'End Y']).size().reset_index(
-            name="Freq")
-        passes_away = passes_away.groupby(['From', 'To']).sum().reset_index()
-        passes_away = passes_away.apply(lambda x: x / passes_away['Freq'] if x.name in ['Start Time [s]',
-                                                                                        'End Time [s]',
-                                                                                        'Start X',
-                                                                                        'End X',
-                                                                                        'Start Y',
-                                                                                        'End Y',
-                                                                                        ] else x)
-
-        passes_away['Alpha'] = passes_away['Freq'] / passes_away['Freq'].max()
+        passes_away = pass_network(away_passes, away_time_window.value[0], away_time_window.value[1], away_dist_stats, norm_key)
         max_passes_away = passes_away['Freq'].max()
 
-        passes_away["Start X mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                       player in
-                                       passes_away['From']]
-        passes_away["Start Y mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                       player in
-                                       passes_away['From']]
-        passes_away["End X mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                                     player in
-                                     passes_away['To']]
-        passes_away["End Y mean"] = [away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                                     player in
-                                     passes_away['To']]
-
         max_passes = max(max_passes_home, max_passes_away)
 
         passes_home['Line_Width'] = 15 * passes_home['Freq'] / max_passes
@@ -1173,11 +1358,19 @@ def plot_sliding_window_spinner(match_object,
             color=match_object.away_color, line_color=match_object.away_color, alpha=0.5)
 
     sources_home = ColumnDataSource(data=home_dist_stats.to_dict('series'))
-    sources_home_inst = ColumnDataSource(data=dict(x=[], y=[]))
     sources_ball = ColumnDataSource(data=ball_dist_stats.to_dict('series'))
     sources_ball_inst = ColumnDataSource(data=dict(x=[], y=[]))
+    ball_inst = WindowSource(sources_ball_inst, home_windows, dict(x=f"ball_{norm_key}x", y=f"ball_{norm_key}y"))
     sources_away = ColumnDataSource(data=away_dist_stats.to_dict('series'))
-    sources_away_inst = ColumnDataSource(data=dict(x=[], y=[]))
+    # trajectories of the selected players, in the tracking data their distribution statistics are computed on
+    home_inst = {player: WindowSource(ColumnDataSource(data=dict(x=[], y=[])),
+                                      away_windows if normalized == 'Away' else home_windows,
+                                      dict(x=f"{player}_{norm_key}x", y=f"{player}_{norm_key}y"))
+                 for player in home_dist_stats['player'].astype(str)}
+    away_inst = {player: WindowSource(ColumnDataSource(data=dict(x=[], y=[])),
+                                      home_windows if normalized == 'Home' else away_windows,
+                                      dict(x=f"{player}_{norm_key}x", y=f"{player}_{norm_key}y"))
+                 for player in away_dist_stats['player'].astype(str)}
 
     renderer1 = plot.circle(f'{norm_key}x_mean', f'{norm_key}y_mean', source=sources_away, alpha=0.5, size=15,
                             color=match_object.away_color)
@@ -1208,8 +1401,10 @@ def plot_sliding_window_spinner(match_object,
         plot.add_layout(cm_distance_label)
     taptool.renderers = [renderer1, renderer2, renderer3, renderer4, renderer5]
 
-    plot.multi_line('x', 'y', source=sources_home_inst, color=match_object.home_color)
-    plot.multi_line('x', 'y', source=sources_away_inst, color=match_object.away_color)
+    for inst in home_inst.values():
+        plot.line('x', 'y', source=inst.source, color=match_object.home_color)
+    for inst in away_inst.values():
+        plot.line('x', 'y', source=inst.source, color=match_object.away_color)
     plot.line('x', 'y', source=sources_ball_inst, color='black')
 
     labels_home = LabelSet(x=f'{norm_key}x_mean', y=f'{norm_key}y_mean', text='player_number',
@@ -1259,191 +1454,40 @@ def plot_sliding_window_spinner(match_object,
 
         plot.add_layout(scoreboard)
 
-    def update_data_home(attrname, old, new):
-        # Get the current slider values
-        c = home_time_window
-        flag = False
-        if isinstance(normalized, str):
-            flag = True
-            if normalized == 'Home' or normalized == 'Both':
-                home_df = time_window(tracking_home, c.value[0], c.value[0] + window_size.value)
-            elif normalized == 'Away':
-                home_df = time_window(tracking_away, c.value[0], c.value[0] + window_size.value)
-        else:
-            home_df = time_window(tracking_home, c.value[0], c.value[0] + window_size.value)
-
-        home_events_df = time_window(events, c.value[0], c.value[0] + window_size.value)
-
-        home_dist_stats = bivariate_normal_distribution(home_df, match_object.home_players, against=flag)
-        if pass_graph:
-            if pass_network_home_renderer.visible:
-                passes_home = home_events_df[
-                    (home_events_df['Type'] == 'PASS') & (
-                            home_events_df["From"].str.split("_").str[0] == "Home")].groupby(['From',
-                                                                                              'To',
-                                                                                              'Start Time [s]',
-                                                                                              'End Time [s]',
-                                                                                              'Start X',
-                                                                                              'Start Y',
-                                                                                              'End X',
-                                                                                              'End Y']).size().reset_index(
-                    name="Freq")
-                passes_home = passes_home.groupby(['From', 'To']).sum().reset_index()
-                passes_home = passes_home.apply(lambda x: x / passes_home['Freq'] if x.name in ['Start Time [s]',
-                                                                                                'End Time [s]',
-                                                                                                'Start X',
-                                                                                                'End X',
-                                                                                                'Start Y',
-                                                                                                'End Y',
-                                                                                                ] else x)
-
-                passes_home['Alpha'] = passes_home['Freq'] / passes_home['Freq'].max()
-                passes_home['Line_Width'] = 15 * passes_home['Freq'] / max_passes
-
-                passes_home["Start X mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_home['From']]
-                passes_home["Start Y mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_home['From']]
-                passes_home["End X mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_home['To']]
-                passes_home["End Y mean"] = [
-                    home_dist_stats.loc[home_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_home['To']]
-                sources_home_passes.data = passes_home
-
-        sources_home.data = home_dist_stats.to_dict(
-            'series')
-        if len(sources_home.selected.indices) >= 1:
-            x = []
-            y = []
-            players = []
-            for indice in sources_home.selected.indices:
-                player = str(sources_home.data['player'][indice])
-                x.append(home_df[f"{player}_{norm_key}x"])
-                y.append(home_df[f"{player}_{norm_key}y"])
-                players.append(player)
-            sources_home_inst.data = dict(x=x, y=y)
-            source_home_hist_x.data, source_home_hist_y.data = histogram(home_df, players, density=True,
-                                                                         normalised=flag)
-        else:
-            sources_home_inst.data = dict(x=[], y=[])
-            source_home_hist_x.data, source_home_hist_y.data = histogram(home_df, match_object.home_players,
-                                                                         density=True, normalised=flag)
-
-    def update_data_away(attrname, old, new):
-        # Get the current slider values
-        c = away_time_window
-        flag = False
-        if isinstance(normalized, str):
-            flag = True
-            if normalized == 'Away' or normalized == 'Both':
-                away_df = time_window(tracking_away, c.value[0], c.value[0] + window_size.value)
-            elif normalized == 'Home':
-                away_df = time_window(tracking_home, c.value[0], c.value[0] + window_size.value)
-        else:
-            away_df = time_window(tracking_away, c.value[0], c.value[0] + window_size.value)
-
-        away_events_df = time_window(events, c.value[0], c.value[0] + window_size.value)
-
-        away_dist_stats = bivariate_normal_distribution(away_df, match_object.away_players, against=flag)
-        if pass_graph:
-            if pass_network_away_renderer.visible:
-                passes_away = away_events_df[
-                    (away_events_df['Type'] == 'PASS') & (
-                            away_events_df["From"].str.split("_").str[0] == "Away")].groupby(
-                    ['From',
-                     'To',
-                     'Start Time [s]',
-                     'End Time [s]',
-                     'Start X',
-                     'Start Y',
-                     'End X',
-                     'End Y']).size().reset_index(
-                    name="Freq")
-                passes_away = passes_away.groupby(['From', 'To']).sum().reset_index()
-                passes_away = passes_away.apply(lambda x: x / passes_away['Freq'] if x.name in ['Start Time [s]',
-                                                                                                'End Time [s]',
-                                                                                                'Start X',
-                                                                                                'End X',
-                                                                                                'Start Y',
-                                                                                                'End Y',
-                                                                                                ] else x)
-                passes_away['Alpha'] = passes_away['Freq'] / passes_away['Freq'].max()
-                passes_away['Line_Width'] = 15 * passes_away['Freq'] / max_passes
-
-                passes_away["Start X mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_away['From']]
-                passes_away["Start Y mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_away['From']]
-                passes_away["End X mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}x_mean'] for
-                    player in
-                    passes_away['To']]
-                passes_away["End Y mean"] = [
-                    away_dist_stats.loc[away_dist_stats['player'] == player, f'{norm_key}y_mean'] for
-                    player in
-                    passes_away['To']]
-                sources_away_passes.data = passes_away
-
-        sources_away.data = away_dist_stats.to_dict(
-            'series')
-        if len(sources_away.selected.indices) >= 1:
-            x = []
-            y = []
-            players = []
-            for indice in sources_away.selected.indices:
-                player = str(sources_away.data['player'][indice])
-                x.append(away_df[f"{player}_{norm_key}x"])
-                y.append(away_df[f"{player}_{norm_key}y"])
-                players.append(player)
-            sources_away_inst.data = dict(x=x, y=y)
-            source_away_hist_x.data, source_away_hist_y.data = histogram(away_df, players, density=True,
-                                                                         normalised=flag)
-        else:
-            sources_away_inst.data = dict(x=[], y=[])
-            source_away_hist_x.data, source_away_hist_y.data = histogram(away_df, match_object.away_players,
-                                                                         density=True, normalised=flag)
-
-    def update_data_ball(attrname, old, new):
-        # Get the current slider values
+    # Recompute in a worker thread, keeping only the latest slider value while dragging
+    against = isinstance(normalized, str)
+    update_data_home = team_update(lambda: (home_time_window.value[0], home_time_window.value[0] + window_size.value),
+                                   match_object.home_players,
+                                   away_moments if normalized == 'Away' else home_moments,
+                                   away_cube if normalized == 'Away' else home_cube,
+                                   against,
+                                   dict(stats=sources_home, hist_x=source_home_hist_x, hist_y=source_home_hist_y),
+                                   home_inst,
+                                   (home_passes, sources_home_passes, pass_network_home_renderer, max_passes)
+                                   if pass_graph else None,
+                                   norm_key)
+    update_data_away = team_update(lambda: (away_time_window.value[0], away_time_window.value[0] + window_size.value),
+                                   match_object.away_players,
+                                   home_moments if normalized == 'Home' else away_moments,
+                                   home_cube if normalized == 'Home' else away_cube,
+                                   against,
+                                   dict(stats=sources_away, hist_x=source_away_hist_x, hist_y=source_away_hist_y),
+                                   away_inst,
+                                   (away_passes, sources_away_passes, pass_network_away_renderer, max_passes)
+                                   if pass_graph else None,
+                                   norm_key)
+
+    def ball_window():
+        # the team sliders follow the ball slider
         c = ball_time_window
         home_time_window.value = [c.value, c.value + window_size.value]
         away_time_window.value = [c.value, c.value + window_size.value]
-        home_df = time_window(tracking_home, c.value, c.value + window_size.value)
-        away_df = time_window(tracking_away, c.value, c.value + window_size.value)
-        events_df = time_window(events, c.value, c.value + window_size.value)
-        sources_ball.data = bivariate_normal_distribution(home_df, ball=True).to_dict('series')
-        if len(sources_ball.selected.indices) == 1:
-            sources_ball_inst.data = dict(x=home_df[f"ball_{norm_key}x"],
-                                          y=home_df[f"ball_{norm_key}y"])
-        else:
-            sources_ball_inst.data = dict(x=[], y=[])
-        if center_of_mass & (not normalized):
-            cm_df = pd.concat([home_df[["team_meanx", "team_meany"]].agg(['mean']),
-                               away_df[["team_meanx", "team_meany"]].agg(['mean'])])
-            cm_series = np.sqrt((np.sqrt((away_df[["team_meanx", "team_meany"]]
-                                          - home_df[["team_meanx", "team_meany"]]) ** 2) ** 2).sum(axis=1))
-            cm_distance = cm_series.mean()
-            std_distance = cm_series.std()
-            cm_distance_label.text = f'd = ({cm_distance:.2f} ± {std_distance:.2f})m'
-            cm_source.data = cm_df.to_dict("series")
-        if scoreboard:
-            away_goals = events_df[
-                    (events_df["Subtype"] == "ON TARGET-GOAL") & (events_df["Team"] == "Away")].shape[0]
-            home_goals = events_df[
-                (events_df["Subtype"] == "ON TARGET-GOAL") & (events_df["Team"] == "Home")].shape[0]
-            scoreboard.text = f'{home_goals}:{away_goals}'
+        return c.value, c.value + window_size.value
+
+    update_data_ball = ball_update(ball_window, home_moments, home_windows, away_windows, events_windows,
+                                   sources_ball, ball_inst,
+                                   (cm_source, cm_distance_label) if center_of_mass & (not normalized) else None,
+                                   scoreboard if scoreboard else None)
 
     def update_checkbox(attrname, old, new):
         pass_network_home_renderer.visible = (0 in checkbox_group.active)
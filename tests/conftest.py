@@ -0,0 +1,75 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO, 'source'))
+
+# Frames of each half of the synthetic match and the first frame of the second half in the sample events
+HALF_FRAMES = 3000
+SECOND_HALF_FRAME = 72135
+
+
+def write_metrica_game(directory, game=1, seed=0):
+    """
+    Writes a short synthetic Metrica Sports game in directory: random walks for 14 players per team (3 substitutions)
+    and the ball, HALF_FRAMES frames per half, and the sample events of those frames.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    n_frames = 2 * HALF_FRAMES
+    frames = np.arange(1, n_frames + 1)
+    period = np.where(frames <= HALF_FRAMES, 1, 2)
+    for team, jerseys, side in [('Home', [11] + list(range(1, 11)) + [12, 13, 14], 0.05),
+                                ('Away', [25] + list(range(15, 25)) + [26, 27, 28], 0.95)]:
+        columns = []
+        for position, jersey in enumerate(jerseys):
+            start = np.array([side if position == 0 else rng.uniform(0.2, 0.8), rng.uniform(0.1, 0.9)])
+            xy = np.clip(start + np.cumsum(rng.normal(0, 0.0002, size=(n_frames, 2)), axis=0), 0.01, 0.99)
+            if position == 0:
+                xy[HALF_FRAMES:, 0] = 1 - xy[HALF_FRAMES:, 0]
+            if position >= 11:
+                xy[:HALF_FRAMES + 500 * (position - 10)] = np.nan
+            elif position >= 8:
+                xy[HALF_FRAMES + 500 * (position - 7):] = np.nan
+            columns.append(xy)
+        ball = np.clip(0.5 + np.cumsum(rng.normal(0, 0.0002, size=(n_frames, 2)), axis=0), 0, 1)
+        ball[rng.random(n_frames) < 0.02] = np.nan
+        values = np.column_stack([period, frames, frames * 0.04] + columns + [ball])
+        with open(os.path.join(directory, f'Sample_Game_{game}_RawTrackingData_{team}_Team.csv'), 'w') as file:
+            file.write(',,,' + ','.join(f'{team},' for _ in jerseys) + ',\n')
+            file.write(',,,' + ','.join(f'{jersey},' for jersey in jerseys) + ',\n')
+            file.write('Period,Frame,Time [s],' + ','.join(f'Player{jersey},' for jersey in jerseys) + ',Ball,\n')
+            np.savetxt(file, values, fmt=['%d', '%d', '%.2f'] + ['%.5f'] * (values.shape[1] - 3), delimiter=',')
+
+    events = pd.read_csv(os.path.join(REPO, 'data', 'MetricaSportsSampleData', 'data', f'Sample_Game_{game}',
+                                      f'Sample_Game_{game}_RawEventsData.csv'))
+    # second half events moved right after the first half
+    shift = np.where(events['Period'] == 2, SECOND_HALF_FRAME - HALF_FRAMES - 1, 0)
+    for column in ['Start Frame', 'End Frame']:
+        events[column] = np.where(events[column] > 0, events[column] - shift, events[column])
+    for column in ['Start Time [s]', 'End Time [s]']:
+        events[column] = np.where(events[column] > 0, (events[column] - shift * 0.04).round(2), events[column])
+    events = events[(events['Start Frame'] <= n_frames) & (events['End Frame'] <= n_frames)
+                    & ((events['Period'] == 1) == (events['Start Frame'] <= HALF_FRAMES))]
+    events.to_csv(os.path.join(directory, f'Sample_Game_{game}_RawEventsData.csv'), index=False)
+
+
+@pytest.fixture(scope='session')
+def metrica_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp('metrica')
+    write_metrica_game(os.path.join(root, 'data', 'MetricaSportsSampleData', 'data', 'Sample_Game_1'))
+    os.makedirs(os.path.join(root, 'run'))
+    return root
+
+
+@pytest.fixture
+def metrica(metrica_root, monkeypatch):
+    """
+    Runs the test from a directory where Match finds the synthetic game as metrica-sports match 1.
+    """
+    monkeypatch.chdir(os.path.join(metrica_root, 'run'))
+    return metrica_root
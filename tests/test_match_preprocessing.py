@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Match_Analytics import Match, PREPROCESSING_STAGES
+
+
+@pytest.fixture
+def preprocessed(metrica):
+    return Match('metrica-sports', match_id=1, verbose=False)
+
+
+def assert_same_match(match, expected):
+    assert match.preprocessed
+    assert match.tracking.layouts == expected.tracking.layouts
+    assert np.array_equal(match.tracking.data, expected.tracking.data, equal_nan=True)
+    pd.testing.assert_frame_equal(match.tracking_home, expected.tracking_home)
+    pd.testing.assert_frame_equal(match.tracking_away, expected.tracking_away)
+    pd.testing.assert_frame_equal(match.events, expected.events)
+    pd.testing.assert_frame_equal(match.ranges, expected.ranges)
+
+
+@pytest.mark.parametrize('stage', PREPROCESSING_STAGES[:-1])
+def test_staged_preprocessing_matches_one_shot(preprocessed, stage):
+    match = Match('metrica-sports', match_id=1, verbose=False, preprocess=stage)
+    match.tracking_home
+    assert match.stage == stage
+    match.preprocess()
+    assert_same_match(match, preprocessed)
+
+
+@pytest.mark.parametrize('stage', PREPROCESSING_STAGES[1:-1])
+def test_packing_partial_stages_keeps_float64_values(preprocessed, stage):
+    match = Match('metrica-sports', match_id=1, verbose=False, preprocess=stage)
+    tracking = match.tracking
+    assert match.stage == stage
+    assert match.tracking is tracking
+    match.preprocess()
+    assert_same_match(match, preprocessed)
+
+
+def test_partial_stages_are_not_packed(metrica):
+    match = Match('metrica-sports', match_id=1, verbose=False, preprocess='velocities')
+    assert match._tracking is None
+    assert match.tracking_home['Home_1_vx'].dtype == np.float64
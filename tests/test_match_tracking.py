@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from Match_Analytics import Match
+
+
+def edit_loc(match):
+    match.tracking_home.loc[match.tracking_home.index[:5], 'Home_1_x'] = 0
+
+
+def edit_iloc(match):
+    match.tracking_home.iloc[0:5, match.tracking_home.columns.get_loc('Home_1_x')] = 0
+
+
+def edit_operator(match):
+    tracking = match.tracking_home
+    tracking['Home_1_x'] *= 0
+
+
+def edit_series(match):
+    series = match.tracking_home['Home_1_x']
+    series.iloc[0:5] = 0
+
+
+@pytest.fixture
+def match(metrica):
+    return Match('metrica-sports', match_id=1, verbose=False)
+
+
+@pytest.mark.parametrize('edit', [edit_loc, edit_iloc, edit_operator, edit_series])
+def test_edits_in_place_reach_the_tensor(match, edit):
+    match.tracking
+    edit(match)
+    assert np.array_equal(match.tracking.get('Home_1', 'x', view='Home')[:5, 0], np.zeros(5))
+    assert np.array_equal(match.tracking_home['Home_1_x'].to_numpy()[:5], np.zeros(5))
+
+
+def test_fillna_in_place_reaches_the_tensor(match):
+    assert np.isnan(match.tracking.get('ball', 'x', view='Home')).any()
+    match.tracking_home.fillna(0, inplace=True)
+    assert not np.isnan(match.tracking.get('Home', ['x', 'y'], view='Home')).any()
+    assert not np.isnan(match.tracking.get('ball', 'x', view='Home')).any()
+
+
+def test_edits_reset_the_accessors(match):
+    query = match.query()
+    first_half = query.period(1).indices
+    match.tracking_home.loc[:, 'Period'] = 1
+    assert match.query() is not query
+    assert len(match.query().period(1).indices) > len(first_half)
+
+
+def test_reading_keeps_the_tensor(match):
+    tracking = match.tracking
+    query = match.query()
+    match.tracking_home['Home_1_x'].sum()
+    match.tracking_away.describe()
+    assert match.tracking is tracking
+    assert match.query() is query
+
+
+def test_dataframes_are_kept(match):
+    assert match.tracking_home is match.tracking_home
+    match.tracking_home = match.tracking_home.copy()
+    assert match.tracking_home is match.tracking_home
+
+
+def test_cached_match_keeps_the_tensor(metrica, tmp_path):
+    Match('metrica-sports', match_id=1, verbose=False, cache_dir=str(tmp_path))
+    match = Match('metrica-sports', match_id=1, verbose=False, cache_dir=str(tmp_path))
+    tracking = match.tracking
+    match.tracking_home
+    assert match.tracking is tracking
+    edit_loc(match)
+    assert match.tracking is not tracking
+    assert np.array_equal(match.tracking.get('Home_1', 'x', view='Home')[:5, 0], np.zeros(5))
+
+
+def test_preprocessing_resumes_on_packed_tracking(metrica):
+    match = Match('metrica-sports', match_id=1, verbose=False, preprocess='metric')
+    match.tracking
+    match.preprocess()
+    assert match.preprocessed
+    assert 'Home_1_vx' in match.tracking_home.columns